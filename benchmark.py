@@ -0,0 +1,250 @@
+''' Benchmarks for the game's engines and simulation. Every scenario is seeded so that runs are repeatable, and the
+results can be written out as JSON to track performance across commits:
+
+    python benchmark.py --json --output bench.json
+    python benchmark.py --scenarios economy,dijmap
+
+The world-based scenarios run without a window (see headless.py) '''
+from __future__ import division
+import argparse
+from collections import OrderedDict
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+import config as g
+from map_base import Map
+from dijkstra import DIJMAP_ENGINES
+import headless
+import economy
+import goap
+import rng
+
+
+class BenchTile:
+    ''' Stand-in for a map tile - the Dijmap engines only look at blocks_mov '''
+    __slots__ = ('blocks_mov',)
+
+    def __init__(self, blocks_mov):
+        self.blocks_mov = blocks_mov
+
+
+def make_bench_map(width, height, wall_chance, seed):
+    ''' A map of the given size with randomly scattered walls and a solid border '''
+    rand = random.Random(seed)
+    bmap = Map(width, height)
+    bmap.tiles = [[BenchTile(blocks_mov=not (0 < x < width - 1 and 0 < y < height - 1) or rand.random() < wall_chance)
+                   for y in xrange(height)] for x in xrange(width)]
+    return bmap
+
+
+def time_call(func, repetitions):
+    ''' Return the average number of seconds func() takes '''
+    begin = time.time()
+    for i in xrange(repetitions):
+        func()
+    return (time.time() - begin) / repetitions
+
+
+def move_targets(target_nodes, num_moved, width, height, rand):
+    ''' A copy of target_nodes with a few of them stepped one tile in a random direction, like creatures over a tick '''
+    target_nodes = target_nodes[:]
+    for i in rand.sample(xrange(len(target_nodes)), min(num_moved, len(target_nodes))):
+        x, y = target_nodes[i]
+        target_nodes[i] = (min(max(x + rand.randint(-1, 1), 1), width - 2), min(max(y + rand.randint(-1, 1), 1), height - 2))
+    return target_nodes
+
+
+def bench_dijmap_engines(width=g.CITY_MAP_WIDTH, height=g.CITY_MAP_HEIGHT, num_targets=40, num_moved=4, dmrange=g.DIJMAP_CREATURE_DISTANCE,
+                         wall_chance=.2, repetitions=5, seed=1):
+    ''' Time Dijmap.update_map for each engine as num_moved of the targets move between calls, plus a full rebuild for
+    engines which can repair their field. Make sure every engine ends up agreeing with the python engine '''
+    bmap = make_bench_map(width=width, height=height, wall_chance=wall_chance, seed=seed)
+    rand = random.Random(seed)
+    target_nodes = [(rand.randint(1, width - 2), rand.randint(1, height - 2)) for i in xrange(num_targets)]
+    # The same sequence of target moves is replayed for every engine
+    target_steps = []
+    for i in xrange(repetitions):
+        target_steps.append(move_targets(target_steps[-1] if target_steps else target_nodes, num_moved, width, height, rand))
+
+    results = {}
+    reference = None
+    for engine_name in sorted(DIJMAP_ENGINES, key=lambda name: name != 'python'):
+        dijmap = DIJMAP_ENGINES[engine_name](sourcemap=bmap, target_nodes=target_nodes, dmrange=dmrange)
+
+        steps = iter(target_steps)
+        results[engine_name] = {'seconds': time_call(lambda: dijmap.update_map(next(steps)), repetitions)}
+
+        values = [[dijmap.get_value(x, y) for y in xrange(height)] for x in xrange(width)]
+        if reference is None:
+            reference = values
+        results[engine_name]['matches_python'] = values == reference
+
+        # update_map on the python engine is always a full rebuild
+        if hasattr(dijmap, 'rebuild_map'):
+            targets = set(dijmap.targets)
+            results[engine_name]['rebuild_seconds'] = time_call(lambda: dijmap.rebuild_map(targets), repetitions)
+
+    return results
+
+
+def bench_dijmap(seed=1):
+    ''' bench_dijmap_engines at the creature dijmap range, and at a range large enough to flood the whole map '''
+    return OrderedDict(('dmrange {0}'.format(dmrange), bench_dijmap_engines(dmrange=dmrange, seed=seed))
+                       for dmrange in (g.DIJMAP_CREATURE_DISTANCE, 5000))
+
+
+def bench_world_generation(sizes=((120, 110), (g.WORLD_WIDTH, g.WORLD_HEIGHT), (360, 330)), seed=1):
+    ''' Time World.generate (and setting up the civilizations) at several map sizes '''
+    results = OrderedDict()
+    for width, height in sizes:
+        headless.start_game(seed=seed)
+        timings = OrderedDict()
+        world = headless.generate_world(width=width, height=height, timings=timings)
+        results['{0}x{1}'.format(width, height)] = {'generate_map_seconds': timings['generate_map'],
+                                                    'setup_civilizations_seconds': timings['setup_civilizations'],
+                                                    'cities': len(world.cities)}
+    return results
+
+
+def bench_history(years=5, width=g.WORLD_WIDTH, height=g.WORLD_HEIGHT, seed=1, fast_forward=None):
+    ''' Time running history on a freshly generated world '''
+    headless.start_game(seed=seed)
+    world = headless.generate_world(width=width, height=height, timings={})
+
+    days = years * world.time_cycle.days_per_year
+    seconds = world.run_days(days=days, fast_forward=fast_forward)
+
+    return {'years': years, 'seconds': seconds, 'years_per_second': years / max(seconds, .001),
+            'figures': len(world.all_figures), 'historical_events': len(headless.hist.historical_events)}
+
+
+def bench_economy(scales=(1, 2, 4), rounds=20, seed=1):
+    ''' Time Economy.run_simulation on the standalone test economy, with increasing numbers of agents '''
+    headless.start_game(seed=seed)
+
+    results = OrderedDict()
+    for scale in scales:
+        rng.seed_all(seed)
+        test_economy = economy.make_test_economy(scale=scale)
+        results['scale {0}'.format(scale)] = {'agents': len(test_economy.agents),
+                                              'seconds': time_call(test_economy.run_simulation, rounds)}
+    return results
+
+
+def bench_goap(num_figures=20, weeks_of_history=4, width=g.WORLD_WIDTH, height=g.WORLD_HEIGHT, seed=1):
+    ''' Time goap.find_best_behavior_path for a sample of a world's important figures, using the goals that
+    world brains pick when idle '''
+    headless.start_game(seed=seed)
+    world = headless.generate_world(width=width, height=height, timings={})
+    world.run_history(weeks=weeks_of_history)
+
+    rand = random.Random(seed)
+    candidates = [figure for figure in world.important_figures if figure.world_brain and figure.creature.is_available_to_act()]
+    figures = rand.sample(candidates, min(num_figures, len(candidates)))
+
+    calls = 0
+    paths = 0
+    begin = time.time()
+    for figure in figures:
+        cost_multipliers = figure.world_brain.get_cost_multipliers()
+        for goal_state in (goap.HaveShelter(entity=figure), goap.HaveItem(item_name='shirt', entity=figure)):
+            best_path, best_cost = goap.find_best_behavior_path(goal_state=goal_state, entity=figure, cost_multipliers=cost_multipliers)
+            paths += best_path is not None
+            calls += 1
+    seconds = time.time() - begin
+
+    return {'figures': len(figures), 'calls': calls, 'paths_found': paths,
+            'seconds': seconds, 'seconds_per_call': seconds / max(calls, 1)}
+
+
+def bench_battle_ticks(ticks=200, seed=1):
+    ''' Time TimeCycle.tick on the quick battle map '''
+    headless.start_game(seed=seed)
+    begin = time.time()
+    g.game.create_quick_battle()
+    setup_seconds = time.time() - begin
+
+    return {'setup_seconds': setup_seconds, 'creatures': len(g.M.creatures),
+            'seconds_per_tick': time_call(g.WORLD.time_cycle.tick, ticks)}
+
+
+SCENARIOS = OrderedDict([('dijmap', bench_dijmap),
+                         ('world_generation', bench_world_generation),
+                         ('history', bench_history),
+                         ('economy', bench_economy),
+                         ('goap', bench_goap),
+                         ('battle_ticks', bench_battle_ticks)])
+
+
+def get_commit():
+    ''' The git commit being benchmarked, if there is one '''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, seed=1):
+    ''' Run the named scenarios (all of them by default). Returns the results along with some info about the run.
+    A scenario which fails has its error recorded in its results, so the others still get run '''
+    results = OrderedDict()
+    results['commit'] = get_commit()
+    results['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    results['python'] = platform.python_version()
+    results['seed'] = seed
+    results['scenarios'] = OrderedDict()
+
+    for name in names or SCENARIOS:
+        begin = time.time()
+        try:
+            scenario_results = SCENARIOS[name](seed=seed)
+        except Exception as e:
+            scenario_results = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+        results['scenarios'][name] = OrderedDict([('results', scenario_results), ('total_seconds', time.time() - begin)])
+
+    return results
+
+
+def print_results(results, indent=0):
+    for name, value in results.iteritems():
+        if isinstance(value, dict):
+            print '{0}{1}:'.format('  ' * indent, name)
+            print_results(value, indent + 1)
+        elif isinstance(value, float):
+            print '{0}{1}: {2:.4f}'.format('  ' * indent, name, value)
+        else:
+            print '{0}{1}: {2}'.format('  ' * indent, name, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark scenarios')
+    parser.add_argument('--scenarios', default=None, help='comma separated scenarios to run, out of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--output', default=None, help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    names = args.scenarios.split(',') if args.scenarios else None
+    for name in names or ():
+        if name not in SCENARIOS:
+            parser.error('unknown scenario {0}'.format(name))
+
+    results = run_benchmarks(names=names, seed=args.seed)
+
+    if args.json:
+        print json.dumps(results, indent=2)
+    else:
+        print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
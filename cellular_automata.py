@@ -0,0 +1,130 @@
+''' Numpy version of Wmap.run_cellular_automata. Seeding is done for the whole map at once, and each smoothing pass
+counts walls with one array sum per row of the map instead of looking at every tile's neighbors one by one.
+
+The tile-by-tile version updates the map in place - a tile sees the new values of the tiles before it (the rows above,
+and the tile to its left) and the old values of the rest. To give the same walls for the same random rolls, rows are
+still swept in order. Within a row, the only thing a tile can't know up front is whether the tile to its left is now a
+wall; it either doesn't matter, or the tile simply copies whatever its left neighbor became, which is a forward fill.
+Only used if numpy is available (see config.VECTORIZED_CELLULAR_AUTOMATA) '''
+import time
+from random import randint as roll
+
+import config as g
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+
+def is_enabled():
+    return numpy_available and g.VECTORIZED_CELLULAR_AUTOMATA
+
+
+def grid_array(values, width, height):
+    ''' Writable array view (indexed [x, y]) over one of a TileGrid's flat arrays '''
+    dtype = values.typecode if hasattr(values, 'typecode') else np.uint8
+    return np.frombuffer(values, dtype=dtype).reshape(width, height)
+
+
+def get_changeable_mask(grid, width, height):
+    ''' Tiles the automata may change - untouched ground with no zone other than wilderness '''
+    can_change = np.ones(width * height, dtype=bool)
+    for index, zone in grid.zones.iteritems():
+        if zone not in (None, 'wilderness'):
+            can_change[index] = 0
+    # Surfaces are only stored for tiles which aren't 'ground'
+    can_change[grid.surfaces.keys()] = 0
+
+    return can_change.reshape(width, height)
+
+
+def seed_cells(blocks_mov, blocks_vis, heights, can_change, cfg):
+    ''' Randomly seed walls inside the map padding, and fill the padding with the padded cell type '''
+    width, height = heights.shape
+    xs = np.arange(width)[:, np.newaxis]
+    ys = np.arange(height)[np.newaxis, :]
+
+    pad = cfg['map_pad']
+    in_pad = (pad < xs) & (xs < width - 1 - pad) & (pad < ys) & (ys < height - 1 - pad)
+
+    # One roll per tile above water, in the same order as the tile-by-tile loop (x, then y)
+    rolled = in_pad & (heights > g.WATER_HEIGHT)
+    rolls = np.zeros((width, height), dtype=int)
+    rolls[rolled] = [roll(1, 1000) for i in xrange(np.count_nonzero(rolled))]
+
+    walls = rolled & ((rolls <= cfg['initial_blocks_mov_chance']) | (heights > cfg['blocks_mov_height'])) & can_change
+    floors = in_pad & can_change & ~walls
+    map_pad_type = 1 if cfg['map_pad_type'] else 0
+
+    for flags in (blocks_mov, blocks_vis):
+        flags[walls] = 1
+        flags[floors] = 0
+        flags[~in_pad] = map_pad_type
+
+
+def smooth_cells(blocks_mov, blocks_vis, can_change, cfg):
+    ''' One smoothing pass, giving the same result as the in-place loop in Wmap.run_cellular_automata '''
+    width, height = blocks_vis.shape
+    walls_to_floor, walls_to_wall = cfg['walls_to_floor'], cfg['walls_to_wall']
+
+    # Walls which get counted as neighbors, padded by a tile of floor on every side. Neighbors must pass
+    # Wmap.is_val_xy, so the x = 0 column and y = 0 row of the map never count
+    counted = np.zeros((width + 2, height + 2), dtype=np.int16)
+    counted[2:-1, 2:-1] = blocks_vis[1:, 1:]
+
+    # Neighbors which haven't been updated yet when a tile's turn comes - the tile to the right, and the row below
+    ahead = counted[2:, 1:-1] + counted[:-2, 2:] + counted[1:-1, 2:] + counted[2:, 2:]
+
+    columns = np.arange(width)
+    no_left = np.zeros(width, dtype=bool)
+
+    for y in xrange(height):
+        # The tile to the left is only counted if it's a valid tile
+        left_counts = (columns >= 2) if y > 0 else no_left
+        # Everything except the tile to the left - the row above has already been updated
+        base = ahead[:, y] + counted[:-2, y] + counted[1:-1, y] + counted[2:, y]
+        old = blocks_vis[:, y]
+        changeable = can_change[:, y]
+
+        # Outcome if the tile to the left is a floor, and if it's a wall
+        if_floor = np.where(base <= walls_to_floor, 0, np.where(base >= walls_to_wall, 1, old))
+        if_wall = np.where(base + 1 <= walls_to_floor, 0, np.where(base + 1 >= walls_to_wall, 1, old))
+        if_floor[~changeable] = old[~changeable]
+        if_wall[~changeable] = old[~changeable]
+
+        # Where the outcomes differ, the tile becomes whatever its left neighbor became - fill those in from the left
+        follows_left = (if_floor != if_wall) & left_counts
+        source = np.maximum.accumulate(np.where(follows_left, 0, columns))
+        new = if_floor[source]
+
+        # Tiles only change when a rule fires - blocks_mov is left alone otherwise
+        walls = base + np.where(left_counts, np.roll(new, 1), 0)
+        fired = changeable & ((walls <= walls_to_floor) | (walls >= walls_to_wall))
+        blocks_mov[fired, y] = new[fired]
+        blocks_vis[:, y] = new
+
+        if y > 0:
+            counted[2:-1, y + 1] = new[1:]
+
+
+def run_cellular_automata(wmap, cfg):
+    ''' Seed and smooth the wmap's walls. Returns the seconds spent seeding and smoothing '''
+    grid = wmap.tile_grid
+    width, height = wmap.width, wmap.height
+
+    blocks_mov = grid_array(grid.blocks_mov, width, height)
+    blocks_vis = grid_array(grid.blocks_vis, width, height)
+    heights = grid_array(grid.heights, width, height)
+    can_change = get_changeable_mask(grid, width, height)
+
+    begin = time.time()
+    seed_cells(blocks_mov=blocks_mov, blocks_vis=blocks_vis, heights=heights, can_change=can_change, cfg=cfg)
+    seed_time = time.time() - begin
+
+    begin = time.time()
+    for r in xrange(cfg['repetitions']):
+        smooth_cells(blocks_mov=blocks_mov, blocks_vis=blocks_vis, can_change=can_change, cfg=cfg)
+
+    return seed_time, time.time() - begin
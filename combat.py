@@ -3,13 +3,15 @@ from __future__ import division
 import csv
 import yaml
 import os
-import random
-from random import randint as roll
 
 from helpers import weighted_choice, determine_commander, ct, pl
 from history import HistoricalEvent
 import config as g
 import wmap
+import rng
+
+# Combat draws from its own stream (see rng.py)
+roll = rng.combat.randint
 
 
 def load_combat_data():
@@ -81,11 +83,10 @@ class CombatAttack:
 
 
 class WorldBattle(HistoricalEvent):
-    def __init__(self, date, location, faction1_named, faction1_populations, faction2_named, faction2_populations):
-        HistoricalEvent.__init__(self, date, location)
-
-        self.base_importance = 50
+    type_ = 'battle'
+    base_importance = 50
 
+    def __init__(self, date, location, faction1_named, faction1_populations, faction2_named, faction2_populations):
         self.faction1_named = faction1_named
         self.faction1_commander = determine_commander(faction1_named)
         self.faction1_populations = faction1_populations
@@ -94,7 +95,7 @@ class WorldBattle(HistoricalEvent):
         self.faction2_commander = determine_commander(faction2_named)
         self.faction2_populations = faction2_populations
 
-        self.type_ = 'battle'
+        HistoricalEvent.__init__(self, date, location)
 
         self.faction1_remaining = None
         self.faction2_remaining = None
@@ -145,7 +146,7 @@ class WorldBattle(HistoricalEvent):
             for entity in reversed(f1_in_combat):
                 if entity.creature.is_available_to_act():
                     if target_tracking_dict[entity] not in f2_in_combat and f2_in_combat:
-                        target = random.choice(f2_in_combat)
+                        target = rng.combat.choice(f2_in_combat)
                         target_tracking_dict[entity] = target
                         target_tracking_dict[target] = entity
 
@@ -159,7 +160,7 @@ class WorldBattle(HistoricalEvent):
             for entity in reversed(f2_in_combat):
                 if entity.creature.is_available_to_act():
                     if target_tracking_dict[entity] not in f1_in_combat and f1_in_combat:
-                        target = random.choice(f1_in_combat)
+                        target = rng.combat.choice(f1_in_combat)
                         target_tracking_dict[entity] = target
                         target_tracking_dict[target] = entity
 
@@ -59,6 +59,12 @@ MSG_HEIGHT = PANEL1_HEIGHT - 2
 #size of the WORLD
 WORLD_WIDTH = 240
 WORLD_HEIGHT = 220
+# Seed for generating new worlds and running their history (see rng.py) - None picks a new one each time
+WORLD_SEED = None
+# Where the world is saved to / loaded from (see snapshot.py)
+WORLD_SAVE_FILE = 'world.sav'
+# Memory-map a loaded world's tile data instead of reading it all in, so tiles are only read from disk when used (see snapshot.py)
+MAP_WORLD_SNAPSHOTS = 1
 
 #size of the battle map
 MAP_WIDTH = 250
@@ -68,17 +74,45 @@ CITY_MAP_WIDTH = 350
 CITY_MAP_HEIGHT = 350
 
 DIJMAP_CREATURE_DISTANCE = 10
+# Which dijkstra.py engine to build Dijmaps with - 'array' (flat buffer BFS) or 'python' (original node expansion)
+DIJMAP_ENGINE = 'array'
+
+# Generate the world's height/climate/biome info as whole-map numpy arrays (only if numpy is installed - see gen_world_arrays.py)
+VECTORIZED_WORLDGEN = 1
+# Run Wmap cellular automata (cave and terrain smoothing) on numpy arrays - same results, see cellular_automata.py
+VECTORIZED_CELLULAR_AUTOMATA = 1
 
 WATER_HEIGHT = 100
 MOUNTAIN_HEIGHT = 175
 
+# Size of the cells the world's figures and populations are bucketed into for lookups by position (see map_base.SpatialHash)
+SPATIAL_HASH_CELL_SIZE = 8
+
+# Historical events at least this important (base importance + the infamy of those involved) are shared when figures meet
+IMPORTANT_EVENT_IMPORTANCE = 50
+# Number of historical event objects the event store keeps around after rebuilding them from its columns
+HISTORY_EVENT_CACHE_SIZE = 1000
+
+# Most complete behavior paths the GOAP planner will weigh travel costs for, when goals can be reached many ways
+GOAP_MAX_CANDIDATE_PATHS = 64
+
 # Sites must be this far apart
 MIN_SITE_DIST = 5
 
 # There can be this much space between cities when starting an economy
 MAX_ECONOMY_DISTANCE = 25
+# How many per-origin world distance fields to keep cached (used for finding nearby resources)
+DISTANCE_FIELD_CACHE_SIZE = 500
+# How many floods from a particular set of cities to keep cached (used for finding the closest city that sells something)
+CITY_SUBSET_FLOOD_CACHE_SIZE = 20
+# How many world travel paths (origin, destination) to keep cached for figures' movement (see World.get_travel_path)
+TRAVEL_PATH_CACHE_SIZE = 2000
 # Total number of economy agents which can work a tile at once
 MAX_ECONOMY_AGENTS_PER_TILE = 10
+# Worker processes for running the cities' economies each week (see economy.run_economies) - 1 runs them one after
+# another in this process, 0 means one per core. With more than 1, each week forks that many workers, each running a
+# batch of the economies
+ECONOMY_PROCESSES = 1
 
 # If distance from one city to another is below this amount, a new road will be built
 NEW_ROAD_PATH_RATIO = .6
@@ -103,6 +137,21 @@ PAIN_BACK = libtcod.color_lerp(libtcod.dark_red, libtcod.black, .6)
 
 
 
+# Time each phase of the simulation loop (see profiler.py) - can also be switched on from the debug menu
+PROFILE_PHASES = 0
+# How many of each phase's most recent timings go into its rolling average
+PROFILE_ROLLING_WINDOW = 100
+# While profiling, append the phase stats to PROFILE_STATS_FILE every this many days
+PROFILE_DUMP_DAYS = 30
+PROFILE_STATS_FILE = 'phase_stats.jsonl'
+# Where a phase's cProfile stats are written when profiler.profile_next() is used
+PROFILE_CPROFILE_FILE = 'profile_{phase}.prof'
+
+# Whether World.run_history fast-forwards (muted messages, sleeping idle figures, batched encounters) by default
+FAST_FORWARD_HISTORY = 1
+# While fast-forwarding, random encounters in cities are run this many days' worth at a time
+HISTORY_ENCOUNTER_BATCH_DAYS = 7
+
 MIN_MARRIAGE_AGE = 16
 MAX_MARRIAGE_AGE = 50
 MIN_CHILDBEARING_AGE = 16
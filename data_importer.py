@@ -40,7 +40,7 @@ class FinishedGood(object):
         self.in_amt = in_amt
         self.out_amt = out_amt
 
-class Reaction:
+class Reaction(object):
     def __init__(self, verb, is_finished_good, input_commodity_name, input_amount, output_commodity_name, output_amount, commodities_consumed, commodities_required):
         self.verb = verb
 
@@ -58,7 +58,7 @@ class Reaction:
 
 ######## FOR PHYSICS ##########
 
-class Material:
+class Material(object):
     ''' Basic material instance '''
     def __init__(self, name, rgb_color, density, rigid, force_diffusion, slice_resistance):
         self.name = name
@@ -1,4 +1,20 @@
 ''' Code for dijkstra "maps" '''
+from array import array
+
+import config as g
+
+
+# Offsets of the 8 neighbors of a tile, in the order the node engine checks them
+NEIGHBOR_OFFSETS = ((-1, -1), (0, -1), (1, -1),
+                    (-1, 0),           (1, 0),
+                    (-1, 1),  (0, 1),  (1, 1))
+
+# Value stored in the array engine's buffer for tiles that were never reached
+UNREACHED = -1
+
+# bytearray.translate() table turning blocks_mov flags into passability flags
+INVERT_FLAGS = bytes(bytearray([1] + [0] * 255))
+
 
 class Node:
     # A node in a Dijkstra map.
@@ -34,7 +50,9 @@ class Node:
             self.owner.nodes.remove(self)
 
 
-class Dijmap:
+class NodeDijmap:
+    ''' The original pure-Python engine - each target expands its own Node one ring at a time.
+    Kept around as a reference implementation and as a fallback for the array engine '''
     def __init__(self, sourcemap, target_nodes, dmrange):
         self.sourcemap = sourcemap
         ## The represented map that we draw from
@@ -44,12 +62,20 @@ class Dijmap:
 
         self.nodes = []
         self.dmap = None
+        self.target_nodes = []
 
         # Automatically create a map on initializing
         self.update_map(target_nodes)
 
+    def get_value(self, x, y):
+        return self.dmap[x][y]
+
+    def refresh_passability(self):
+        ''' Nodes read blocks_mov as they expand, so just refill the map from the same targets '''
+        self.update_map(self.target_nodes)
 
     def update_map(self, target_nodes):
+        self.target_nodes = list(target_nodes)
         # Seed empty map - faster to copy off of empty_map than create a new one
         self.dmap = [row[:] for row in self.empty_map]
 
@@ -61,5 +87,208 @@ class Dijmap:
 
         ## Take the target nodes, and expand each of them until none of them mark a spot
         while self.nodes:
-            for node in self.nodes:
+            # Iterate over a copy - nodes remove themselves when finished, which would otherwise
+            # cause the next node in the list to skip its expansion for this ring
+            for node in self.nodes[:]:
                 node.expand()
+
+
+class DmapColumn:
+    ''' A single x column of an ArrayDijmap, so that dmap[x][y] lookups keep working '''
+    __slots__ = ('buf', 'offset')
+
+    def __init__(self, buf, offset):
+        self.buf = buf
+        self.offset = offset
+
+    def __getitem__(self, y):
+        value = self.buf[self.offset + y]
+        return None if value == UNREACHED else value
+
+
+class DmapView:
+    ''' Read-only dmap[x][y] view over an ArrayDijmap's flat distance buffer '''
+    __slots__ = ('owner',)
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def __getitem__(self, x):
+        owner = self.owner
+        return DmapColumn(owner.buf, owner.index(x, 0))
+
+
+class ArrayDijmap:
+    ''' Dijmap engine which keeps the distance field in a flat typed array, and fills it with a
+    frontier (bucket-queue) BFS over a passability mask taken from the sourcemap's tiles.
+
+    The flat grid is padded by one tile on every side so neighbor offsets never need bounds checks.
+    Tiles outside the sourcemap's is_val_xy() range are never passable, matching the node engine. '''
+    def __init__(self, sourcemap, target_nodes, dmrange):
+        self.sourcemap = sourcemap
+        self.dmrange = dmrange
+
+        self.width = sourcemap.width
+        self.height = sourcemap.height
+        # Padded dimensions
+        self.stride = self.height + 2
+        self.size = (self.width + 2) * self.stride
+
+        # Flat index offsets of the 8 neighbors
+        self.neighbor_offsets = tuple(dx * self.stride + dy for dx, dy in NEIGHBOR_OFFSETS)
+        # Rings expand until they would write dmrange, same as the node engine
+        self.max_value = dmrange - 1 if dmrange > 1 else self.size
+
+        self.empty_buf = array('i', [UNREACHED]) * self.size
+        self.buf = None
+        self.dmap = DmapView(self)
+        # Flat indices of the targets the current buffer was built from
+        self.targets = set()
+
+        self.passable = None
+        self.refresh_passability()
+
+        # Automatically create a map on initializing
+        self.update_map(target_nodes)
+
+    def index(self, x, y):
+        return (x + 1) * self.stride + y + 1
+
+    def refresh_passability(self):
+        ''' Rebuild the passability mask from the sourcemap's tiles - call if tiles change blocks_mov.
+        An existing field is refilled from scratch from its current targets '''
+        passable = bytearray(self.size)
+        grid = self.sourcemap.tile_grid
+        for x in xrange(1, self.width):
+            base = (x + 1) * self.stride + 1
+            # Maps with a tile grid can copy each column's flags over in one go
+            if grid is not None:
+                column_start = x * grid.height
+                passable[base + 1:base + self.height] = grid.blocks_mov[column_start + 1:column_start + self.height].translate(INVERT_FLAGS)
+            else:
+                column = self.sourcemap.tiles[x]
+                for y in xrange(1, self.height):
+                    if not column[y].blocks_mov:
+                        passable[base + y] = 1
+
+        self.passable = passable
+        if self.buf is not None:
+            self.rebuild_map(self.targets)
+
+    def get_value(self, x, y):
+        value = self.buf[self.index(x, y)]
+        return None if value == UNREACHED else value
+
+    def update_map(self, target_nodes):
+        ''' Bring the field up to date with target_nodes. If only a few targets were added or removed since the
+        last update, only the part of the field they influenced is repaired; otherwise it's rebuilt from scratch '''
+        new_targets = set(self.index(x, y) for x, y in target_nodes)
+
+        if self.buf is None:
+            self.rebuild_map(new_targets)
+            return
+
+        added = new_targets - self.targets
+        removed = self.targets - new_targets
+        if not (added or removed):
+            return
+
+        # With lots of changes the repair would touch most of the field anyway
+        if len(added) + len(removed) > len(new_targets):
+            self.rebuild_map(new_targets)
+        else:
+            self.repair_map(added, removed)
+
+    def rebuild_map(self, targets):
+        ''' Flood the whole field outwards from the targets (flat indices) '''
+        buf = self.empty_buf[:]
+        # Tiles which can still be written to - cleared as soon as a tile gets a value
+        unvisited = self.passable[:]
+        offsets = self.neighbor_offsets
+
+        frontier = []
+        for i in targets:
+            buf[i] = 0
+            unvisited[i] = 0
+            frontier.append(i)
+
+        value = 1
+        while frontier and value <= self.max_value:
+            next_frontier = []
+            for i in frontier:
+                for offset in offsets:
+                    j = i + offset
+                    if unvisited[j]:
+                        unvisited[j] = 0
+                        buf[j] = value
+                        next_frontier.append(j)
+
+            frontier = next_frontier
+            value += 1
+
+        self.buf = buf
+        self.targets = set(targets)
+
+    def repair_map(self, added, removed):
+        ''' Incrementally update the field for targets (flat indices) which were added or removed since the last update.
+        Tiles whose value came from a removed target are cleared, then the field is re-propagated into the cleared
+        area from its still-valid border, along with any added targets, using a bucket queue keyed on value '''
+        buf = self.buf
+        passable = self.passable
+        offsets = self.neighbor_offsets
+        max_value = self.max_value
+
+        self.targets -= removed
+        self.targets |= added
+
+        ## Clear everything which may have been supported by a removed target - that's any tile
+        ## reachable from it through a chain of tiles whose values go up by exactly 1
+        cleared = []
+        stack = []
+        for i in removed:
+            stack.append((i, buf[i]))
+            buf[i] = UNREACHED
+            cleared.append(i)
+
+        while stack:
+            i, old_value = stack.pop()
+            for offset in offsets:
+                j = i + offset
+                if passable[j] and buf[j] == old_value + 1:
+                    stack.append((j, buf[j]))
+                    buf[j] = UNREACHED
+                    cleared.append(j)
+
+        ## Seed the bucket queue with the added targets, plus any valid values bordering the cleared area
+        buckets = {0: list(added)}
+        for i in added:
+            buf[i] = 0
+
+        for i in cleared:
+            for offset in offsets:
+                j = i + offset
+                value = buf[j]
+                if value != UNREACHED:
+                    buckets.setdefault(value, []).append(j)
+
+        ## Propagate outwards in order of value, lowering any tile we can reach more cheaply
+        value = min(buckets) if buckets else max_value
+        while buckets and value < max_value:
+            for i in buckets.pop(value, ()):
+                # Stale entry - this tile was lowered after being queued
+                if buf[i] != value:
+                    continue
+                for offset in offsets:
+                    j = i + offset
+                    if passable[j] and (buf[j] == UNREACHED or buf[j] > value + 1):
+                        buf[j] = value + 1
+                        buckets.setdefault(value + 1, []).append(j)
+            value += 1
+
+
+DIJMAP_ENGINES = {'python': NodeDijmap, 'array': ArrayDijmap}
+
+
+def create_dijmap(sourcemap, target_nodes, dmrange, engine=None):
+    ''' Create a Dijmap using the engine set in config (or the one passed in) '''
+    return DIJMAP_ENGINES[engine or g.DIJMAP_ENGINE](sourcemap=sourcemap, target_nodes=target_nodes, dmrange=dmrange)
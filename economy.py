@@ -1,18 +1,23 @@
 from __future__ import division
 import random
-from random import randint as roll
 import cProfile
 import pstats
 import os
 import yaml
 from collections import defaultdict, OrderedDict
 from itertools import chain
+from heapq import heapify, heappop
 import logging
+import multiprocessing
 
 import data_importer as data
-from helpers import weighted_dict_choice, infinite_defaultdict
+from helpers import weighted_dict_choice, infinite_defaultdict, pack_numbers, unpack_numbers
 
 import config as g
+import rng
+
+# Agents and markets draw from the economy stream (see rng.py)
+roll = rng.economy.randint
 
 try:
     import matplotlib.pyplot as plt
@@ -81,16 +86,19 @@ plot_colors = {'food':(.3, .8, .3), 'flax':(1, .5, 1), 'clay':(.25, 0, .5), 'woo
                'copper weapons':(.9, .5, .2), 'bronze weapons':(.1, .8, .8), 'iron weapons':(.7, .7, .7),
                'copper armor':(.5, .1, 0), 'bronze armor':(.3, 1, 1), 'iron armor':(0, 0, 0)}
 
+# Set while run_economies has worker processes running - see run_forked_markets
+forked_economy_state = None
+
 
 
 
 
-def economy_test_run():
+def make_test_economy(scale=1):
+    ''' A standalone economy with agents producing every resource and good. scale multiplies the number of agents '''
     native_resources = [resource.name for resource in data.commodity_manager.resources]
-    print native_resources
     economy = Economy(native_resources=native_resources, local_taxes=5, owner=None)
 
-    for i in xrange(6):
+    for i in xrange(6 * scale):
         for resource in data.commodity_manager.resources:
             if resource.name != 'food' and resource.name != 'flax':
                 economy.add_agent_based_on_token(resource.name)
@@ -107,7 +115,7 @@ def economy_test_run():
                 economy.add_agent_based_on_token(resource.name)
                 economy.add_agent_based_on_token(resource.name)
 
-    for i in xrange(4):
+    for i in xrange(4 * scale):
         for good in data.commodity_manager.goods:
             if good.name == 'flax clothing':
                 economy.add_agent_based_on_token(good.name)
@@ -117,7 +125,14 @@ def economy_test_run():
                 economy.add_agent_based_on_token(good.name)
                 economy.add_agent_based_on_token(good.name)
 
-    for i in xrange(20):
+    return economy
+
+
+def economy_test_run(scale=1, rounds=20):
+    economy = make_test_economy(scale=scale)
+    print economy.native_resources
+
+    for i in xrange(rounds):
         #print '------------', i, '--------------'
         economy.run_simulation()
 
@@ -247,7 +262,7 @@ class Agent(object):
 
         if not self.is_merchant:
             for commodity_category in chain(self.reaction.commodities_consumed, self.reaction.commodities_required):
-                self.buy_inventory[random.choice(data.commodity_manager.get_names_of_commodities_of_type(commodity_category))] += self.population_number * roll(0, 3)
+                self.buy_inventory[rng.economy.choice(data.commodity_manager.get_names_of_commodities_of_type(commodity_category))] += self.population_number * roll(0, 3)
 
         self.buy_inventory['food'] = self.population_number * roll(2, 5)
         self.buy_inventory['flax clothing'] = self.population_number * roll(0, 2)
@@ -271,6 +286,12 @@ class Agent(object):
         self.attached_to = figure
         self.attached_to.creature.economy_agent = self
 
+    def is_watched(self):
+        ''' The last_turn log is only written while one of our economies is being displayed, or if we belong to the
+        player (whose panel lists it) '''
+        return self.buy_economy.log_agent_actions or self.sell_economy.log_agent_actions or \
+               (self.attached_to is not None and self.attached_to is g.player)
+
     def adjust_gold(self, amount):
         self.gold += amount
         if self.attached_to:
@@ -411,9 +432,10 @@ class Agent(object):
             quantity = max(minimum, int(round(quantity * favorability)) )
 
         if quantity > 0:
-            self.last_turn.append('Bid on {0} {1} for {2}'.format(quantity, token_to_bid, bid_price))
-            economy.auctions[token_to_bid].bids.append(Offer(owner=self, commodity=token_to_bid, price=bid_price, quantity=quantity))
-        else:
+            if self.is_watched():
+                self.last_turn.append('Bid on {0} {1} for {2}'.format(quantity, token_to_bid, bid_price))
+            economy.auctions[token_to_bid].add_bid(owner=self, price=bid_price, quantity=quantity)
+        elif self.is_watched():
             self.last_turn.append('Tried to bid on {0} but quantity not > 0'.format(token_to_bid))
 
     def create_sell(self, economy, sell_commodity, quantity):
@@ -436,10 +458,11 @@ class Agent(object):
         quantity = min(int(round(quantity * favorability)), self.sell_inventory[sell_commodity])
 
         if quantity > 0:
-            self.last_turn.append('Offered to sell {0} {1} for {2}'.format(quantity, sell_commodity, sell_price))
-            economy.auctions[sell_commodity].sells.append( Offer(owner=self, commodity=sell_commodity, price=sell_price, quantity=quantity) )
+            if self.is_watched():
+                self.last_turn.append('Offered to sell {0} {1} for {2}'.format(quantity, sell_commodity, sell_price))
+            economy.auctions[sell_commodity].add_sell(owner=self, price=sell_price, quantity=quantity)
 
-        else:
+        elif self.is_watched():
             self.last_turn.append('Tried to sell {0} but inventory was empty'.format(sell_commodity))
 
 
@@ -517,7 +540,8 @@ class Agent(object):
             self.sell_inventory[self.reaction.output_commodity_name] = min( int(self.population_number / 5) + self.sell_inventory[self.reaction.output_commodity_name], self.inventory_size )
 
 
-        self.last_turn.append('Produced {0} reactions for {1}'.format(available_reaction_amount, self.sold_commodity_name))
+        if self.is_watched():
+            self.last_turn.append('Produced {0} reactions for {1}'.format(available_reaction_amount, self.sold_commodity_name))
 
 
     # def check_min_sell_price(self):
@@ -788,8 +812,14 @@ class AuctionHouse:
         self.commodity_category = data.commodity_manager.get_actual_commodity_from_name(self.commodity).category
         self.economy.auctions_by_category[self.commodity_category].append(self)
 
-        self.bids = []
-        self.sells = []
+        # Order book for the current round - offers are stored in parallel lists, indexed by the order they were placed in
+        self.bid_owners = []
+        self.bid_prices = []
+        self.bid_quantities = []
+        self.sell_owners = []
+        self.sell_prices = []
+        self.sell_quantities = []
+
         self.price_history = [START_VAL]
         # How many bids have existed each round
         self.bid_history = [0]
@@ -804,6 +834,122 @@ class AuctionHouse:
         self.supply = 0
         self.demand = 0
 
+    def __getstate__(self):
+        # The histories grow by one entry per round, so they're saved as packed arrays
+        state = self.__dict__.copy()
+        for name in ('price_history', 'bid_history', 'sell_history'):
+            state[name] = pack_numbers(state[name])
+        return state
+
+    def __setstate__(self, state):
+        for name in ('price_history', 'bid_history', 'sell_history'):
+            state[name] = unpack_numbers(state[name])
+        self.__dict__.update(state)
+
+    def add_bid(self, owner, price, quantity):
+        self.bid_owners.append(owner)
+        self.bid_prices.append(price)
+        self.bid_quantities.append(quantity)
+
+    def add_sell(self, owner, price, quantity):
+        self.sell_owners.append(owner)
+        self.sell_prices.append(price)
+        self.sell_quantities.append(quantity)
+
+    def clear_offers(self):
+        self.bid_owners, self.bid_prices, self.bid_quantities = [], [], []
+        self.sell_owners, self.sell_prices, self.sell_quantities = [], [], []
+
+    def run_auction(self):
+        ''' Match this round's bids with its sells, meeting in the middle on price, then clear the order book
+        and record the round in the price history '''
+        economy = self.economy
+        commodity = self.commodity
+        bid_owners, bid_prices, bid_quantities = self.bid_owners, self.bid_prices, self.bid_quantities
+        sell_owners, sell_prices, sell_quantities = self.sell_owners, self.sell_prices, self.sell_quantities
+
+        self.iterations += 1
+
+        num_bids = len(bid_prices)
+        num_sells = len(sell_prices)
+
+        self.supply = sum(sell_quantities)
+        self.demand = sum(bid_quantities)
+
+        # The highest buyer is matched with the lowest seller. Heap entries are (price key, -index), so that among
+        # offers at the same price, the one placed last comes out first
+        bid_heap = [(-price, -i) for i, price in enumerate(bid_prices)]
+        heapify(bid_heap)
+        sell_heap = [(price, -i) for i, price in enumerate(sell_prices)]
+        heapify(sell_heap)
+
+        commodity_sell_prices = []
+
+        if num_bids > 0:  buyer = -heappop(bid_heap)[1]
+        if num_sells > 0: seller = -heappop(sell_heap)[1]
+
+        # Match bidders with sellers
+        while bid_heap and sell_heap:
+            # Once transactions have occured, leaving traders without anymore desired quantity, pop out the next one
+            if bid_quantities[buyer] == 0:   buyer = -heappop(bid_heap)[1]
+            if sell_quantities[seller] == 0: seller = -heappop(sell_heap)[1]
+
+            actual_buyer = bid_owners[buyer]
+            buyer_price = bid_prices[buyer]
+            seller_price = sell_prices[seller]
+
+            ## If the price is still lower than the seller
+            if buyer_price < seller_price:
+                actual_buyer.eval_bid_rejected(economy, commodity, seller_price)
+                bid_quantities[buyer] = 0
+            ## Make the transaction
+            else:
+                actual_seller = sell_owners[seller]
+                # Determine price/amount. Offers are only placed with a positive quantity, so this is always > 0
+                quantity = min(bid_quantities[buyer], sell_quantities[seller])
+                price = int((buyer_price + seller_price) *.5)
+
+                # Adjust buyer/seller requested amounts
+                bid_quantities[buyer] -= quantity
+                sell_quantities[seller] -= quantity
+
+                actual_buyer.eval_trade_accepted(economy, commodity, price)
+                actual_seller.eval_trade_accepted(economy, commodity, price)
+
+                ## Update inventories and gold counts
+                actual_buyer.take_bought_commodity(commodity, quantity)
+                actual_seller.remove_sold_commodity(commodity, quantity)
+
+                actual_buyer.adjust_gold(-price*quantity)
+                actual_seller.adjust_gold(price*quantity)
+
+                actual_buyer.buys += quantity
+                actual_seller.sells += quantity
+                if actual_buyer.is_watched():
+                    actual_buyer.last_turn.append('Bought {0} {1} from {2} at {3}'.format(quantity, commodity, actual_seller.name, price))
+                if actual_seller.is_watched():
+                    actual_seller.last_turn.append('Sold {0} {1} to {2} at {3}'.format(quantity, commodity, actual_buyer.name, price))
+
+                # Add to running tally of prices this turn TODO - this doesn't yet accurately reflect the price since it's not accounting for quantity
+                commodity_sell_prices.append(price)
+
+        # Bidders which were never matched re-evaluate prices (lowest first), if some quantity was being offered
+        if bid_heap and num_sells > 0:
+            for i in sorted((-neg_i for neg_price, neg_i in bid_heap), key=lambda i: (bid_prices[i], i)):
+                bid_owners[i].eval_bid_rejected(economy, commodity)
+
+        # Sellers which were never matched re-evaluate prices (highest first), if some quantity was being offered
+        elif sell_heap and num_bids > 0:
+            for i in sorted((-neg_i for price, neg_i in sell_heap), key=lambda i: (-sell_prices[i], i)):
+                sell_owners[i].eval_sell_rejected(economy, commodity)
+
+        self.clear_offers()
+
+        ## Average prices if there were some, else set as None (so position is maintained in historical averages)
+        mean_price_last_round = int(round(sum(commodity_sell_prices)/len(commodity_sell_prices))) if commodity_sell_prices else None
+        # Update historical data including
+        self.update_historical_data(mean_price_last_round, self.demand, self.supply)
+
     def update_historical_data(self, mean_price_last_round, num_bids, num_sells):
         # Updates the history for this auction
         self.price_history.append(mean_price_last_round)
@@ -830,15 +976,6 @@ class AuctionHouse:
         return sum(self.bid_history[-HIST_WINDOW_SIZE:]) / sum(self.sell_history[-HIST_WINDOW_SIZE:])
 
 
-class Offer:
-    # An offer that goes into the auction's "bids" or "sells".
-    # Bids and sells are then compared against each other and agents meet at the middle
-    def __init__(self, owner, commodity, price, quantity):
-        self.owner = owner
-        self.commodity = commodity
-        self.price = price
-        self.quantity = quantity
-
 class Economy:
     def __init__(self, native_resources, local_taxes, owner=None):
         self.native_resources = native_resources
@@ -878,6 +1015,19 @@ class Economy:
         # Counter to be appended to agent names
         self.agent_num = 1
 
+        # Agents only keep their last_turn log while this is set (e.g. while the economy is being displayed)
+        self.log_agent_actions = 0
+
+    def __getstate__(self):
+        # Like the auction histories, tax histories are saved as packed arrays
+        state = self.__dict__.copy()
+        state['collected_taxes_history'] = {commodity: pack_numbers(history) for commodity, history in self.collected_taxes_history.iteritems()}
+        return state
+
+    def __setstate__(self, state):
+        state['collected_taxes_history'] = {commodity: unpack_numbers(history) for commodity, history in state['collected_taxes_history'].iteritems()}
+        self.__dict__.update(state)
+
     def get_all_available_commodity_tokens(self):
         return [token for tokens in self.available_types.values() for token in tokens]
 
@@ -965,6 +1115,9 @@ class Economy:
 
         ###### IF RESOURCE GATHERER - need to find a valid plot of land for it to work #############
         if token in [r.name for r in data.commodity_manager.resources]:
+            # Standalone economies (see make_test_economy) have no city to find land in
+            if not self.owner:
+                return
             ## Assign the agent to a physical slot somewhere by the city
             resource = 'land' if token == 'food' else token
 
@@ -1064,6 +1217,12 @@ class Economy:
 
     def run_simulation(self):
         ''' Run a simulation '''
+        self.run_market()
+        self.end_turn()
+
+    def run_market(self):
+        ''' First part of the turn - agents produce, put things up for sale and bid, then the auctions are run.
+        Apart from merchants belonging to other economies, this only touches our own agents and auctions '''
 
         # Start off by making a tmp variable holding all the commoditiy amounts we have created from taxes
         collected_taxes_tmp = {c: self.collected_taxes[c] for c in self.collected_taxes}
@@ -1079,91 +1238,12 @@ class Economy:
         for commodity_name, collected_taxes_total in self.collected_taxes.iteritems():
             self.collected_taxes_history[commodity_name].append(collected_taxes_total - collected_taxes_tmp[commodity_name])
 
-        ## Run the auction
-        # Bids / sells should be sorted by price to match the lowest seller with the highest buyer
-        # For performance reasons, the lists are sorted opposite as they should be, so that buyers / sellers can be popped
-        #  from the end of the list moving backwards (instead of at the front of the list moving forwards)
-        for commodity, auction in self.auctions.iteritems():
-            auction.iterations += 1
-            ## Sort the bids by price (should be highest to lowest, but sorting opposite here as mentioned above) ##
-            auction.bids = sorted(auction.bids, key=lambda attr: attr.price)
-            ## Sort the sells by price (should be lowest to hghest, but sorting opposite here as mentioned above) ##
-            auction.sells = sorted(auction.sells, key=lambda attr: attr.price, reverse=True)
-
-            commodity_sell_prices = []
-
-            num_bids = len(auction.bids)
-            num_sells = len(auction.sells)
-
-            #if num_bids > 0 or num_sells > 0:
-            auction.supply = sum(offer.quantity for offer in auction.sells)
-            auction.demand = sum(offer.quantity for offer in auction.bids)
-
-            if num_bids > 0:  buyer = auction.bids.pop()
-            if num_sells > 0: seller = auction.sells.pop()
-
-            # Match bidders with sellers
-            while auction.bids and auction.sells:
-                # Once transactions have occured, leaving traders without anymore desired quantity, pop out the next one
-                if buyer.quantity == 0:  buyer = auction.bids.pop()
-                if seller.quantity == 0: seller = auction.sells.pop()
-
-                actual_buyer = buyer.owner
-                actual_seller = seller.owner
-
-                ## If the price is still lower than the seller
-                if buyer.price < seller.price:
-                    actual_buyer.eval_bid_rejected(self, commodity, seller.price)
-                    buyer.quantity = 0
-                ## Make the transaction
-                else:
-                    # Determine price/amount
-                    quantity = min(buyer.quantity, seller.quantity)
-                    price = int((buyer.price + seller.price) *.5)
-
-                    if quantity > 0:
-                        # Adjust buyer/seller requested amounts
-                        buyer.quantity -= quantity
-                        seller.quantity -= quantity
-
-                        actual_buyer.eval_trade_accepted(self, buyer.commodity, price)
-                        actual_seller.eval_trade_accepted(self, buyer.commodity, price)
-
-                        ## Update inventories and gold counts
-                        actual_buyer.take_bought_commodity(buyer.commodity, quantity)
-                        actual_seller.remove_sold_commodity(seller.commodity, quantity)
-
-                        actual_buyer.adjust_gold(-price*quantity)
-                        actual_seller.adjust_gold(price*quantity)
-
-                        actual_buyer.buys += quantity
-                        actual_buyer.last_turn.append('Bought {0} {1} from {2} at {3}'.format(quantity, commodity, actual_seller.name, price))
-                        actual_seller.sells += quantity
-                        actual_seller.last_turn.append('Sold {0} {1} to {2} at {3}'.format(quantity, commodity, actual_buyer.name, price))
-
-                        # Add to running tally of prices this turn TODO - this doesn't yet accurately reflect the price since it's not accounting for quantity
-                        commodity_sell_prices.append(price)
-
-            # All bidders re-evaluate prices, if some quantity was being offered
-            if auction.bids and num_sells > 0:
-                for buyer in auction.bids:
-                    buyer.owner.eval_bid_rejected(self, buyer.commodity)
-
-            # All sellers re-evaluate prices, if some quantity was being offered
-            elif auction.sells and num_bids > 0:
-                for seller in auction.sells:
-                    seller.owner.eval_sell_rejected(self, seller.commodity)
-
-            # Reset the auction bids and sells
-            self.auctions[commodity].bids = []
-            self.auctions[commodity].sells = []
-
-            ## Average prices if there were some, else set as None (so position is maintained in historical averages)
-            mean_price_last_round = int(round(sum(commodity_sell_prices)/len(commodity_sell_prices))) if commodity_sell_prices else None
-            # Update historical data including
-            auction.update_historical_data(mean_price_last_round, auction.demand, auction.supply)
-
+        ## Run the auction for each commodity
+        for auction in self.auctions.itervalues():
+            auction.run_auction()
 
+    def end_turn(self):
+        ''' Second part of the turn - merchants may move on, bankrupt agents are dealt with '''
         ## Merchants evaluate whether or not to move on to the next city
         for merchant in chain(self.buy_merchants, self.sell_merchants):
             if merchant.current_location == self:
@@ -1265,6 +1345,214 @@ class Economy:
         plt.show()
 
 
+def run_economies(economies, processes=None):
+    ''' Run a turn of each economy's simulation. The markets are run one after another in list order, each with its own
+    random seed (drawn in list order), and then the rest of the turn is run serially. With more than one process, the
+    economies are split into groups which share no agents (see get_linked_economy_groups), the groups are shared out
+    into a batch per worker, and each batch's markets are run in a forked worker, in the same order. A market only
+    changes its own group, so the results are the same as running them all in this process, for any number of workers.
+    processes defaults to config.ECONOMY_PROCESSES, and 0 means one per core '''
+    global forked_economy_state
+
+    if processes is None:
+        processes = g.ECONOMY_PROCESSES
+    if not processes:
+        processes = multiprocessing.cpu_count()
+
+    seeds = [rng.economy.getrandbits(32) for economy in economies]
+    batches = get_economy_batches(economies, processes) if processes > 1 and hasattr(os, 'fork') else []
+
+    if len(batches) < 2:
+        # Markets reseed the generators, which a forked worker would leave untouched in this process
+        random_state, economy_state = random.getstate(), rng.economy.getstate()
+        for economy, seed in zip(economies, seeds):
+            run_seeded_market(economy, seed)
+        random.setstate(random_state)
+        rng.economy.setstate(economy_state)
+    else:
+        # Workers are forked from this process, so they pick this up along with the rest of the world. Running the
+        # markets changes the worker's copy of the world, so each worker only runs one batch, and there's one per worker
+        forked_economy_state = (economies, batches, seeds)
+        pool = multiprocessing.Pool(processes=len(batches), maxtasksperchild=1)
+        try:
+            results = pool.map(run_forked_markets, xrange(len(batches)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            forked_economy_state = None
+
+        for batch, result in zip(batches, results):
+            batch_economies = [economies[i] for i in batch]
+            merge_market_changes(batch_economies, get_group_agents(batch_economies), result)
+
+    for economy in economies:
+        economy.end_turn()
+
+
+def run_seeded_market(economy, seed):
+    random.seed(seed)
+    rng.economy.seed(seed)
+    economy.run_market()
+
+
+def get_linked_economy_groups(economies):
+    ''' Split the economies into groups (lists of indices, in order) which share no agents. A merchant links the
+    economy it buys in with the one it sells in - it pays taxes and bids in one, and sells in the other '''
+    economy_indices = {economy: i for i, economy in enumerate(economies)}
+    # Each economy's index points towards the first economy in its group
+    linked_to = range(len(economies))
+
+    def get_first(i):
+        while linked_to[i] != i:
+            linked_to[i] = linked_to[linked_to[i]]
+            i = linked_to[i]
+        return i
+
+    for economy in economies:
+        for merchant in economy.buy_merchants:
+            if merchant.sell_economy in economy_indices:
+                first, other_first = sorted((get_first(economy_indices[economy]), get_first(economy_indices[merchant.sell_economy])))
+                linked_to[other_first] = first
+
+    groups = OrderedDict()
+    for i in xrange(len(economies)):
+        groups.setdefault(get_first(i), []).append(i)
+    return groups.values()
+
+
+def get_economy_batches(economies, processes):
+    ''' Share the groups of linked economies out into at most this many batches (lists of indices, in order), evening
+    out the number of agents in each. Biggest groups are placed first, each into the batch with the fewest agents '''
+    groups = get_linked_economy_groups(economies)
+    sizes = [sum(len(economies[i].agents) + len(economies[i].buy_merchants) for i in group) for group in groups]
+
+    batches = [[] for i in xrange(min(processes, len(groups)))]
+    batch_sizes = [0] * len(batches)
+    for size, group in sorted(zip(sizes, groups), key=lambda item: (-item[0], item[1][0])):
+        smallest = batch_sizes.index(min(batch_sizes))
+        batches[smallest].extend(group)
+        batch_sizes[smallest] += size
+
+    return [sorted(batch) for batch in batches]
+
+
+def get_group_agents(economies):
+    ''' Every agent taking part in these economies, in a fixed order so that workers can refer to them by index '''
+    agents = []
+    seen_agents = set()
+    for economy in economies:
+        for agent in chain(economy.agents, economy.sell_merchants, economy.buy_merchants):
+            if agent not in seen_agents:
+                seen_agents.add(agent)
+                agents.append(agent)
+    return agents
+
+
+def get_market_state(economies, agents):
+    ''' Everything (outside of the economies' auctions) that running their markets can change '''
+    agent_states = []
+    for agent in agents:
+        beliefs = [{commodity: (belief.center, belief.uncertainty) for commodity, belief in agent.perceived_values[economy].iteritems()}
+                   if economy in agent.perceived_values else {} for economy in economies]
+        agent_states.append((agent.gold, agent.buys, agent.sells, agent.turns_alive,
+                             dict(agent.buy_inventory), dict(agent.input_product_inventory), dict(agent.sell_inventory), beliefs))
+
+    economy_states = [(dict(economy.collected_taxes), economy.owner.treasury if economy.owner else 0, len(economy.bankruptees),
+                       {commodity: len(history) for commodity, history in economy.collected_taxes_history.iteritems()})
+                      for economy in economies]
+
+    return agent_states, economy_states
+
+
+def get_amount_changes(before, after):
+    ''' Given two commodity: amount dicts, return how much each amount changed by '''
+    return {commodity: amount - before.get(commodity, 0) for commodity, amount in after.iteritems() if amount != before.get(commodity, 0)}
+
+
+def run_forked_markets(batch_index):
+    ''' Runs in a worker process. Run the markets of one batch of economies, and return the changes they made as
+    plain data (see merge_market_changes) '''
+    economies, batches, seeds = forked_economy_state
+    batch = batches[batch_index]
+    batch_economies = [economies[i] for i in batch]
+    agents = get_group_agents(batch_economies)
+
+    agent_states, economy_states = get_market_state(batch_economies, agents)
+    for i in batch:
+        run_seeded_market(economies[i], seeds[i])
+    new_agent_states, new_economy_states = get_market_state(batch_economies, agents)
+
+    agent_changes = []
+    for agent, (gold, buys, sells, turns_alive, buy_inventory, input_product_inventory, sell_inventory, beliefs), new_state in zip(agents, agent_states, new_agent_states):
+        changed_beliefs = [{commodity: belief for commodity, belief in new_beliefs.iteritems() if old_beliefs.get(commodity) != belief}
+                           for old_beliefs, new_beliefs in zip(beliefs, new_state[7])]
+        agent_changes.append((agent.last_turn, agent.gold - gold, agent.buys - buys, agent.sells - sells, agent.turns_alive - turns_alive,
+                              get_amount_changes(buy_inventory, agent.buy_inventory),
+                              get_amount_changes(input_product_inventory, agent.input_product_inventory),
+                              get_amount_changes(sell_inventory, agent.sell_inventory),
+                              changed_beliefs))
+
+    agent_indices = {agent: i for i, agent in enumerate(agents)}
+    economy_changes = []
+    for economy, (collected_taxes, treasury, num_bankruptees, taxes_history_lengths), (new_collected_taxes, new_treasury, new_num_bankruptees, new_lengths) \
+            in zip(batch_economies, economy_states, new_economy_states):
+        taxes_history = {commodity: history[taxes_history_lengths.get(commodity, 0):] for commodity, history in economy.collected_taxes_history.iteritems()}
+        auctions = {commodity: (auction.price_history[-1], auction.bid_history[-1], auction.sell_history[-1], auction.last_price,
+                                auction.recent_mean_price, auction.iterations, auction.supply, auction.demand)
+                    for commodity, auction in economy.auctions.iteritems()}
+        economy_changes.append((get_amount_changes(collected_taxes, new_collected_taxes), new_treasury - treasury,
+                                [agent_indices[agent] for agent in economy.bankruptees[num_bankruptees:]], taxes_history, auctions))
+
+    return agent_changes, economy_changes
+
+
+def merge_market_changes(economies, agents, changes):
+    ''' Apply the changes returned by run_forked_markets for this batch of economies '''
+    agent_changes, economy_changes = changes
+
+    for agent, (last_turn, gold, buys, sells, turns_alive, buy_inventory, input_product_inventory, sell_inventory, beliefs) in zip(agents, agent_changes):
+        agent.last_turn = last_turn
+        if gold:
+            agent.adjust_gold(gold)
+        agent.buys += buys
+        agent.sells += sells
+        agent.turns_alive += turns_alive
+
+        for inventory, amounts in ((agent.buy_inventory, buy_inventory), (agent.input_product_inventory, input_product_inventory), (agent.sell_inventory, sell_inventory)):
+            for commodity, amount in amounts.iteritems():
+                inventory[commodity] += amount
+
+        for economy, economy_beliefs in zip(economies, beliefs):
+            for commodity, (center, uncertainty) in economy_beliefs.iteritems():
+                perceived_values = agent.perceived_values[economy]
+                if commodity in perceived_values:
+                    perceived_values[commodity].center = center
+                    perceived_values[commodity].uncertainty = uncertainty
+                else:
+                    perceived_values[commodity] = PriceBelief(center, uncertainty)
+
+    for economy, (collected_taxes, treasury, bankruptees, taxes_history, auctions) in zip(economies, economy_changes):
+        for commodity, amount in collected_taxes.iteritems():
+            economy.collected_taxes[commodity] = economy.collected_taxes.get(commodity, 0) + amount
+        if treasury:
+            economy.owner.treasury += treasury
+        economy.bankruptees.extend(agents[i] for i in bankruptees)
+
+        for commodity, history in taxes_history.iteritems():
+            economy.collected_taxes_history[commodity].extend(history)
+
+        for commodity, (price, num_bids, num_sells, last_price, recent_mean_price, iterations, supply, demand) in auctions.iteritems():
+            auction = economy.auctions[commodity]
+            auction.price_history.append(price)
+            auction.bid_history.append(num_bids)
+            auction.sell_history.append(num_sells)
+            auction.last_price = last_price
+            auction.recent_mean_price = recent_mean_price
+            auction.iterations = iterations
+            auction.supply = supply
+            auction.demand = demand
+
+
 def main():
     economy_test_run()
 
@@ -17,7 +17,11 @@
 # shifts based on historical language changes
 
 from __future__ import division
-from random import randint as roll, choice, shuffle, uniform
+
+import rng
+
+# Languages are generated from the culture stream (see rng.py)
+roll, choice, shuffle, uniform = rng.culture.randint, rng.culture.choice, rng.culture.shuffle, rng.culture.uniform
 
 # Chance of language being a language with a high amount of "no onset consonant" syllables
 NO_ONSET_C_CHANCE = 70
@@ -0,0 +1,155 @@
+''' Whole-map array versions of the world generation steps in it.World. Height, temperature, water distance,
+moisture and biome type are computed for the entire map at once with numpy, then written straight into
+the world's RegionGrid arrays. Random rolls are drawn in the same order as the tile-by-tile code, so a
+given seed produces the same world either way. Only used if numpy is available (see config.VECTORIZED_WORLDGEN) '''
+from __future__ import division
+
+import libtcodpy as libtcod
+import config as g
+import rng
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+# World generation draws from the terrain stream (see rng.py)
+roll = rng.terrain.randint
+
+
+def is_enabled():
+    return numpy_available and g.VECTORIZED_WORLDGEN
+
+
+def round_half_up(values):
+    ''' Python 2's round() rounds halves away from zero, numpy's rounds them to even. This matches the former
+    for the positive values used here '''
+    floor = np.floor(values)
+    return np.where(values - floor >= .5, floor + 1, floor).astype(int)
+
+
+def heightmap_to_array(hm):
+    ''' Copy of a libtcod heightmap's values as an array indexed [x, y] '''
+    values = np.ctypeslib.as_array(hm.p.contents.values, shape=(hm.h, hm.w))
+    return values.T.astype(np.float64)
+
+
+def turbulence_to_array(noise, width, height, div_amt, octaves):
+    ''' libtcod has no bulk noise call, so sample it once per tile and return the result as an array indexed [x, y] '''
+    return np.array([[libtcod.noise_get_turbulence(noise, [x / div_amt, y / div_amt], octaves, libtcod.NOISE_SIMPLEX) for y in xrange(height)]
+                     for x in xrange(width)])
+
+
+def make_heights_and_temps(world, hm, mnoise, octaves, div_amt, thresh, thresh2, scale, mvar):
+    ''' Array version of the per-tile loop in World.make_heightmap. Returns the height and temperature arrays,
+    along with a list of mountain peak locations '''
+    width, height = world.width, world.height
+    xs = np.arange(width)[:, np.newaxis]
+    ys = np.arange(height)[np.newaxis, :]
+
+    vals = turbulence_to_array(noise=mnoise, width=width, height=height, div_amt=div_amt, octaves=octaves)
+
+    #### For turb map, low vals are "peaks" for us ##############
+    high = (vals < thresh) & (height / 10 < ys) & (ys < height - (height / 10))
+    mid = ~high & (vals < thresh2)
+
+    raise_terr = np.zeros((width, height), dtype=int)
+    raise_terr[high] = round_half_up(scale * (1 - vals[high]))
+    raise_terr[mid] = round_half_up((scale / 2) * (1 - vals[mid]))
+
+    # The random variation has to be rolled tile by tile, in the same order as the original loop (x, then y)
+    half_mvar = int(round(mvar / 2))
+    for x, y in np.argwhere(high | mid).tolist():
+        if high[x, y]:
+            raise_terr[x, y] += roll(-mvar, mvar)
+        else:
+            raise_terr[x, y] += roll(-half_mvar, half_mvar)
+
+    heights = np.minimum(round_half_up(heightmap_to_array(hm)) + raise_terr, 255)
+    # Map edges are water
+    heights[~((5 < xs) & (xs < width - 5)) & (heights >= g.WATER_HEIGHT)] = 99
+
+    mountains = [tuple(loc) for loc in np.argwhere(heights > 200).tolist()]
+
+    # weird formula for approximating temperature based on height and distance to equator
+    base_temp = 16
+    height_mod = ((1.05 - (heights / 255)) * 4)
+    equator_mod = (1.3 - (np.abs(ys - world.equator) / (height / 2))) ** 2
+    temps = base_temp * height_mod * equator_mod
+
+    return heights, temps, mountains
+
+
+def calculate_water_dist(heights):
+    ''' Array version of World.calculate_water_dist - a breadth-first flood out from every water tile
+    (in the 4 cardinal directions, never onto the map border). Unreached tiles get a wdist of -1 '''
+    width, height = heights.shape
+
+    interior = np.zeros((width, height), dtype=bool)
+    interior[1:-1, 1:-1] = True
+
+    frontier = heights < g.WATER_HEIGHT
+    wdist = np.where(frontier, 0, -1)
+
+    distance = 0
+    while frontier.any():
+        distance += 1
+
+        bordering = np.zeros((width, height), dtype=bool)
+        bordering[1:, :] |= frontier[:-1, :]
+        bordering[:-1, :] |= frontier[1:, :]
+        bordering[:, 1:] |= frontier[:, :-1]
+        bordering[:, :-1] |= frontier[:, 1:]
+
+        frontier = bordering & interior & (wdist == -1)
+        wdist[frontier] = distance
+
+    # "Moisture" is related to water dist but takes height into account. LOWER is MORE moist
+    moist = np.where(wdist > 0, wdist * (1.7 - (heights / 255)) ** 2, 100)
+    moist[wdist == 0] = 0
+
+    return wdist, moist
+
+
+def grid_to_array(world, field):
+    ''' Array view (indexed [x, y]) over one of the world's RegionGrid fields. Writes to it go straight to the tiles '''
+    values = getattr(world.tile_grid, field)
+    return np.frombuffer(values, dtype=values.typecode).reshape(world.width, world.height)
+
+
+def write_climate_to_tiles(world, heights, temps, wdist, moist):
+    ''' Single bulk write of the generated climate info into the world's RegionGrid. Unreached
+    tiles' wdist is already -1, which is the grid's sentinel for None '''
+    for field, values in (('heights', heights), ('temps', temps), ('wdists', wdist), ('moists', moist)):
+        grid_to_array(world, field)[:] = values
+
+
+def classify_biomes(world):
+    ''' Whole-map version of World.classify_biome. Returns region names as a list of columns, indexed [x][y] '''
+    heights = grid_to_array(world, 'heights')
+    temps = grid_to_array(world, 'temps')
+    moist = grid_to_array(world, 'moists')
+    ys = np.arange(world.height)[np.newaxis, :]
+
+    tundra_zone = ~((35 < ys) & (ys < world.height - 35))
+    taiga_zone = ~((45 < ys) & (ys < world.height - 45))
+
+    # Same order as the if/elif chain in World.classify_biome - np.select picks the first condition that matches
+    conditions = (
+        (heights < g.WATER_HEIGHT,                      'ocean'),
+        (heights > g.MOUNTAIN_HEIGHT,                   'mountain'),
+        ((temps < 18) & tundra_zone,                    'tundra'),
+        ((temps < 23) & (moist < 22) & taiga_zone,      'taiga'),
+        ((temps < 30) & (moist < 18),                   'temperate forest'),
+        (temps < 35,                                    'temperate steppe'),
+        ((temps > 47) & (moist < 18),                   'rain forest'),
+        ((temps >= 35) & (moist < 18),                  'tree savanna'),
+        ((temps >= 35) & (moist < 34),                  'grass savanna'),
+        (temps <= 44,                                   'dry steppe'),
+        ((temps > 44) & (moist < 48),                   'semi-arid desert'),
+        (temps > 44,                                    'arid desert')
+    )
+
+    regions = np.select([condition for condition, region in conditions], [region for condition, region in conditions], default='none')
+    return regions.tolist()
@@ -1,23 +1,30 @@
 from __future__ import division
 from math import ceil
-import random
-from random import randint as roll
 from collections import defaultdict
+from heapq import heappush, heappop
 from time import time
 from itertools import chain
 
 import libtcodpy as libtcod
 
-from helpers import infinite_defaultdict, libtcod_path_to_list, join_list, ct_collective
+from helpers import infinite_defaultdict, join_list, ct_collective
 from traits import TRAIT_INFO
 import config as g
 import data_importer as data
 
 import it
 import building_info
+import rng
+
+# World-scale decisions draw from the world AI stream (see rng.py)
+roll = rng.world_ai.randint
 
 GOAL_ITEM = 'cheese'
 
+# Aspects of a behavior's cost (see BehaviorBase.costs), which figures weigh according to their traits
+COST_ASPECTS = ('money', 'time', 'distance', 'morality', 'legality')
+INFINITY = float('inf')
+
 
 
 class TestCreature:
@@ -273,6 +280,10 @@ class AmAvailableToAct:
 
 class BehaviorBase:
     ''' The base action class, providing some default methods for other actions '''
+    # Whether get_behavior_location gives the same answer wherever we'd be coming from (None counts as "anywhere"),
+    # which lets the planner estimate travel costs before it knows what comes earlier in a plan
+    location_is_fixed = 0
+
     def __init__(self):
         # Parent will be set later, to the next behavior in line. This will be used to communicate information that needs
         # to be fed between behaviors (e.g. selecting building materials so that the later "Construct" behavior knows
@@ -281,7 +292,7 @@ class BehaviorBase:
         self.checked_for_movement = 0
         self.activated = 0
 
-        self.costs = {'money':0, 'time':0, 'distance':0, 'morality':0, 'legality':0}
+        self.costs = {aspect: 0 for aspect in COST_ASPECTS}
 
         # Requests for information which needs to be generated by other behaviors and passed back to us
         self.requests = {}
@@ -295,10 +306,23 @@ class BehaviorBase:
     def get_behavior_location(self, current_location):
         return roll(0, 10), roll(0, 10)
 
+    def get_location_costs(self, current_location):
+        ''' Costs on top of self.costs which depend on where we'd be coming from - none, unless overwritten '''
+        return {}
+
     def activate(self):
         ''' Any specific behavior needed upon activating - will be overwritten if needed '''
         self.activated = 1
 
+    def get_waiting_days(self):
+        ''' For behaviors which take several days, where most days only add to a progress counter - how many of the
+        coming days are like that, so a fast-forwarding entity can sleep through them (see add_waiting_days) '''
+        return 0
+
+    def add_waiting_days(self, days):
+        ''' Add the progress of days slept through, up to get_waiting_days() of them '''
+        self.behavior_progress += days
+
     def send_response_to_parent(self, response_attribute, response_target):
         ''' If this behavior generates information that a parent behavior may need, look up all ancestors until one matches
             the response_attribute, and set it to response_target'''
@@ -328,25 +352,28 @@ class BuyItem(BehaviorBase):
 
         self.costs['money'] += 50
 
-    def get_behavior_location(self, current_location):
+    def get_closest_seller(self, current_location):
         ''' Find what cities sell the item we want, and then which of those cities is closest '''
         possible_cities = [city for city in g.WORLD.cities if self.item_name in city.object_to_agents_dict]
 
-        closest_city, closest_dist = g.WORLD.get_closest_city(x=current_location[0], y=current_location[1], valid_cities=possible_cities)
-
-        self.costs['distance'] += closest_dist
-        self.costs['time'] += closest_dist
+        return g.WORLD.get_closest_city(x=current_location[0], y=current_location[1], valid_cities=possible_cities)
 
+    def get_behavior_location(self, current_location):
+        closest_city, closest_dist = self.get_closest_seller(current_location)
         self.site = closest_city
 
         return closest_city.x, closest_city.y
 
+    def get_location_costs(self, current_location):
+        closest_city, closest_dist = self.get_closest_seller(current_location)
+        return {'distance': closest_dist, 'time': closest_dist}
+
     def get_name(self):
         return 'buy {0} in {1}'.format(self.item_name, self.site.name)
 
     def take_behavior_action(self):
 
-        target_agent = random.choice([agent for agent in self.site.econ.agents if agent.reaction.is_finished_good and self.item_name in agent.get_sold_objects()])
+        target_agent = rng.world_ai.choice([agent for agent in self.site.econ.agents if agent.reaction.is_finished_good and self.item_name in agent.get_sold_objects()])
         self.entity.creature.buy_object(obj=self.item_name, sell_agent=target_agent, price=target_agent.perceived_values[target_agent.buy_economy][target_agent.sold_commodity_name].center, material=None, create_object=1)
 
         # print target_agent.name, 'just sold', self.item_name, 'to', self.entity.fulltitle(), 'for', target_agent.perceived_values[target_agent.finished_good.name].center
@@ -360,7 +387,7 @@ class BuyItem(BehaviorBase):
 class MoveToLocation(BehaviorBase):
     ''' Specific behavior component for moving to an area.
     Will use road paths if moving from city to city '''
-    def __init__(self, initial_location, target_location, entity, travel_verb='travel'):
+    def __init__(self, initial_location, target_location, entity, travel_verb='travel', full_path=None):
         BehaviorBase.__init__(self)
         self.initial_location = initial_location
         self.target_location = target_location
@@ -369,12 +396,19 @@ class MoveToLocation(BehaviorBase):
 
         self.preconditions = [AmAvailableToAct(self.entity)]
 
-        self.full_path = self.get_best_path(initial_location=self.initial_location, target_location=self.target_location)
+        # The planner passes in the path if it has already found it
+        if full_path is None:
+            full_path = self.get_best_path(initial_location=self.initial_location, target_location=self.target_location)
+        self.full_path = full_path
 
         # Update the cost of this behavior
-        self.costs['time'] += len(self.full_path)
-        self.costs['distance'] += len(self.full_path)
+        for aspect, cost in self.get_path_costs(path_length=len(self.full_path)).iteritems():
+            self.costs[aspect] += cost
 
+    @staticmethod
+    def get_path_costs(path_length):
+        ''' What traveling a path of this many steps costs '''
+        return {'time': path_length, 'distance': path_length}
 
     def get_name(self):
         goal_name = '{0} to {1}'.format(self.travel_verb, g.WORLD.tiles[self.target_location[0]][self.target_location[1]].get_location_description())
@@ -388,8 +422,9 @@ class MoveToLocation(BehaviorBase):
         if (self.entity.wx, self.entity.wy) != self.initial_location:
             self.full_path = self.get_best_path(initial_location=(self.entity.wx, self.entity.wy), target_location=self.target_location)
 
-        # Set the entity's brain to this path
-        self.entity.world_brain.path = self.full_path
+        # Set the entity's brain to this path. Paths are shared with everyone else traveling the same way, and the
+        # entity uses this one up as it goes, so it gets its own copy
+        self.entity.world_brain.path = list(self.full_path)
         self.activated = 1
 
     def take_behavior_action(self):
@@ -403,16 +438,7 @@ class MoveToLocation(BehaviorBase):
             print 'Both {0} and the behavior have no path to take!'.format(self.entity.fulltitle())
 
     def get_best_path(self, initial_location, target_location):
-        ''' Find a path between 2 points, but take roads if both points happen to be cities '''
-        target_site = g.WORLD.tiles[target_location[0]][target_location[1]].site
-        current_site = g.WORLD.tiles[initial_location[0]][initial_location[1]].site
-
-        if target_site in g.WORLD.cities and current_site in g.WORLD.cities and current_site != target_site:
-            full_path = current_site.path_to[target_site][:]
-        else:
-            # Default - use libtcod's A* to create a path to destination
-            libtcod.path_compute(p=g.WORLD.path_map, ox=initial_location[0], oy=initial_location[1], dx=target_location[0], dy=target_location[1])
-            full_path = libtcod_path_to_list(path_map=g.WORLD.path_map)
+        full_path = g.WORLD.get_travel_path(initial_location=initial_location, target_location=target_location)
 
         if not full_path:
             print '{0} -- has no full path to get from {1} to {2}'.format(self.entity.fulltitle(), self.initial_location, self.target_location)
@@ -421,6 +447,8 @@ class MoveToLocation(BehaviorBase):
 
 
 class BringCommodityToLocation(BehaviorBase):
+    location_is_fixed = 1
+
     def __init__(self, commodity, quantity, entity, target_location):
         BehaviorBase.__init__(self)
         self.commodity = commodity
@@ -475,6 +503,9 @@ class GatherCommodityBehavior(BehaviorBase):
 
         return closest_resource_location
 
+    def get_waiting_days(self):
+        return max(self.time_to_gather - self.behavior_progress - 1, 0)
+
     def take_behavior_action(self):
         ''' Increment progress counter, and gather resource if we've toiled long enough '''
         self.behavior_progress += 1
@@ -484,6 +515,9 @@ class GatherCommodityBehavior(BehaviorBase):
 
 
 class DoReaction(BehaviorBase):
+    # Done wherever we happen to be
+    location_is_fixed = 1
+
     def __init__(self, commodity, quantity, entity):
         BehaviorBase.__init__(self)
         self.commodity = commodity
@@ -502,14 +536,14 @@ class DoReaction(BehaviorBase):
 
         ## For consumed items, we mut have enough to fuel the entire reaction
         for commodity_type, quantity in self.reaction.commodities_consumed.iteritems():
-            commodity = random.choice(data.commodity_manager.get_names_of_commodities_of_type(commodity_type=commodity_type))
+            commodity = rng.world_ai.choice(data.commodity_manager.get_names_of_commodities_of_type(commodity_type=commodity_type))
             quantity_needed_for_this_goal = quantity * self.number_of_reactions
             self.consumed_in_this_reaction[commodity] = quantity_needed_for_this_goal
             self.preconditions.append(HaveCommodity(commodity=commodity, quantity=quantity_needed_for_this_goal, entity=entity))
 
         ## For required items, just having the # specified in the yaml is sufficient, and these do not get consumed in the reaction
         for commodity_type, quantity in self.reaction.commodities_required.iteritems():
-            commodity = random.choice(data.commodity_manager.get_names_of_commodities_of_type(commodity_type=commodity_type))
+            commodity = rng.world_ai.choice(data.commodity_manager.get_names_of_commodities_of_type(commodity_type=commodity_type))
             self.preconditions.append(HaveCommodity(commodity=commodity, quantity=quantity, entity=entity))
 
         self.behavior_progress = 0
@@ -540,6 +574,9 @@ class DoReaction(BehaviorBase):
         # Does not need to be done at particular location for now
         return current_location
 
+    def get_waiting_days(self):
+        return max(self.days_of_reaction - self.behavior_progress - 1, 0)
+
     def take_behavior_action(self):
         ''' Increment progress counter, and do reaction if we've toiled long enough '''
         self.behavior_progress += 1
@@ -564,6 +601,8 @@ class DoReaction(BehaviorBase):
 
 class SetupWaitBehavior(BehaviorBase):
     ''' Used when the end goal of an entity is simply to be in an area, due to an issue using the AtLocation state directly as an end goal '''
+    location_is_fixed = 1
+
     def __init__(self, target_location, entity, action):
         BehaviorBase.__init__(self)
         self.target_location = target_location
@@ -587,6 +626,8 @@ class SetupWaitBehavior(BehaviorBase):
 
 
 class UnloadCommoditiesBehavior(BehaviorBase):
+    location_is_fixed = 1
+
     def __init__(self, target_city, entity, commodities):
         BehaviorBase.__init__(self)
         self.target_city = target_city
@@ -613,6 +654,8 @@ class UnloadCommoditiesBehavior(BehaviorBase):
 
 
 class LoadCommoditiesBehavior(BehaviorBase):
+    location_is_fixed = 1
+
     def __init__(self, target_city, entity, commodities):
         BehaviorBase.__init__(self)
         self.target_city = target_city
@@ -640,6 +683,8 @@ class LoadCommoditiesBehavior(BehaviorBase):
 
 
 class ConstructBuilding(BehaviorBase):
+    location_is_fixed = 1
+
     def __init__(self, entity, building, target_site, target_location=None):
         BehaviorBase.__init__(self)
         self.entity = entity
@@ -674,6 +719,10 @@ class ConstructBuilding(BehaviorBase):
     def get_behavior_location(self, current_location):
         return self.target_location
 
+    def get_waiting_days(self):
+        # Construction finishes once progress goes over the total time
+        return max(self.behavior_total_time - self.behavior_progress, 0)
+
     def take_behavior_action(self):
         self.behavior_progress += 1
 
@@ -689,6 +738,8 @@ class ConstructBuilding(BehaviorBase):
 
 
 class MoveIntoBuilding(BehaviorBase):
+    location_is_fixed = 1
+
     def __init__(self, entity, target_building, target_site):
         BehaviorBase.__init__(self)
         self.entity = entity
@@ -714,7 +765,7 @@ class MoveIntoBuilding(BehaviorBase):
 
             # If there are nearby empty buildings, choose one at random
             if nearby_empty_buildings and roll(0, 1):
-                building = random.choice(nearby_empty_buildings)
+                building = rng.world_ai.choice(nearby_empty_buildings)
             # If not, make a building object to send to the parent (but this doesn't actually exist yet - it will be added to a site later)
             else:
                 building = building_info.Building(zone='residential', type_='hideout', template='TEST', construction_material='stone cons materials',
@@ -749,42 +800,212 @@ class MoveIntoBuilding(BehaviorBase):
 
 
 
-def find_actions_leading_to_goals(goal_states, action_path, all_possible_paths):
-    ''' Recursive function to find all possible behaviors which can be undertaken to get to a particular goal. This
-    function will drill down, checking behavior options and goal states, and return all valid paths to that goal that it can find.
+def get_travel_lower_bound(initial_location, target_location):
+    ''' Paths move one tile per step, diagonals included, so none can be shorter than this '''
+    return max(abs(target_location[0] - initial_location[0]), abs(target_location[1] - initial_location[1]))
+
+
+def get_weighted_cost(costs, cost_multipliers):
+    return sum(cost * cost_multipliers[aspect] for aspect, cost in costs.iteritems())
+
+
+def linked_to_list(linked):
+    ''' The items of a linked list of (item, rest) pairs, in order '''
+    items = []
+    while linked is not None:
+        item, linked = linked
+        items.append(item)
+    return items
+
+
+class Planner:
+    ''' Finds the cheapest sequence of behaviors an entity can take to reach a goal state.
+
+    Like the old exhaustive search, this works backwards from the goal: each behavior option for the first goal state on
+    the stack is put in front of the path, and its unmet conditions are pushed onto the stack. But partial paths are
+    expanded cheapest first, by a lower bound on what any path built from them would cost:
+     - what the behaviors so far cost,
+     - the cheapest way to reach each goal state still on the stack, not counting travel. These are worked out once per
+       goal state, and goal states with no way to reach them are dropped before anything is built on top of them,
+     - and the travel we already know about - the straight-line (chebyshev) distance, which no real path can beat,
+       between behaviors whose locations are fixed, and from where the entity is now to the first of them.
+
+    Complete paths come out of the search cheapest first. Their travel is then estimated by straight-line distance for
+    every leg, and real paths are only found for the ones which could still be the cheapest. MoveToLocation behaviors
+    are only created for the path that's chosen '''
+    def __init__(self, entity, cost_multipliers, max_paths=None):
+        self.entity = entity
+        self.cost_multipliers = cost_multipliers
+        # How many complete paths to consider at most, when their costs don't rule the rest out
+        self.max_paths = g.GOAP_MAX_CANDIDATE_PATHS if max_paths is None else max_paths
+        # Weighted cost of a single step of travel
+        self.step_cost = get_weighted_cost(costs=MoveToLocation.get_path_costs(path_length=1), cost_multipliers=cost_multipliers)
+
+        ## Memoized for the length of the search
+        # goal state : cheapest cost of reaching it, not counting travel
+        self.goal_costs = {}
+        # behavior : [its unmet conditions]
+        self.unmet_conditions = {}
+        # (behavior, location we'd be coming from) : where it takes place
+        self.behavior_locations = {}
+        # (behavior, location we'd be coming from) : weighted cost of its get_location_costs()
+        self.location_costs = {}
+
+    def get_unmet_conditions(self, behavior):
+        unmet_conditions = self.unmet_conditions.get(behavior)
+        if unmet_conditions is None:
+            unmet_conditions = self.unmet_conditions[behavior] = behavior.get_unmet_conditions()
+        return unmet_conditions
+
+    def get_behavior_cost(self, behavior):
+        return get_weighted_cost(costs=behavior.costs, cost_multipliers=self.cost_multipliers)
+
+    def get_goal_cost(self, goal_state):
+        ''' Cheapest cost of reaching the goal state, not counting travel - infinite if there's no way to reach it '''
+        cost = self.goal_costs.get(goal_state)
+        if cost is None:
+            cost = INFINITY
+            for behavior in goal_state.behaviors_to_accomplish:
+                behavior_cost = self.get_behavior_cost(behavior) + sum(self.get_goal_cost(condition) for condition in self.get_unmet_conditions(behavior))
+                cost = min(cost, behavior_cost)
+            self.goal_costs[goal_state] = cost
+        return cost
+
+    def get_behavior_location(self, behavior, current_location):
+        key = (behavior, current_location)
+        if key not in self.behavior_locations:
+            self.behavior_locations[key] = behavior.get_behavior_location(current_location=current_location)
+        return self.behavior_locations[key]
+
+    def get_location_cost(self, behavior, current_location):
+        key = (behavior, current_location)
+        if key not in self.location_costs:
+            self.location_costs[key] = get_weighted_cost(costs=behavior.get_location_costs(current_location=current_location), cost_multipliers=self.cost_multipliers)
+        return self.location_costs[key]
+
+    def get_travel_lower_bound(self, travel_steps, first_location):
+        ''' Lower bound on the cost of travel for a path, given a lower bound on the steps between its behaviors, and the
+        first place it's known to go to (if any) '''
+        if first_location is not None:
+            travel_steps += get_travel_lower_bound((self.entity.wx, self.entity.wy), first_location)
+        return self.step_cost * travel_steps
+
+    def iter_behavior_paths(self, goal_state):
+        ''' Yield (behavior path, cost not counting travel, lower bound on the total cost) for the ways of reaching the
+        goal state, in order of that lower bound '''
+        goal_cost = self.get_goal_cost(goal_state)
+        if goal_cost == INFINITY:
+            return
+
+        # Goal stacks and behavior paths are linked lists of (item, rest) pairs, so extending one doesn't copy it.
+        # Entries are (lower bound, -order pushed, cost so far, cost of the goal stack, steps of known travel,
+        # first location, goal stack, behavior path), where the first location is where the path so far first needs us
+        # to be, if its behaviors up to there have fixed locations. Ties go to the most recently pushed, so the search
+        # heads for complete paths rather than widening out
+        queue = [(goal_cost, 0, 0, goal_cost, 0, None, (goal_state, None), None)]
+        pushed = 0
+        while queue:
+            lower_bound, _, cost, stack_cost, travel_steps, first_location, goal_stack, behavior_path = heappop(queue)
+            if goal_stack is None:
+                yield linked_to_list(behavior_path), cost, lower_bound
+                continue
+
+            goal_state, remaining_goals = goal_stack
+            remaining_cost = stack_cost - self.get_goal_cost(goal_state)
+            # Each behavior option is a different way the goal could be reached
+            for behavior in goal_state.behaviors_to_accomplish:
+                # The behavior's unmet conditions are evaluated before the goals left over from earlier
+                new_stack = remaining_goals
+                new_stack_cost = remaining_cost
+                for condition in reversed(self.get_unmet_conditions(behavior)):
+                    new_stack = (condition, new_stack)
+                    new_stack_cost += self.get_goal_cost(condition)
+                if new_stack_cost == INFINITY:
+                    continue
+
+                # This behavior goes at the front of the path
+                new_travel_steps, new_first_location = travel_steps, first_location
+                if not behavior.location_is_fixed:
+                    new_first_location = None
+                else:
+                    location = self.get_behavior_location(behavior=behavior, current_location=None)
+                    if location:
+                        if first_location is not None and first_location != location:
+                            new_travel_steps += get_travel_lower_bound(location, first_location)
+                        new_first_location = location
+
+                new_cost = cost + self.get_behavior_cost(behavior)
+                new_lower_bound = new_cost + new_stack_cost + self.get_travel_lower_bound(travel_steps=new_travel_steps, first_location=new_first_location)
+                pushed += 1
+                heappush(queue, (new_lower_bound, -pushed, new_cost, new_stack_cost, new_travel_steps, new_first_location, new_stack, (behavior, behavior_path)))
+
+    def get_travel_legs(self, behavior_path):
+        ''' [(index of the behavior, location traveled from, location traveled to)] for each behavior in the path which
+        we'd need to travel to first, and the weighted cost of the behaviors' location costs - which can only be known
+        once we know where each behavior would be coming from '''
+        legs = []
+        location_cost = 0
+        current_location = self.entity.wx, self.entity.wy
+        for i, behavior in enumerate(behavior_path):
+            location_cost += self.get_location_cost(behavior=behavior, current_location=current_location)
+            target_location = self.get_behavior_location(behavior=behavior, current_location=current_location)
+            ## Only need to worry about moving if the behavior A) Requires movement and B) is different than the current location
+            if target_location and (target_location != current_location):
+                legs.append((i, current_location, target_location))
+                # Update "current_location" (even though this will be in the future) since we will need to know whether we'll need to move from this spot to the next behavior
+                current_location = target_location
+        return legs, location_cost
+
+    def add_travel(self, behavior_path, legs):
+        ''' The behavior path, with a MoveToLocation before each behavior we'd need to travel to '''
+        moves = {i: MoveToLocation(initial_location=initial_location, target_location=target_location, entity=self.entity,
+                                   full_path=g.WORLD.get_travel_path(initial_location, target_location))
+                 for i, initial_location, target_location in legs}
+
+        behavior_list = []
+        for i, behavior in enumerate(behavior_path):
+            if i in moves:
+                behavior_list.append(moves[i])
+            behavior_list.append(behavior)
+        return behavior_list
+
+    def find_best_behavior_path(self, goal_state):
+        ''' The cheapest behavior path to the goal state (with travel added), and its cost - or (None, None) if there isn't one '''
+        paths = self.iter_behavior_paths(goal_state)
+        next_path = next(paths, None)
+        paths_considered = 0
 
-    :param goal_states: <list> containing <any of the GoalStates defined in this module> - The state of the world that the goal seeker would like to change
-    :param action_path: <list> contianing the current sequence of <BehaviorBase> behaviors to accomplish the goal - since the function is recursive, it grows on each call
-    :param all_possible_paths: <list> containing sequences of <BehaviorBase> behaviors which have reached a valid conclusion (e.g. they have drilled down to states with no unmet conditions)
-    :return: a <list> containing <lists> of behavior sequences which have reached a valid conclusion
-    '''
-    # TODO - using pop(0) is inefficient, consider using deques rather than lists throughout the function
+        # Entries are (lower bound on the total cost, order added, whether the bound is the exact cost, cost not counting travel, behavior path, travel legs)
+        candidates = []
+        while 1:
+            # Paths come out in order of their lower bounds, so once one can't beat the best candidate, neither can the rest
+            while next_path is not None and paths_considered < self.max_paths and (not candidates or next_path[2] < candidates[0][0]):
+                behavior_path, cost, lower_bound = next_path
+                legs, location_cost = self.get_travel_legs(behavior_path)
+                # Location costs are never negative, so the path's lower bound still holds
+                cost += location_cost
+                travel_steps = sum(get_travel_lower_bound(initial_location, target_location) for i, initial_location, target_location in legs)
+                heappush(candidates, (max(lower_bound, cost + self.step_cost * travel_steps), paths_considered, 0, cost, behavior_path, legs))
 
-    # Pop the first goal in the stack to evaluate
-    goal_state = goal_states.pop(0)
+                paths_considered += 1
+                next_path = next(paths, None)
 
-    # Loop through each behavior option. These are different possibilities for how a goal can be completed, meaning
-    # there may be multiple valid paths an agent can take to reach a goal
-    for behavior_option in goal_state.behaviors_to_accomplish:
-        # Find goal states which need to be accomplished for the behavior to be valid. Then add the current set of goal
-        # states to the end of this list - ensuring that these sub-goals get evaluated first
-        unmet_goal_states = behavior_option.get_unmet_conditions()
-        unmet_goal_states.extend(goal_states)
+            if not candidates:
+                return None, None
 
-        # The new action path is the old action path with the new one inserted at the beginning
-        current_action_path = [behavior_option] + action_path  # TODO - this is making a copy of the list each time - evaluate if needed
+            lower_bound, order, is_exact, cost, behavior_path, legs = heappop(candidates)
+            if is_exact:
+                return self.add_travel(behavior_path=behavior_path, legs=legs), lower_bound
 
-        # If there are unment goal states (either as prerequisites to this behavior, or "left over" from previous calls
-        # of this function, recursively call this function to find valid behavior paths.
-        if unmet_goal_states:
-            find_actions_leading_to_goals(goal_states=unmet_goal_states, action_path=current_action_path, all_possible_paths=all_possible_paths)
+            # Find the real paths, and put it back in line with its exact cost
+            travel_steps = sum(len(g.WORLD.get_travel_path(initial_location, target_location)) for i, initial_location, target_location in legs)
+            heappush(candidates, (cost + self.step_cost * travel_steps, order, 1, cost, behavior_path, legs))
 
-        # If all conditions are met, then this behavior can be accomplished, so the current set of behavior paths get
-        # added to the master list of valid behavior paths to reach this goal
-        elif not unmet_goal_states:
-            all_possible_paths.append(current_action_path)
 
-    return all_possible_paths
+def find_best_behavior_path(goal_state, entity, cost_multipliers):
+    ''' Plan the cheapest way for the entity to reach the goal state, weighing the aspects of each behavior's cost (time,
+    money, morality...) by cost_multipliers. Returns the behavior path, with any travel added, and its cost '''
+    return Planner(entity=entity, cost_multipliers=cost_multipliers).find_best_behavior_path(goal_state=goal_state)
 
 
 
@@ -833,72 +1054,9 @@ def find_actions_leading_to_goals(goal_states, action_path, all_possible_paths):
 #     return all_possible_paths
 
 
-def check_paths_for_movement(entity, behavior_lists):
-    ''' This will adjust an input list of behavior lists to account for movement between behaviors. Any additional
-        behaviors required by the movement behavior will be evaluated before the movement '''
-    all_behavior_lists_worked = []
-
-    for behavior_list in behavior_lists:
-        # Reset current_location to be the entity's current location for each behavior tree in the list
-        current_location = entity.wx, entity.wy
-        behavior_list_worked = []
-
-        for behavior in behavior_list:
-            target_location = behavior.get_behavior_location(current_location=current_location)
-            ## Only need to worry about moving if the behavior A) Requires movement and B) is different than the current location
-            if target_location and (target_location != current_location):
-                behavior_list_worked.append(MoveToLocation(initial_location=current_location, target_location=target_location, entity=entity))
-                # Update "current_location" (even though this will be in the future) since we will need to know whether we'll need to move from this spot to the next behavior
-                current_location = target_location
-            # Whether or not we move, we must make sure to add the behavior back into our adjusted list
-            behavior_list_worked.append(behavior)
-
-        all_behavior_lists_worked.append(behavior_list_worked)
-
-    return all_behavior_lists_worked
-
-
-def get_behavior_list_costs(behavior_lists):
-    ''' Given a list of behavior lists, calculate the associated costs associated with each behavior list'''
-    all_behaviors_costed = []
-
-    for behavior_list in behavior_lists:
-        total_costs = defaultdict(int)
-        # Cost each aspect (time, distance, etc...) of each behavior
-        for behavior in behavior_list:
-            for aspect, cost in behavior.costs.iteritems():
-                total_costs[aspect] += cost
-
-        all_behaviors_costed.append((behavior_list, total_costs))
-
-    return all_behaviors_costed
-
-
-
-def get_costed_behavior_paths(goal_state, entity):
-    ''' Find a set of behavior paths to get to a goal, insert any required movements, cost the resulting behavior lists, and return the costed lists '''
-    # Find possible actions that can be taken to get there
-    all_possible_behavior_paths = find_actions_leading_to_goals(goal_states=[goal_state], action_path=[], all_possible_paths=[])
-
-    # Account for movement (eventually, account for movement subtrees?)
-    behavior_list_including_movement = check_paths_for_movement(entity=entity, behavior_lists=all_possible_behavior_paths)
-
-    ## DEBUG PRINT GOAL PATHS
-    # if 'load' not in goal_state.get_name():
-    #     print goal_state.get_name()
-    #     for path in behavior_list_including_movement:
-    #         print [b.get_name() for b in path]
-    #     print ''
-
-    # With movement now factored in, get costs
-    behavior_lists_costed = get_behavior_list_costs(behavior_lists=behavior_list_including_movement)
-
-    return behavior_lists_costed
-
-
 def set_behavior_parents(behavior_path):
     ''' Sets the "parent" behavior for each behavior in a list of behaviors. The parent is the behavior that is next in
-        sequence. This is used so that a child behavior can set some info for a parent (since find_actions_leading_to_goals
+        sequence. This is used so that a child behavior can set some info for a parent (since the Planner
         works backwards, sometimes a parent behavior won't have information dependant on a child behavior to set)'''
     last_behavior_index = len(behavior_path) -1
     for i, behavior in enumerate(behavior_path):
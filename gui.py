@@ -1002,6 +1002,8 @@ def show_civs(world):
 
 def economy_tab(world, city):
     agent_index = 0
+    # Have the agents keep their last_turn logs while we're looking at them
+    city.econ.log_agent_actions = 1
 
     key_pressed = None
     event = libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse)
@@ -1127,6 +1129,8 @@ def economy_tab(world, city):
         event = libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse)
         key_pressed = g.game.get_key(key)
 
+    city.econ.log_agent_actions = 0
+
 
 
 
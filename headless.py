@@ -0,0 +1,190 @@
+''' Running the world without a window - for servers, benchmarks and regression runs.
+
+From the command line:
+
+    python headless.py --seed 1 --days 365 --json
+
+Or from code:
+
+    stats = headless.run_world(seed=1, days=365, sink=headless.print_sink)
+
+The simulation only reaches the outside world through g.game, so a HeadlessGame stands in for the usual Game: messages are
+passed to a pluggable sink (or dropped), and there's nothing to draw. libtcod is still used for the world's heightmaps,
+noise and pathfinding, but no console is ever created '''
+from __future__ import division
+import argparse
+from collections import OrderedDict
+import json
+import logging
+import random
+import time
+
+import libtcodpy as libtcod
+import config as g
+import data_importer as data
+import history as hist
+import it
+import profiler
+import rng
+
+
+##### Message sinks - any callable taking (message, color) will do #####
+
+def print_sink(message, color):
+    print message
+
+
+def log_sink(message, color):
+    logging.info(message)
+
+
+MESSAGE_SINKS = {'drop': None, 'print': print_sink, 'log': log_sink}
+
+
+class HeadlessRenderHandler:
+    ''' Stands in for it.RenderHandler - there's nothing to draw '''
+    def progressbar_screen(self, header, current_action, min_val, max_val, background_text=None):
+        logging.debug('{0}: {1} ({2}/{3})'.format(header, current_action, min_val, max_val))
+
+    def render_all(self, do_flush=1):
+        pass
+
+
+class HeadlessGame(it.Game):
+    ''' Stands in for it.Game while running without a window. Messages are passed to sink(message, color) - or if
+    there's no sink, they're muted, so the simulation doesn't spend any time formatting them either '''
+    def __init__(self, sink=None):
+        self.interface = None
+        self.render_handler = HeadlessRenderHandler()
+
+        self.state = 'worldgen'
+        self.map_scale = 'world'
+        self.world_map_display_type = 'normal'
+
+        self.camera = it.Camera(width_in_characters=g.CAMERA_WIDTH, height=g.CAMERA_HEIGHT)
+
+        self.msgs = []
+        self.sink = sink
+        self.messages_muted = 0 if sink else 1
+        self.message_count = 0
+
+        self.quit_game = 0
+
+        self.msg_index = 0
+
+    def add_message(self, new_msg, color=libtcod.white):
+        if self.messages_muted:
+            return
+
+        self.message_count += 1
+        self.sink(new_msg, color)
+
+    def switch_map_scale(self, map_scale):
+        # No buttons to swap out
+        self.map_scale = map_scale
+
+    def add_worldgen_buttons(self, world):
+        pass
+
+    def add_play_buttons(self):
+        pass
+
+
+def start_game(seed, sink=None):
+    ''' Set up a HeadlessGame as g.game, with freshly seeded random generators '''
+    g.init()
+    g.game = HeadlessGame(sink=sink)
+    # History's event store is module-level, so clear out anything from an earlier run
+    hist.set_event_store(hist.EventStore())
+    # Normally loaded when the game starts
+    if not hasattr(data, 'commodity_manager'):
+        data.import_data()
+
+    rng.seed_all(seed)
+
+
+def generate_world(width, height, timings):
+    ''' Generate a world map and set up its civilizations, recording how long each step took in timings '''
+    begin = time.time()
+    g.WORLD = it.World(width, height)
+    g.WORLD.generate()
+    timings['generate_map'] = time.time() - begin
+
+    begin = time.time()
+    g.WORLD.setup_civilizations()
+    timings['setup_civilizations'] = time.time() - begin
+
+    return g.WORLD
+
+
+def run_world(seed=None, days=365, width=g.WORLD_WIDTH, height=g.WORLD_HEIGHT, sink=None, fast_forward=None, profile=0):
+    ''' Generate a world from a seed, set up its civilizations, and simulate it for a number of days.
+    Returns a dict of timings (in seconds) and summary stats about the resulting world. With profile, the
+    per-phase timings from profiler.py are included too '''
+    if seed is None:
+        seed = random.randrange(2**31)
+
+    start_game(seed=seed, sink=sink)
+    if profile:
+        profiler.reset()
+        profiler.set_enabled(1)
+
+    timings = OrderedDict()
+    generate_world(width=width, height=height, timings=timings)
+    timings['simulate'] = g.WORLD.run_days(days=days, fast_forward=fast_forward)
+
+    world = g.WORLD
+    stats = OrderedDict()
+    stats['seed'] = seed
+    stats['width'] = width
+    stats['height'] = height
+    stats['days'] = days
+    stats['timings'] = timings
+    stats['days_per_second'] = days / max(timings['simulate'], .001)
+    stats['date'] = world.time_cycle.date_to_text(world.time_cycle.get_current_date())
+    stats['figures'] = len(world.all_figures)
+    stats['important_figures'] = len(world.important_figures)
+    stats['cultures'] = len(world.cultures)
+    stats['factions'] = len(world.factions)
+    stats['cities'] = len(world.cities)
+    stats['sites'] = {type_: len(sites) for type_, sites in world.site_index.iteritems()}
+    stats['historical_events'] = len(hist.historical_events)
+    stats['messages'] = g.game.message_count
+    if profile:
+        stats['phases'] = profiler.get_report()['phases']
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a world and simulate it without a window')
+    parser.add_argument('--seed', type=int, default=None, help='seed for world generation and the simulation (random if not given)')
+    parser.add_argument('--days', type=int, default=365, help='number of days to simulate')
+    parser.add_argument('--width', type=int, default=g.WORLD_WIDTH)
+    parser.add_argument('--height', type=int, default=g.WORLD_HEIGHT)
+    parser.add_argument('--messages', choices=sorted(MESSAGE_SINKS), default='drop', help='where game messages go')
+    parser.add_argument('--fast-forward', type=int, choices=(0, 1), default=None,
+                        help='run in fast-forward mode (defaults to config.FAST_FORWARD_HISTORY)')
+    parser.add_argument('--profile', action='store_true', help='time each phase of the simulation (see profiler.py)')
+    parser.add_argument('--json', action='store_true', help='print the stats as JSON')
+    args = parser.parse_args()
+
+    stats = run_world(seed=args.seed, days=args.days, width=args.width, height=args.height,
+                      sink=MESSAGE_SINKS[args.messages], fast_forward=args.fast_forward, profile=args.profile)
+
+    if args.json:
+        print json.dumps(stats, indent=2)
+    else:
+        for name, value in stats.iteritems():
+            if name == 'timings':
+                for step, seconds in value.iteritems():
+                    print '{0:>20}: {1:.2f} seconds'.format(step, seconds)
+            elif name == 'phases':
+                for line in profiler.format_report():
+                    print '{0:>20}  {1}'.format('', line)
+            else:
+                print '{0:>20}: {1}'.format(name, value)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from __future__ import division
 import math
+from array import array
 import libtcodpy as libtcod
 import random
 from random import randint as roll
@@ -10,6 +11,21 @@ from pattern.en import pluralize, conjugate, referenced
 # Clever solution to making dicts several levels deep as detailed here http://stackoverflow.com/questions/4178249/infinitely-nested-dictionary-in-python
 infinite_defaultdict = lambda: defaultdict(infinite_defaultdict)
 
+NAN = float('nan')
+
+def pack_numbers(values):
+    ''' Pack a list of numbers into a typed array - ints if they all fit in one, otherwise floats (with NaN for None).
+    Used to keep long numeric histories compact in saved worlds '''
+    if all(type(value) is int and -2**31 <= value < 2**31 for value in values):
+        return array('i', values)
+    return array('d', [NAN if value is None else value for value in values])
+
+def unpack_numbers(values):
+    ''' Inverse of pack_numbers '''
+    if values.typecode == 'd':
+        return [None if value != value else value for value in values]
+    return values.tolist()
+
 ## For individual facing information
 NEIGHBORS = ( (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1) )
 COMPASS = ('north', 'northeast', 'east', 'southeast', 'south', 'southwest', 'west', 'northwest')
@@ -1,33 +1,298 @@
 from __future__ import division
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
 import config as g
 from helpers import determine_commander, join_list
 
-historical_events = []
-event_id = 0
 
-class HistoricalEvent:
+class EventStore:
+    ''' Append-only store of every historical event, indexed by id.
+
+    Each event's date, location, type, base importance and participants (the entities from its get_entities()) are
+    kept in packed arrays, along with indexes of the events by date, by location and by entity. Most event types
+    (those marked compact) don't keep their objects around once they're in the columns - an event object is rebuilt
+    from its columns and a small tuple of details when something looks it up (e.g. to describe() it), and the most
+    recently used ones are cached.
+
+    Events are added to the columns ("sealed") in id order the next time the store is queried, and until then the event
+    object itself is kept '''
+    def __init__(self):
+        ## Columns, indexed by event id
+        # Day numbers (see TimeCycle)
+        self.dates = array('i')
+        self.xs = array('i')
+        self.ys = array('i')
+        self.type_codes = array('B')
+        self.base_importances = array('i')
+        # Entity ids of event i's participants are participants[participant_starts[i]:participant_starts[i + 1]]
+        self.participant_starts = array('i', [0])
+        self.participants = array('i')
+        # Whatever else a compact event needs to be rebuilt (see HistoricalEvent.get_details) - None for most
+        self.details = []
+
+        # Type name and event class for each type code
+        self.type_names = []
+        self.type_classes = []
+        # Entities taking part in events, by entity id
+        self.entities = []
+        self.entity_ids = {}
+
+        ## Indexes
+        # Event ids sorted by date, and the matching dates
+        self.ids_by_date = array('i')
+        self.sorted_dates = array('i')
+        # (x, y): ids of the events there
+        self.location_index = {}
+        # entity id: ids of the events it took part in
+        self.entity_index = {}
+
+        # Event objects which haven't been sealed yet, or which aren't compact
+        self.live_events = {}
+        # Most recently used rebuilt events
+        self.cached_events = OrderedDict()
+
+        self.event_count = 0
+        self.sealed_count = 0
+
+    def __len__(self):
+        return self.event_count
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['cached_events'] = OrderedDict()
+        return state
+
+    def add(self, event):
+        ''' Add a new event, returning its id '''
+        event_id = self.event_count
+        self.live_events[event_id] = event
+        self.event_count += 1
+        return event_id
+
+    def __getitem__(self, event_id):
+        event = self.live_events.get(event_id)
+        if event is not None:
+            return event
+
+        event = self.cached_events.pop(event_id, None)
+        if event is None:
+            if not 0 <= event_id < self.sealed_count:
+                raise IndexError('no historical event {0}'.format(event_id))
+            event = self.rebuild_event(event_id)
+        # Most recently used go last
+        self.cached_events[event_id] = event
+        if len(self.cached_events) > g.HISTORY_EVENT_CACHE_SIZE:
+            self.cached_events.popitem(last=False)
+        return event
+
+    def get_entity_id(self, entity):
+        entity_id = self.entity_ids.get(entity)
+        if entity_id is None:
+            entity_id = self.entity_ids[entity] = len(self.entities)
+            self.entities.append(entity)
+        return entity_id
+
+    def get_type_code(self, event):
+        if event.type_ not in self.type_names:
+            self.type_names.append(event.type_)
+            self.type_classes.append(event.__class__)
+        return self.type_names.index(event.type_)
+
+    def seal_new_events(self):
+        ''' Add events created since the last call to the columns and indexes '''
+        sorted_dates = self.sorted_dates
+
+        for event_id in xrange(self.sealed_count, self.event_count):
+            event = self.live_events[event_id]
+            x, y = event.location
+
+            self.dates.append(event.date)
+            self.xs.append(x)
+            self.ys.append(y)
+            self.type_codes.append(self.get_type_code(event))
+            self.base_importances.append(event.base_importance)
+
+            for entity in event.get_entities():
+                entity_id = self.get_entity_id(entity)
+                self.participants.append(entity_id)
+                self.entity_index.setdefault(entity_id, array('i')).append(event_id)
+            self.participant_starts.append(len(self.participants))
+
+            self.location_index.setdefault((x, y), array('i')).append(event_id)
+            # Events nearly always happen "today", so this is almost always an append
+            position = bisect_right(sorted_dates, event.date)
+            sorted_dates.insert(position, event.date)
+            self.ids_by_date.insert(position, event_id)
+
+            if event.compact:
+                self.details.append(event.get_details())
+                del self.live_events[event_id]
+            else:
+                self.details.append(None)
+
+        self.sealed_count = self.event_count
+
+    def rebuild_event(self, event_id):
+        ''' Create the object for a sealed compact event from its columns '''
+        type_code = self.type_codes[event_id]
+        event_class = self.type_classes[type_code]
+
+        event = event_class.__new__(event_class)
+        event.id_ = event_id
+        event.date = self.dates[event_id]
+        event.location = (self.xs[event_id], self.ys[event_id])
+        event.type_ = self.type_names[type_code]
+        event.base_importance = self.base_importances[event_id]
+        event.restore_details(participants=self.get_participants(event_id), details=self.details[event_id])
+
+        return event
+
+    ## Queries on the columns - these don't need to rebuild any event objects
+    def get_participants(self, event_id):
+        self.seal_new_events()
+        entities = self.entities
+        return [entities[entity_id] for entity_id in self.participants[self.participant_starts[event_id]:self.participant_starts[event_id + 1]]]
+
+    def get_type(self, event_id):
+        self.seal_new_events()
+        return self.type_names[self.type_codes[event_id]]
+
+    def calculate_importance(self, event_id):
+        ''' Base importance plus the infamy of everyone involved '''
+        return self.base_importances[event_id] + sum(entity.infamy for entity in self.get_participants(event_id))
+
+    def get_event_ids_at(self, x, y):
+        self.seal_new_events()
+        return self.location_index.get((x, y), ())
+
+    def get_event_ids_for_entity(self, entity):
+        self.seal_new_events()
+        entity_id = self.entity_ids.get(entity)
+        return () if entity_id is None else self.entity_index[entity_id]
+
+    def get_event_ids_between(self, first_day, last_day=None):
+        ''' Ids of the events from date first_day to last_day (inclusive - open-ended if last_day is None), in date order '''
+        self.seal_new_events()
+        start = bisect_left(self.sorted_dates, first_day)
+        end = len(self.ids_by_date) if last_day is None else bisect_right(self.sorted_dates, last_day)
+        return self.ids_by_date[start:end]
+
+    def get_events_since(self, first_day, event_ids):
+        ''' Which of event_ids (any collection supporting "in") happened on or after date first_day '''
+        self.seal_new_events()
+        # Check whichever is smaller - the recent events, or the events we're asked about
+        start = bisect_left(self.sorted_dates, first_day)
+        if len(self.ids_by_date) - start < len(event_ids):
+            return [event_id for event_id in self.ids_by_date[start:] if event_id in event_ids]
+
+        dates = self.dates
+        return [event_id for event_id in event_ids if dates[event_id] >= first_day]
+
+
+historical_events = EventStore()
+
+
+def set_event_store(store):
+    ''' Replace the store of historical events - for a new world, or a loaded one '''
+    global historical_events
+    historical_events = store
+    reset_importance_index()
+
+
+##### Importance index #####
+# Each event's importance (its base importance plus the infamy of everyone involved), kept up to date as infamy changes,
+# so that figures sharing knowledge don't have to add it all up again every time they meet.
+# Events are indexed in id order the next time the index is used
+# event id: importance
+event_importance = {}
+# Ids of the indexed events important enough to be shared (see config.IMPORTANT_EVENT_IMPORTANCE)
+important_event_ids = set()
+# Events with ids below this have been indexed
+indexed_event_count = 0
+
+
+def reset_importance_index():
+    ''' Clear the index - it's rebuilt the next time it's used '''
+    global indexed_event_count
+    event_importance.clear()
+    important_event_ids.clear()
+    indexed_event_count = 0
+
+
+def index_new_events():
+    ''' Add any events created since the last call to the index '''
+    global indexed_event_count
+    historical_events.seal_new_events()
+    for event_id in xrange(indexed_event_count, len(historical_events)):
+        set_event_importance(event_id, historical_events.calculate_importance(event_id))
+
+    indexed_event_count = len(historical_events)
+
+
+def set_event_importance(event_id, importance):
+    event_importance[event_id] = importance
+    if importance >= g.IMPORTANT_EVENT_IMPORTANCE:
+        important_event_ids.add(event_id)
+    else:
+        important_event_ids.discard(event_id)
+
+
+def entity_infamy_changed(entity, amount):
+    ''' Called when an entity's infamy changes, to update the importance of the events it's involved in '''
+    for event_id in historical_events.get_event_ids_for_entity(entity):
+        # Events which haven't been indexed yet will be added up from scratch
+        if event_id < indexed_event_count:
+            set_event_importance(event_id, event_importance[event_id] + amount)
+
+
+def get_important_events(event_ids):
+    ''' The set of events out of event_ids (any collection supporting "in") which are important enough to be shared '''
+    index_new_events()
+    if len(important_event_ids) < len(event_ids):
+        return set(event_id for event_id in important_event_ids if event_id in event_ids)
+    return important_event_ids.intersection(event_ids)
+
+
+def get_events_by_importance(event_ids):
+    ''' The important events out of event_ids, most important first '''
+    return sorted(get_important_events(event_ids), key=lambda event_id: (-event_importance[event_id], event_id))
+
+
+class HistoricalEvent(object):
+    type_ = None
+    # Most events (marriages, births, traveling) have low base importance - but the event may be considered important if the people in it are famous
+    base_importance = 0
+    # Whether the store can drop this type's objects, and rebuild them from its columns plus get_details()
+    compact = False
+
     def __init__(self, date, location):
-        ''' The base HistoricalEvent class that all others inherit from '''
-        global event_id
+        ''' The base HistoricalEvent class that all others inherit from. Subclasses set up everything get_entities()
+        and get_details() use before calling this, since the event can be sealed into the store from here on '''
         self.date = date
         self.location = location
 
-        # Most events (marriages, births, traveling) have low base importance - but the event may be considered important if the people in it are famous
-        self.base_importance = 0
-        self.id_ = event_id
-        event_id += 1
+        self.id_ = historical_events.add(self)
 
-        g.WORLD.tiles[self.location[0]][self.location[1]].associated_events.add(self.id_)
-        self.save_event()
+    def get_details(self):
+        ''' Anything besides the date, location, type, base importance and get_entities() needed to rebuild a compact event '''
+        return None
 
-    def save_event(self):
-        historical_events.append(self)
+    def restore_details(self, participants, details):
+        ''' Set up a rebuilt compact event from its participants (as returned by get_entities) and get_details() '''
+        pass
 
     def describe_location(self):
         return g.WORLD.tiles[self.location[0]][self.location[1]].get_location_description()
 
     def get_importance(self):
-        ''' Get importance of the event. Uses get_entities() which returns all associated entities, defined in each individual event '''
+        ''' Importance of the event, from the importance index '''
+        index_new_events()
+        return event_importance[self.id_]
+
+    def calculate_importance(self):
+        ''' Add up the importance of the event. Uses get_entities() which returns all associated entities, defined in each individual event '''
         importance = self.base_importance
         for entity in self.get_entities():
             importance += entity.infamy
@@ -35,10 +300,12 @@ class HistoricalEvent:
         return importance
 
 class Marriage(HistoricalEvent):
+    type_ = 'marriage'
+    compact = True
+
     def __init__(self, date, location, figures):
-        HistoricalEvent.__init__(self, date, location)
         self.figures = figures
-        self.type_ = 'marriage'
+        HistoricalEvent.__init__(self, date, location)
 
         for figure in self.get_entities():
             figure.add_associated_event(event_id=self.id_)
@@ -50,12 +317,17 @@ class Marriage(HistoricalEvent):
     def get_entities(self):
         return self.figures
 
+    def restore_details(self, participants, details):
+        self.figures = participants
+
 class Birth(HistoricalEvent):
+    type_ = 'birth'
+    compact = True
+
     def __init__(self, date, location, parents, child):
-        HistoricalEvent.__init__(self, date, location)
         self.parents = parents
         self.child = child
-        self.type_ = 'birth'
+        HistoricalEvent.__init__(self, date, location)
 
         for figure in self.get_entities():
             figure.add_associated_event(event_id=self.id_)
@@ -67,29 +339,45 @@ class Birth(HistoricalEvent):
     def get_entities(self):
         return self.parents + [self.child]
 
+    def restore_details(self, participants, details):
+        self.parents = participants[:-1]
+        self.child = participants[-1]
+
 class Death(HistoricalEvent):
+    type_ = 'death'
+    compact = True
+
     def __init__(self, date, location, figure, reason):
-        HistoricalEvent.__init__(self, date, location)
         self.figure = figure
         self.reason = reason
+        HistoricalEvent.__init__(self, date, location)
 
     def describe(self):
         des = 'On {0}, {1} died due to {2}'.format(g.WORLD.time_cycle.date_to_text(self.date), self.figure.fulltitle(), self.reason)
         return des
 
     def get_entities(self):
-        return self.figure
+        return [self.figure]
+
+    def get_details(self):
+        return self.reason
+
+    def restore_details(self, participants, details):
+        self.figure = participants[0]
+        self.reason = details
 
 class TravelStart(HistoricalEvent):
-    def __init__(self, date, location, to_location, figures, populations, reason=None):
-        HistoricalEvent.__init__(self, date, location)
+    type_ = 'travel_start'
+    compact = True
 
+    def __init__(self, date, location, to_location, figures, populations, reason=None):
         self.to_location = to_location
         self.figures = figures
         self.commander = determine_commander(self.figures)
         self.populations = populations
         self.reason = reason
-        self.type_ = 'travel_start'
+
+        HistoricalEvent.__init__(self, date, location)
 
         for figure in self.get_entities():
             figure.add_associated_event(event_id=self.id_)
@@ -103,14 +391,24 @@ class TravelStart(HistoricalEvent):
     def get_entities(self):
         return self.figures
 
+    def get_details(self):
+        return self.to_location, self.commander, tuple(self.populations), self.reason
+
+    def restore_details(self, participants, details):
+        self.figures = participants
+        self.to_location, self.commander, populations, self.reason = details
+        self.populations = list(populations)
+
 class TravelEnd(HistoricalEvent):
-    def __init__(self, date, location, figures, populations):
-        HistoricalEvent.__init__(self, date, location)
+    type_ = 'travel_end'
+    compact = True
 
+    def __init__(self, date, location, figures, populations):
         self.figures = figures
         self.commander = determine_commander(self.figures)
         self.populations = populations
-        self.type_ = 'travel_end'
+
+        HistoricalEvent.__init__(self, date, location)
 
         for figure in self.get_entities():
             figure.add_associated_event(event_id=self.id_)
@@ -120,4 +418,12 @@ class TravelEnd(HistoricalEvent):
         return des
 
     def get_entities(self):
-        return self.figures
\ No newline at end of file
+        return self.figures
+
+    def get_details(self):
+        return self.commander, tuple(self.populations)
+
+    def restore_details(self, participants, details):
+        self.figures = participants
+        self.commander, populations = details
+        self.populations = list(populations)
@@ -12,16 +12,19 @@ import os
 import cProfile as prof
 import pstats
 import copy
-from collections import Counter, defaultdict, namedtuple
+from collections import Counter, defaultdict, namedtuple, OrderedDict
 import itertools
 import logging
+from array import array
+from bisect import bisect_left
+from heapq import heappush, heappop
 
 import economy
 import physics as phys
 from traits import TRAITS, TRAIT_INFO, CULTURE_TRAIT_INFO, EXPERIENCE_PER_SKILL_LEVEL, MAX_SKILL_LEVEL
-from dijkstra import Dijmap
 import gen_languages as lang
 import gen_creatures
+import gen_world_arrays
 import religion
 import gui
 import building_info
@@ -33,56 +36,173 @@ from map_base import *
 import history as hist
 import goap
 import data_importer as data
+import snapshot
+import profiler
+import rng
 
 
 mouse = libtcod.Mouse()
 key = libtcod.Key()
 
 
-class Region:
-    #a Region of the map and its properties
-    def __init__(self, x, y):
-        self.region = None
+class RegionGrid(object):
+    ''' Struct-of-arrays storage for the scalar fields of every Region in the world. Each field is a flat typed
+    array indexed by x * height + y, so whole-map passes (see gen_world_arrays) can work on the arrays directly '''
+    # Typed arrays can't hold None, so fields which may be None store a sentinel instead (NaN for the float fields)
+    FIELDS = {'heights': ('i', 0), 'temps': ('d', 0), 'wdists': ('i', -1), 'moists': ('d', float('nan')),
+              'region_numbers': ('i', -1), 'chars': ('i', g.EMPTY_TILE),
+              # Packed colors - see map_base.pack_color (0 is black)
+              'colors': ('i', -1), 'char_colors': ('i', 0),
+              # Indices into lookup_tables
+              'region_types': ('i', -1), 'territory_ids': ('i', -1)}
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        size = width * height
+        for field, (typecode, initial_value) in self.FIELDS.iteritems():
+            setattr(self, field, array(typecode, [initial_value]) * size)
+
+        self.blocks_mov = bytearray(size)
+        self.blocks_vis = bytearray(size)
+
+        # Values for the grid_lookup fields, and each value's index in its table
+        self.lookup_tables = {'region_types': [], 'territory_ids': []}
+        self.lookup_indices = {'region_types': {}, 'territory_ids': {}}
+
+        # index: Region, for worlds whose tiles are created on demand (see RegionTiles)
+        self.regions = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['regions']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Regions may already have been registered by load_region while the rest of the world was loading
+        self.__dict__.setdefault('regions', {})
+
+    def index(self, x, y):
+        return x * self.height + y
+
+    def lookup_index(self, field, value):
+        ''' Index of a value in a lookup field's table, adding it to the table if it's new '''
+        if value is None:
+            return -1
+
+        indices = self.lookup_indices[field]
+        if value not in indices:
+            indices[value] = len(self.lookup_tables[field])
+            self.lookup_tables[field].append(value)
+        return indices[value]
+
+
+def new_agent_slots():
+    return {'land':{'slots':g.MAX_ECONOMY_AGENTS_PER_TILE, 'agents':[]}}
+
+
+def load_region(grid, index):
+    ''' Used by pickle to recreate a Region - if the tile was already created, the existing Region is used '''
+    # The grid may still be being loaded itself, so it might not have a regions dict yet
+    regions = grid.__dict__.setdefault('regions', {})
+    if index not in regions:
+        regions[index] = Region.__new__(Region)
+    return regions[index]
+
+
+class Region(object):
+    #a Region of the map and its properties. Scalars are stored in the world's RegionGrid, and the
+    # containers below are only created once something uses them - most tiles never need any of them
+    __slots__ = ('grid', 'index', 'x', 'y', 'chunk', 'culture', 'site', 'explored',
+                 '_agent_slots', '_res', '_objects', '_features', '_minor_sites', '_caves', '_all_sites')
+    CONTAINER_SLOTS = ('_agent_slots', '_res', '_objects', '_features', '_minor_sites', '_caves', '_all_sites')
+
+    height = grid_field('heights')
+    temp = grid_field('temps')
+    # old variables, hopefully to be removed!
+    wdist = grid_field('wdists', none_value=-1)
+    moist = grid_field('moists', none_value=float('nan'))
+    # For figuring out play region
+    region_number = grid_field('region_numbers', none_value=-1)
+    char = grid_field('chars')
+    color = grid_color('colors')
+    char_color = grid_color('char_colors')
+
+    # Biome name
+    region = grid_lookup('region_types')
+    territory = grid_lookup('territory_ids')
+
+    blocks_mov = grid_flag('blocks_mov')
+    blocks_vis = grid_flag('blocks_vis')
+
+    agent_slots = lazy_container('_agent_slots', new_agent_slots)
+    res = lazy_container('_res', lambda: defaultdict(int))
+    objects = lazy_container('_objects', list)
+    features = lazy_container('_features', list)
+    minor_sites = lazy_container('_minor_sites', list)
+    caves = lazy_container('_caves', list)
+    all_sites = lazy_container('_all_sites', list)
+
+    @property
+    def associated_events(self):
+        ''' Ids of the historical events which happened here - looked up in the event store's location index '''
+        return hist.historical_events.get_event_ids_at(self.x, self.y)
+
+    @property
+    def entities(self):
+        ''' Figures on this tile - looked up in the world's spatial index '''
+        return g.WORLD.figure_index.at(self.x, self.y)
+
+    @property
+    def populations(self):
+        ''' Populations on this tile - looked up in the world's spatial index '''
+        return g.WORLD.population_index.at(self.x, self.y)
+
+    def __init__(self, grid, x, y):
+        # The grid's fields (region, color, territory...) start out empty, so only the slots need setting
+        self.grid = grid
+        self.index = grid.index(x, y)
         self.x = x
         self.y = y
-        self.color = None
-        self.char = 255
-        self.char_color = libtcod.black
-        self.region_number = None # For figuring out play region
 
-        self.agent_slots = {'land':{'slots':g.MAX_ECONOMY_AGENTS_PER_TILE, 'agents':[]}}
+        for slot in self.CONTAINER_SLOTS:
+            setattr(self, slot, None)
 
-        self.blocks_mov = False
-        self.blocks_vis = False
+        # Chunk will be set after region has been created
+        self.chunk = None
 
-        self.res = defaultdict(int)
-        self.entities = []
-        self.populations = []
-        self.objects = []
+        self.culture = None
+        self.site = None
+        self.explored = False
 
-        self.features = []
-        self.minor_sites = []
-        self.caves = []
+    @classmethod
+    def from_grid(cls, grid, x, y, chunk):
+        ''' Region for a tile whose fields are already in the grid '''
+        region = cls(grid, x, y)
+        region.chunk = chunk
+        return region
 
-        self.all_sites = []
+    def has_only_grid_info(self):
+        ''' Whether everything about this tile is stored in its grid, so a saved world can leave the Region out '''
+        if self.culture is not None or self.site is not None or self.explored:
+            return False
 
-        self.associated_events = set([])
+        for slot in self.CONTAINER_SLOTS:
+            container = getattr(self, slot)
+            if container and not (slot == '_agent_slots' and container == new_agent_slots()):
+                return False
 
-        self.height = 0
-        self.temp = 0
-        # self.rainfall = 0
-        # old variables, hopefully to be removed!
-        self.wdist = None
-        self.moist = None
+        return True
 
-        self.region_number = None
-        # Chunk will be set after region has been created
-        self.chunk = None
+    def __reduce__(self):
+        # Saved as a plain tuple of slot values - much smaller than a dict of slot names per tile
+        return load_region, (self.grid, self.index), tuple(getattr(self, slot) for slot in self.__slots__)
 
-        self.culture = None
-        self.site = None
-        self.territory = None
-        self.explored = False
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
 
     def add_resource(self, resource_name, amount):
         self.res[resource_name] += amount
@@ -124,7 +244,7 @@ class Region:
 
     def has_feature(self, type_):
         ''' Check if certain feature is in region '''
-        for feature in self.features:
+        for feature in self._features or ():
             if feature.type_ == type_:
                 return 1
 
@@ -132,7 +252,7 @@ class Region:
 
     def has_minor_site(self, type_):
         ''' Check if certain feature is in region '''
-        for site in self.minor_sites:
+        for site in self._minor_sites or ():
             if site.type_ == type_:
                 return 1
 
@@ -141,7 +261,7 @@ class Region:
     def get_features(self, type_):
         ''' Returns a list of all features, so that one may get, say, all caves in the region '''
         feature_list = []
-        for feature in self.features:
+        for feature in self._features or ():
             if feature.type_ == type_:
                 feature_list.append(feature)
 
@@ -190,7 +310,7 @@ class Region:
         if self.site:
             return self.site.name
         # Say the name of the site, unless it is being described relative to other cities
-        elif len(self.minor_sites) or len(self.caves):
+        elif self._minor_sites or self._caves:
             site_names = [site.get_name() for site in self.minor_sites + self.caves]
             return join_list(site_names)
         else:
@@ -227,6 +347,77 @@ class Region:
 
 
 
+class RegionColumn(object):
+    ''' A single x column of a RegionTiles, so that tiles[x][y] lookups keep working '''
+    __slots__ = ('owner', 'x')
+
+    def __init__(self, owner, x):
+        self.owner = owner
+        self.x = x
+
+    def __len__(self):
+        return self.owner.grid.height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.owner.grid.height
+        if not 0 <= y < self.owner.grid.height:
+            raise IndexError('Region index out of range')
+        return self.owner.get_region(self.x, y)
+
+    def __iter__(self):
+        for y in xrange(self.owner.grid.height):
+            yield self.owner.get_region(self.x, y)
+
+
+class RegionTiles(object):
+    ''' Stand-in for a world's [x][y] lists of Regions, which creates each Region from the world's RegionGrid the first
+    time it's looked up. Loaded worlds use this - only Regions with something besides grid info on them (sites, features,
+    resources...) are saved, and since the grid can be memory-mapped (see snapshot.py), a tile's info isn't even read
+    from disk until something looks at it '''
+    def __init__(self, grid, chunk_tiles, chunk_size, saved_regions=()):
+        self.grid = grid
+        self.chunk_tiles = chunk_tiles
+        self.chunk_size = chunk_size
+        # Only used when saving - Regions which must be written out
+        self.saved_regions = list(saved_regions)
+
+        self.columns = [RegionColumn(self, x) for x in xrange(grid.width)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['columns']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # The saved Regions registered themselves with the grid as they were loaded
+        self.saved_regions = []
+        self.columns = [RegionColumn(self, x) for x in xrange(self.grid.width)]
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, x):
+        return self.columns[x]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def get_region(self, x, y):
+        index = self.grid.index(x, y)
+        region = self.grid.regions.get(index)
+        if region is None:
+            chunk = self.chunk_tiles[x // self.chunk_size][y // self.chunk_size]
+            region = Region.from_grid(self.grid, x, y, chunk=chunk)
+            self.grid.regions[index] = region
+        return region
+
+    def loaded_regions(self):
+        ''' The Regions which have been created so far '''
+        return self.grid.regions.itervalues()
+
+
 class World(Map):
     def __init__(self, width, height):
         Map.__init__(self, width, height)
@@ -243,12 +434,18 @@ class World(Map):
         self.all_figures = []
         self.important_figures = []
 
+        # Figures and populations out in the world, by position - kept up to date as they move
+        self.figure_index = SpatialHash(cell_size=g.SPATIAL_HASH_CELL_SIZE)
+        self.population_index = SpatialHash(cell_size=g.SPATIAL_HASH_CELL_SIZE)
+
         self.famous_objects = set([])
         ### TODO - move this around; have it use the actual language of the first city
         self.moons, self.suns = religion.create_astronomy()
 
         self.equator = None
         self.mountains = []
+        # Set by make_heightmap() when generating with gen_world_arrays
+        self.climate_arrays = None
         self.rivers = []
 
         # Contiguous region set for play:
@@ -272,8 +469,20 @@ class World(Map):
 
         self.site_index = defaultdict(list)
 
-        # Dijmap where cities are the root nodes; set after cities are generated
-        self.distance_from_civilization_dmap = None
+        # (x, y): walking distance to the closest city; set after cities are generated
+        self.distance_from_civilization = None
+        # (x, y) origin: (max distance, distances, tile indices) - see get_distance_field()
+        self.distance_field_cache = OrderedDict()
+        # (origin, destination): travel path - see get_travel_path()
+        self.travel_path_cache = OrderedDict()
+
+        # City distance index - (x, y): walking distance to the nearest city, and that city. Rebuilt lazily when cities are founded
+        self.nearest_city_dists = None
+        self.nearest_cities = None
+        # (city, other_city): distance, by road if possible. Cleared when roads are built
+        self.city_distances = {}
+        # frozenset of cities: flood outwards from just those cities - see get_nearest_city_in_subset()
+        self.city_subset_floods = OrderedDict()
 
 
         self.tiles_with_potential_encounters = set([])
@@ -309,19 +518,23 @@ class World(Map):
         #### Setup actual world ####
         steps = 6
         g.game.render_handler.progressbar_screen('Generating World Map', 'creating regions', 1, steps, [] ) # self.cm.story_text)
-        self.setup_world()
+        with profiler.phase('worldgen.regions'):
+            self.setup_world()
         ########################### Begin with heightmap ##################################
         g.game.render_handler.progressbar_screen('Generating World Map', 'generating heightmap', 2, steps, []) # self.cm.story_text)
-        self.make_heightmap()
+        with profiler.phase('worldgen.heightmap'):
+            self.make_heightmap()
         ## Now, loop through map and check each land tile for its distance to water
         g.game.render_handler.progressbar_screen('Generating World Map', 'setting moisture', 3, steps, []) # self.cm.story_text)
-        self.calculate_water_dist()
+        with profiler.phase('worldgen.moisture'):
+            self.calculate_water_dist()
 
         ##### EXPERIMENTOIAENH ######
         #self.calculate_rainfall()
         ########################## Now, generate rivers ########################
         g.game.render_handler.progressbar_screen('Generating World Map', 'generating rivers', 4, steps, []) # self.cm.story_text)
-        self.gen_rivers()
+        with profiler.phase('worldgen.rivers'):
+            self.gen_rivers()
         ################################ Resources ##########################################
         g.game.render_handler.progressbar_screen('Generating World Map', 'setting resources and biome info', 5, steps, []) #self.cm.story_text)
 
@@ -329,28 +542,31 @@ class World(Map):
         #for line in self.cm.story_text:
         #    g.game.add_message(line)
 
-        self.set_resource_and_biome_info()
+        with profiler.phase('worldgen.resources_and_biomes'):
+            self.set_resource_and_biome_info()
 
         ##### End setup actual world #####
 
         # For pathing
-        self.divide_into_regions()
+        with profiler.phase('worldgen.pathing_regions'):
+            self.divide_into_regions()
 
         ######## Add some buttons #######
-        panel2.wmap_buttons = [
-                          gui.Button(gui_panel=panel2, func=self.gen_history, args=[1],
-                                     text='Generate History', topleft=(4, g.PANEL2_HEIGHT-11), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True),
-                          gui.Button(gui_panel=panel2, func=self.generate, args=[],
-                                     text='Regenerate Map', topleft=(4, g.PANEL2_HEIGHT-6), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True)
-                          ]
+        g.game.add_worldgen_buttons(world=self)
 
     def tile_blocks_mov(self, x, y):
         if self.tiles[x][y].blocks_mov:
             return True
 
+    def is_walkable(self, x, y):
+        ''' Whether world-scale movement (and floods measuring it) can go onto this tile '''
+        return self.is_val_xy((x, y)) and not self.tiles[x][y].blocks_mov
+
     def draw_world_objects(self):
-        # Just have all world objects represent themselves
-        for figure in g.WORLD.all_figures:
+        # Just have all world objects represent themselves - only the figures in view need to
+        x1, y1 = g.game.camera.cam2map(0, 0)
+        x2, y2 = g.game.camera.cam2map(g.game.camera.width_in_characters - 1, g.game.camera.height - 1)
+        for figure in self.figure_index.in_rect(x1, y1, x2, y2):
             if not self.tiles[figure.wx][figure.wy].site:
                 figure.w_draw()
 
@@ -455,80 +671,221 @@ class World(Map):
         return river_dirs
 
     def get_closest_city(self, x, y, max_range=1000, valid_cities='all_cities_in_world'):
-        ''' Find closest city from a given location. Optionally pass in a list of cities to restrict search by '''
+        ''' Find closest city from a given location. Optionally pass in a list of cities to restrict search by.
+        Uses the city distance index (or a cached flood from just the valid cities), so this is a couple of
+        table lookups rather than an A* search per city '''
         cities = self.cities if valid_cities == 'all_cities_in_world' else valid_cities
 
-        # Attepmt to shave some time from the expensive astar algo below by checking if the current tile is a valid city,
-        # and cut the function short by returning that site if so
+        # Cheap check for whether the current tile is a valid city
         if self.tiles[x][y].site and self.tiles[x][y].site in cities:
             return self.tiles[x][y].site, 0
 
-        # Normal case - loop through all cities and track distance / closest distance until we find the minimum
-        closest_city = None
-        closest_dist = max_range + 1  #start with (slightly more than) maximum range
+        if valid_cities == 'all_cities_in_world':
+            closest_city, closest_dist = self.get_nearest_city(x, y)
+        else:
+            closest_city, closest_dist = self.get_nearest_city_in_subset(x, y, cities)
+
+        if closest_city is None or closest_dist > max_range:
+            return None, max_range + 1
 
-        for city in cities:
-            dist = self.get_astar_distance_to(x, y, city.x, city.y)
-            if  dist < closest_dist: #it's closer, so remember it
-                closest_city = city
-                closest_dist = dist
         return closest_city, closest_dist
 
+    def get_nearest_city(self, x, y):
+        ''' Walking distance from x, y to the nearest city, and that city. Returns (None, None) if no city can be reached '''
+        if self.nearest_city_dists is None:
+            self.build_nearest_city_index()
+
+        if (x, y) in self.nearest_city_dists:
+            return self.nearest_cities[(x, y)], self.nearest_city_dists[(x, y)]
+
+        # Tiles which block movement (mountains, for instance) are never flooded, so go through a neighbor
+        neighbors = [(self.nearest_city_dists[(nx, ny)], (nx, ny)) for nx, ny in get_border_tiles_8(x, y) if (nx, ny) in self.nearest_city_dists]
+        if neighbors:
+            dist, location = min(neighbors)
+            return self.nearest_cities[location], dist + 1
+
+        return None, None
+
+    def get_nearest_city_in_subset(self, x, y, cities):
+        ''' Walking distance from x, y to the nearest of the given cities, and that city. Returns (None, None) if
+        none of them can be reached. Floods are cached per set of cities - see build_city_subset_flood() '''
+        key = frozenset(cities)
+        if not key:
+            return None, None
+
+        flood = self.city_subset_floods.get(key)
+        if flood is None:
+            flood = self.build_city_subset_flood(key)
+            self.city_subset_floods[key] = flood
+            if len(self.city_subset_floods) > g.CITY_SUBSET_FLOOD_CACHE_SIZE:
+                self.city_subset_floods.popitem(last=False)
+        else:
+            # Move to the back so it's the last to be evicted
+            del self.city_subset_floods[key]
+            self.city_subset_floods[key] = flood
+
+        subset_cities, dists, nearest = flood
+        index = x * self.height + y
+        if dists[index] >= 0:
+            return subset_cities[nearest[index]], dists[index]
+
+        # Tiles which block movement (mountains, for instance) are never flooded, so go through a neighbor
+        neighbors = [(dists[nx * self.height + ny], nx * self.height + ny) for nx, ny in get_border_tiles_8(x, y)
+                     if self.is_val_xy((nx, ny)) and dists[nx * self.height + ny] >= 0]
+        if neighbors:
+            dist, index = min(neighbors)
+            return subset_cities[nearest[index]], dist + 1
+
+        return None, None
+
+    def build_city_subset_flood(self, cities):
+        ''' Flood outwards from a set of cities at once. Returns the cities as a tuple, along with two arrays indexed
+        by x * height + y: each tile's walking distance to the nearest of them (-1 if it can't be reached), and that
+        city's position in the tuple '''
+        cities = tuple(cities)
+        nearest_city_locations = {}
+        flooded = self.flood_distances(sources=[(city.x, city.y) for city in cities], can_enter=self.is_walkable,
+                                       nearest_sources=nearest_city_locations)
+
+        city_positions = dict(((city.x, city.y), i) for i, city in enumerate(cities))
+        dists = array('i', [-1]) * (self.width * self.height)
+        nearest = array('i', [-1]) * (self.width * self.height)
+        for (fx, fy), dist in flooded.iteritems():
+            index = fx * self.height + fy
+            dists[index] = dist
+            nearest[index] = city_positions[nearest_city_locations[(fx, fy)]]
+
+        return cities, dists, nearest
+
+    def build_nearest_city_index(self):
+        ''' Flood outwards from every city at once, recording each reachable tile's walking distance to its nearest city '''
+        nearest_city_locations = {}
+        self.nearest_city_dists = self.flood_distances(sources=[(city.x, city.y) for city in self.cities], can_enter=self.is_walkable,
+                                                       nearest_sources=nearest_city_locations)
+
+        cities_by_location = dict(((city.x, city.y), city) for city in self.cities)
+        self.nearest_cities = dict((location, cities_by_location[city_location]) for location, city_location in nearest_city_locations.iteritems())
+
+    def get_city_distance(self, city, other_city):
+        ''' Distance between two cities - the length of the road between them if there is one, otherwise
+        the A* walking distance. Cached until a road is built, so each pair is only ever computed once '''
+        if city == other_city:
+            return 0
+
+        if (city, other_city) not in self.city_distances:
+            if city.path_to.get(other_city):
+                dist = len(city.path_to[other_city])
+            elif other_city.path_to.get(city):
+                dist = len(other_city.path_to[city])
+            else:
+                dist = self.get_astar_distance_to(city.x, city.y, other_city.x, other_city.y)
+
+            self.city_distances[(city, other_city)] = dist
+            self.city_distances[(other_city, city)] = dist
+
+        return self.city_distances[(city, other_city)]
+
+    def invalidate_city_distance_index(self, cities_changed=1, roads_changed=1):
+        ''' Cities being founded changes the nearest-city flood; roads being built changes city to city distances.
+        Either can change which travel paths take roads '''
+        if cities_changed:
+            self.nearest_city_dists = None
+            self.nearest_cities = None
+        if roads_changed:
+            self.city_distances = {}
+        if cities_changed or roads_changed:
+            self.clear_travel_path_cache()
+
+    def get_travel_path(self, initial_location, target_location):
+        ''' Path for a figure traveling between 2 points - by road if both points happen to be cities, otherwise by A*.
+        Paths are cached, and the same tuple is handed to everyone traveling that way, so copy it before changing it.
+        An empty path means the target can't be reached '''
+        key = (initial_location, target_location)
+        path = self.travel_path_cache.get(key)
+        if path is not None:
+            # Move to the back so it's the last to be evicted
+            del self.travel_path_cache[key]
+            self.travel_path_cache[key] = path
+            return path
+
+        target_site = self.tiles[target_location[0]][target_location[1]].site
+        current_site = self.tiles[initial_location[0]][initial_location[1]].site
+
+        if target_site in self.cities and current_site in self.cities and current_site != target_site:
+            path = tuple(current_site.path_to[target_site])
+        else:
+            # Default - use libtcod's A* to create a path to destination
+            libtcod.path_compute(p=self.path_map, ox=initial_location[0], oy=initial_location[1], dx=target_location[0], dy=target_location[1])
+            path = tuple(libtcod_path_to_list(path_map=self.path_map))
+
+        self.travel_path_cache[key] = path
+        if len(self.travel_path_cache) > g.TRAVEL_PATH_CACHE_SIZE:
+            self.travel_path_cache.popitem(last=False)
+
+        return path
+
+    def clear_travel_path_cache(self):
+        ''' Must be called if roads are built, or if any world tile changes whether it blocks movement '''
+        self.travel_path_cache = OrderedDict()
+
+    def get_distance_field(self, x, y, max_distance):
+        ''' Walking distance (in 8 directions, through tiles which don't block movement) from x, y to every tile
+        within max_distance steps. Yields (distance, (wx, wy)) in order of distance.
+        Fields are cached per origin as a pair of parallel arrays - the sorted distances, and the flat index
+        (wx * height + wy) of each tile - and a cached field can answer any query with a smaller max_distance '''
+        cached = self.distance_field_cache.get((x, y))
+        if cached and cached[0] >= max_distance:
+            # Move to the back so it's the last to be evicted
+            del self.distance_field_cache[(x, y)]
+            self.distance_field_cache[(x, y)] = cached
+            cached_max_distance, distances, indices = cached
+        else:
+            flooded = self.flood_distances(sources=[(x, y)], can_enter=self.is_walkable, max_distance=max_distance)
+            field = sorted((distance, wx * self.height + wy) for (wx, wy), distance in flooded.iteritems())
+            distances = array('i', (distance for distance, index in field))
+            indices = array('i', (index for distance, index in field))
+
+            cached_max_distance = max_distance
+            self.distance_field_cache[(x, y)] = (max_distance, distances, indices)
+            if len(self.distance_field_cache) > g.DISTANCE_FIELD_CACHE_SIZE:
+                self.distance_field_cache.popitem(last=False)
+
+        end = len(distances) if cached_max_distance == max_distance else bisect_left(distances, max_distance + 1)
+        height = self.height
+        for i in xrange(end):
+            yield distances[i], divmod(indices[i], height)
+
+    def clear_distance_field_cache(self):
+        ''' Must be called if any world tile changes whether it blocks movement '''
+        self.distance_field_cache = OrderedDict()
+        self.city_subset_floods = OrderedDict()
+        self.clear_travel_path_cache()
+
     def find_nearby_resources(self, x, y, distance):
-        # TODO - this code is pretty gnarly :-/
-        # Make a list of nearby resources at particular world coords
+        ''' Make a list of the resources which can be reached within <distance> steps of x, y, along with a
+        parallel list of the closest location of each one '''
         nearby_resources = []
         nearby_resource_locations = []
-        for wx in xrange(x - distance, x + distance + 1):
-            for wy in xrange(y - distance, y + distance + 1):
-                if self.is_val_xy( (wx, wy) ) and self.tiles[wx][wy].res:
-                    # Make sure there's a path to get the resource from (not blocked by ocean or whatever)
-                    path = libtcod.path_compute(self.rook_path_map, x, y, wx, wy)
-                    new_path_len = libtcod.path_size(self.rook_path_map)
-
-                    if new_path_len:
-                        for resource in self.tiles[wx][wy].res.iterkeys():
-                            ## Only add it if it's not already in it, and if we don't have access to it
-                            if not resource in nearby_resources: # and not resource in self.native_res.keys():
-                                nearby_resources.append(resource)
-                                nearby_resource_locations.append((wx, wy))
-
-                            elif resource in nearby_resources:
-                                ## Check whether the current instance of this resource is closer than the previous one
-                                cur_dist = self.get_astar_distance_to(x, y, wx, wy)
-
-                                prev_res_ind = nearby_resources.index(resource)
-                                px, py = nearby_resource_locations[prev_res_ind]
-                                prev_dist = self.get_astar_distance_to(x, y, px, py)
-
-                                if cur_dist < prev_dist:
-                                    del nearby_resources[prev_res_ind]
-                                    del nearby_resource_locations[prev_res_ind]
-
-                                    nearby_resources.append(resource)
-                                    nearby_resource_locations.append((wx, wy))
+        found_resources = set()
+
+        for dist, (wx, wy) in self.get_distance_field(x, y, distance):
+            for resource in self.tiles[wx][wy].res.iterkeys():
+                # The field is sorted by distance, so the first location found for a resource is the closest
+                if resource not in found_resources:
+                    found_resources.add(resource)
+                    nearby_resources.append(resource)
+                    nearby_resource_locations.append((wx, wy))
 
         return nearby_resources, nearby_resource_locations
 
     def get_closest_resource(self, x, y, resource):
-        ''' Given world x and y coords, find the closest instance of a particular resource '''
-        initial_chunk = self.tiles[x][y].chunk
-        resource_locations = [location for location in initial_chunk.resources[resource] if resource in initial_chunk.resources]
-        # Check if there are any on this chunk
-        closest_distance, closest_location = self.get_closest_location(x=x, y=y, locations=resource_locations)
-
-        # If there is a distance, and it's less than the chunk size, then this is a good location
-        if 0 <= closest_distance <= self.chunk_size:
-            return closest_distance, closest_location
-
-        # Find a list of nearby chunks to check the resources of - arbitrarily setting # of chunks to 5 for now
-        resource_locations = [location for chunk in self.get_nearby_chunks(chunk=initial_chunk, distance=3)
-                                       if chunk != initial_chunk for location in chunk.resources[resource]
-                                       if resource in chunk.resources and self.tiles[location[0]][location[1]].in_play_region()]
-
-        closest_distance, closest_location = self.get_closest_location(x=x, y=y, locations=resource_locations)
+        ''' Given world x and y coords, find the closest instance of a particular resource.
+        Searches up to 3 chunks away - returns (None, None) if there are none in that range '''
+        for distance, (wx, wy) in self.get_distance_field(x, y, self.chunk_size * 3):
+            if self.tiles[wx][wy].res.get(resource):
+                return distance, (wx, wy)
 
-        return closest_distance, closest_location
+        return None, None
 
     def get_random_location_away_from_civilization(self, min_dist, max_dist):
         ''' Finds a random tile in the play area that is within a range of distances from civilization '''
@@ -538,7 +895,7 @@ class World(Map):
         while True:
             wx, wy = random.choice(self.play_tiles)
 
-            if min_dist <= self.distance_from_civilization_dmap.dmap[wx][wy] <= max_dist:
+            if min_dist <= self.distance_from_civilization.get((wx, wy)) <= max_dist:
                 break
 
         return (wx, wy)
@@ -546,18 +903,24 @@ class World(Map):
 
     def setup_world(self):
         # Fill world with empty regions
-        self.tiles = [[Region(x=x, y=y) for y in xrange(self.height)] for x in xrange(self.width)]
+        self.tile_grid = RegionGrid(width=self.width, height=self.height)
+        self.tiles = [[Region(grid=self.tile_grid, x=x, y=y) for y in xrange(self.height)] for x in xrange(self.width)]
+        self.clear_distance_field_cache()
+        self.invalidate_city_distance_index()
         # Initialize the chunks inthe world - method inherited from map_base
         self.setup_chunks(chunk_size=10, map_type='world')
 
         # Equator line - temperature depends on this. Varies slightly from map to map
-        self.equator = int(round(self.height / 2)) + roll(-5, 5)
+        self.equator = int(round(self.height / 2)) + rng.terrain.randint(-5, 5)
 
     def distance_to_equator(self, y):
         return abs(y - self.equator) / (self.height / 2)
 
 
     def make_heightmap(self):
+        # World generation draws from the terrain stream (see rng.py)
+        roll = rng.terrain.randint
+
         hm = libtcod.heightmap_new(self.width, self.height)
         # Start with a bunch of small, wide hills. Keep them relatively low
         for iteration in xrange(200):
@@ -593,7 +956,9 @@ class World(Map):
         #libtcod.heightmap_mid_point_displacement(hm=hm, rng=0, roughness=.5)
 
         # Erosion - not sure exactly what these params do
-        libtcod.heightmap_rain_erosion(hm=hm, nbDrops=self.width * self.height, erosionCoef=.05, sedimentationCoef=.05, rnd=0)
+        erosion_random = rng.new_libtcod_random(rng.terrain)
+        libtcod.heightmap_rain_erosion(hm=hm, nbDrops=self.width * self.height, erosionCoef=.05, sedimentationCoef=.05, rnd=erosion_random)
+        libtcod.random_delete(erosion_random)
 
         # And normalize heightmap
         #libtcod.heightmap_normalize(hm, mi=1, ma=255)
@@ -601,7 +966,7 @@ class World(Map):
         #libtcod.heightmap_normalize(hm, mi=20, ma=170)
 
         ### Noise to vary wdist ### Experimental code ####
-        mnoise = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY)
+        mnoise = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY, rng.new_libtcod_random(rng.terrain))
         octaves = 20
         div_amt = 20
 
@@ -611,6 +976,14 @@ class World(Map):
         mvar = 30
         ### End experimental code ####
 
+        # Array generation mode - climate info is kept in arrays until calculate_water_dist() writes it to the tiles
+        if gen_world_arrays.is_enabled():
+            heights, temps, self.mountains = gen_world_arrays.make_heights_and_temps(world=self, hm=hm, mnoise=mnoise, octaves=octaves, div_amt=div_amt,
+                                                                                      thresh=thresh, thresh2=thresh2, scale=scale, mvar=mvar)
+            self.climate_arrays = {'heights': heights, 'temps': temps}
+            libtcod.heightmap_delete(hm)
+            return
+
 
         # Add the info from libtcod's heightmap to the world's heightmap
         for x in xrange(self.width):
@@ -696,31 +1069,30 @@ class World(Map):
     '''
 
     def calculate_water_dist(self):
-        ## Essentially a dijisktra map for water distance
-        wdist = 0
-        found_square = True
-        while found_square:
-            found_square = False
-            wdist += 1
-
-            for x in xrange(1, self.width - 1):
-                for y in xrange(1, self.height - 1):
-
-                    if self.tiles[x][y].wdist is None:
-                        # Only check water distance at 4 cardinal directions
-                        #side_dir = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
-                        #corner_dir = [(x-1, y-1), (x-1, y+1), (x+1, y-1), (x+1, y+1)]
-                        for dx, dy in get_border_tiles(x, y):
-                            if self.tiles[dx][dy].wdist == wdist - 1:
-                                self.tiles[x][y].wdist = self.tiles[dx][dy].wdist + 1
-                                # calculate "moisture" to add a little variability - it's related to water dist but takes height into account
-                                # Also, LOWER is MORE moist because I'm lazy
-                                self.tiles[x][y].moist = self.tiles[x][y].wdist * (1.7 - (self.tiles[x][y].height / 255)) ** 2
-
-                                found_square = True
-                                break
+        ## Array generation mode - flood the whole map at once, then write all climate info back to the tiles
+        if self.climate_arrays is not None:
+            heights, temps = self.climate_arrays['heights'], self.climate_arrays['temps']
+            wdist, moist = gen_world_arrays.calculate_water_dist(heights)
+            gen_world_arrays.write_climate_to_tiles(world=self, heights=heights, temps=temps, wdist=wdist, moist=moist)
+            self.climate_arrays = None
+            return
+
+        ## Essentially a dijisktra map for water distance - flood out from all water at once, in the 4 cardinal directions.
+        ## make_heightmap() already set water to 0 wdist/moist, and everything else to None wdist / 100 moist
+        water_tiles = [(x, y) for x in xrange(self.width) for y in xrange(self.height) if self.tiles[x][y].height < g.WATER_HEIGHT]
+        water_distances = self.flood_distances(sources=water_tiles, diagonals=0, can_enter=lambda x, y: 0 < x < self.width - 1 and 0 < y < self.height - 1)
+
+        for (x, y), wdist in water_distances.iteritems():
+            if wdist:
+                self.tiles[x][y].wdist = wdist
+                # calculate "moisture" to add a little variability - it's related to water dist but takes height into account
+                # Also, LOWER is MORE moist because I'm lazy
+                self.tiles[x][y].moist = wdist * (1.7 - (self.tiles[x][y].height / 255)) ** 2
 
     def gen_rivers(self):
+        # World generation draws from the terrain stream (see rng.py)
+        roll = rng.terrain.randint
+
         self.rivers = []
         river_connection_tiles = []
         # Walk through all mountains tiles and make a river if there are none nearby
@@ -845,8 +1217,8 @@ class World(Map):
             self.tiles[x][y].char = char
 
         ## Experimental code to vary moisture and temperature a bit
-        noisemap1 = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY)
-        noisemap2 = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY)
+        noisemap1 = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY, rng.new_libtcod_random(rng.terrain))
+        noisemap2 = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY, rng.new_libtcod_random(rng.terrain))
 
         n1octaves = 12
         n2octaves = 10
@@ -870,26 +1242,47 @@ class World(Map):
         ### End experimental code ####
 
 
+    def classify_biome(self, height, temp, moist, y):
+        ''' Which type of region a tile with this climate is. gen_world_arrays.classify_biomes() does the same for the whole map at once '''
+        # Hardcoded positions where tundra cannot go in between (e.g. none in between world y height of tundra_min and tundra_max)
+        tundra_min = 35
+        tundra_max = self.height - 35
+        # Hardcoded positions where tundra cannot go in between (e.g. none in between world y height of tundra_min and tundra_max)
+        taiga_min = 45
+        taiga_max = self.height - 45
+
+        if height < g.WATER_HEIGHT:                                             return 'ocean'
+        elif height > g.MOUNTAIN_HEIGHT:                                        return 'mountain'
+        elif temp < 18 and not (tundra_min < y < tundra_max):                   return 'tundra'
+        elif temp < 23 and moist < 22 and not (taiga_min < y < taiga_max):      return 'taiga'
+        elif temp < 30 and moist < 18:                                          return 'temperate forest'
+        elif temp < 35:                                                         return 'temperate steppe'
+        elif temp > 47 and moist < 18:                                          return 'rain forest'
+        elif temp >= 35 and moist < 18:                                         return 'tree savanna'
+        elif temp >= 35 and moist < 34:                                         return 'grass savanna'
+        elif temp <= 44:                                                        return 'dry steppe'
+        elif temp > 44 and moist < 48:                                          return 'semi-arid desert'
+        elif temp > 44:                                                         return 'arid desert'
+        # Hopefully shouldn't come to this
+        else:                                                                   return 'none'
+
     def set_resource_and_biome_info(self):
         ''' TODO NEW FUNCTION DEFINITION TO MODIFY FOR NEW RAIN CODE '''
         ''' Finally, use the scant climate info generated to add biome and color information '''
+        # World generation draws from the terrain stream (see rng.py)
+        roll, choice = rng.terrain.randint, rng.terrain.choice
 
         mountain_height = g.MOUNTAIN_HEIGHT # minor optimization to make variable local
-        water_height = g.WATER_HEIGHT # minor optimization to make variable local
 
         taiga_chars = (chr(5), '^')
         forest_chars = (chr(5), chr(6))
         rain_forest_chars = (chr(6), '*')
 
-        # Hardcoded positions where tundra cannot go in between (e.g. none in between world y height of tundra_min and tundra_max)
-        tundra_min = 35
-        tundra_max = self.height - 35
-        # Hardcoded positions where tundra cannot go in between (e.g. none in between world y height of tundra_min and tundra_max)
-        taiga_min = 45
-        taiga_max = self.height - 45
-
         a = 3 # Used for coloring tiles (each rgb value will vary by +- this #)
 
+        # Classify the whole map at once if we can
+        regions = gen_world_arrays.classify_biomes(world=self) if gen_world_arrays.is_enabled() else None
+
         for y in xrange(self.height):
             for x in xrange(self.width):
                 this_tile = self.tiles[x][y] # minor optimization to avoid lookups
@@ -897,8 +1290,13 @@ class World(Map):
                 sc = int(this_tile.height) - 1
                 mmod = int(round(40 - this_tile.moist) / 1.4) - 25
 
+                if regions is not None:
+                    region = regions[x][y]
+                else:
+                    region = self.classify_biome(height=this_tile.height, temp=this_tile.temp, moist=this_tile.moist, y=y)
+
                 ## Ocean
-                if this_tile.height < water_height:
+                if region == 'ocean':
                     this_tile.blocks_mov = True
                     this_tile.region = 'ocean'
 
@@ -910,7 +1308,7 @@ class World(Map):
                         this_tile.color = libtcod.Color(20, 60, int(round(sc * 2)) + 15)
 
                 #### MOUNTAIN ####
-                elif this_tile.height > mountain_height:
+                elif region == 'mountain':
                     this_tile.blocks_mov = True
                     this_tile.blocks_vis = True
                     this_tile.region = 'mountain'
@@ -925,30 +1323,30 @@ class World(Map):
                     this_tile.char = g.MOUNTAIN_TILE
 
                 ######################## TUNDRA ########################
-                elif this_tile.temp < 18 and not (tundra_min < y < tundra_max):
+                elif region == 'tundra':
                     this_tile.region = 'tundra'
                     this_tile.color = libtcod.Color(190 + roll(-a - 2, a + 2), 188 + roll(-a - 2, a + 2), 189 + roll(-a - 2, a + 2))
 
                 ######################## TAIGA ########################
-                elif this_tile.temp < 23 and this_tile.moist < 22 and not (taiga_min < y < taiga_max):
+                elif region == 'taiga':
                     this_tile.region = 'taiga'
                     this_tile.color = libtcod.Color(127 + roll(-a, a), 116 + roll(-a, a), 115 + roll(-a, a))
 
                     if not this_tile.has_feature('river'):
                         this_tile.char_color = libtcod.Color(23 + roll(-a, a), 58 + mmod + roll(-a, a), 9 + roll(-a, a))
-                        this_tile.char = random.choice(g.TAIGA_TILES)
+                        this_tile.char = choice(g.TAIGA_TILES)
 
                 ######################## TEMPERATE FOREST ########################
-                elif this_tile.temp < 30 and this_tile.moist < 18:
+                elif region == 'temperate forest':
                     this_tile.region = 'temperate forest'
                     this_tile.color = libtcod.Color(53 + roll(-a, a), 75 + mmod + roll(-a, a), 32 + roll(-a, a))
 
                     if not this_tile.has_feature('river'):
                         this_tile.char_color = libtcod.Color(25 + roll(-a, a), 55 + mmod + roll(-a, a), 20 + roll(-a, a))
-                        this_tile.char = random.choice(g.FOREST_TILES)
+                        this_tile.char = choice(g.FOREST_TILES)
 
                 ######################## TEMPERATE STEPPE ########################
-                elif this_tile.temp < 35:
+                elif region == 'temperate steppe':
                     this_tile.region = 'temperate steppe'
                     this_tile.color = libtcod.Color(65 + roll(-a, a), 97 + mmod + roll(-a, a), 41 + roll(-a, a))
 
@@ -957,16 +1355,16 @@ class World(Map):
                         this_tile.char = g.TEMPERATE_STEPPE_TILE
 
                 ######################## RAIN FOREST ########################
-                elif this_tile.temp > 47 and this_tile.moist < 18:
+                elif region == 'rain forest':
                     this_tile.region = 'rain forest'
                     this_tile.color = libtcod.Color(40 + roll(-a, a), 60 + mmod + roll(-a, a), 18 + roll(-a, a))
 
                     if not this_tile.has_feature('river'):
                         this_tile.char_color = libtcod.Color(16 + roll(-a, a), 40 + roll(-a - 5, a + 5), 5 + roll(-a, a))
-                        this_tile.char = random.choice(g.RAIN_FOREST_TILES)
+                        this_tile.char = choice(g.RAIN_FOREST_TILES)
 
                 ######################## TREE SAVANNA ########################
-                elif this_tile.temp >= 35 and this_tile.moist < 18:
+                elif region == 'tree savanna':
                     this_tile.region = 'tree savanna'
                     this_tile.color = libtcod.Color(50 + roll(-a, a), 85 + mmod + roll(-a, a), 25 + roll(-a, a))
                     #this_tile.color = libtcod.Color(209, 189, 126)  # grabbed from a savannah image
@@ -981,7 +1379,7 @@ class World(Map):
                             this_tile.char = g.TREE_SAVANNA_TILE
 
                 ######################## GRASS SAVANNA ########################
-                elif this_tile.temp >= 35 and this_tile.moist < 34:
+                elif region == 'grass savanna':
                     this_tile.region = 'grass savanna'
                     this_tile.color = libtcod.Color(91 + roll(-a, a), 110 + mmod + roll(-a, a), 51 + roll(-a, a))
                     #this_tile.color = libtcod.Color(209, 189, 126) # grabbed from a savannah image
@@ -992,17 +1390,17 @@ class World(Map):
                         this_tile.char = g.TEMPERATE_STEPPE_TILE
 
                 ######################## DRY STEPPE ########################
-                elif this_tile.temp <= 44:
+                elif region == 'dry steppe':
                     this_tile.region = 'dry steppe'
                     this_tile.color = libtcod.Color(99 + roll(-a, a), 90 + roll(-a, a + 1), 59 + roll(-a, a + 1))
 
                 ######################## SEMI-ARID DESERT ########################
-                elif this_tile.temp > 44 and this_tile.moist < 48:
+                elif region == 'semi-arid desert':
                     this_tile.region = 'semi-arid desert'
                     this_tile.color = libtcod.Color(178 + roll(-a - 1, a + 2), 140 + roll(-a - 1, a + 2), 101 + roll(-a - 1, a + 2))
 
                 ######################## ARID DESERT ########################
-                elif this_tile.temp > 44:
+                elif region == 'arid desert':
                     this_tile.region = 'arid desert'
                     this_tile.color = libtcod.Color(212 + roll(-a - 1, a + 1), 185 + roll(-a - 1, a + 1), 142 + roll(-a - 1, a + 1))
 
@@ -1100,14 +1498,13 @@ class World(Map):
         biggest_region_num = 0
         biggest_filled_tiles = None
 
-        def do_fill(region, current_region_number):
-            region.region_number = current_region_number
-
         for x in xrange(1, self.width - 1):
             for y in xrange(1, self.height - 1):
                 if not self.tiles[x][y].blocks_mov and not self.tiles[x][y].region_number:
                     current_region_number += 1
-                    filled_tiles = floodfill(fmap=self, x=x, y=y, do_fill=do_fill, do_fill_args=[current_region_number], is_border=lambda tile: tile.blocks_mov or tile.region_number)
+                    filled_tiles = set(self.flood_distances(sources=[(x, y)], can_enter=self.is_walkable, diagonals=0))
+                    for fx, fy in filled_tiles:
+                        self.tiles[fx][fy].region_number = current_region_number
 
 
                     if len(filled_tiles) > biggest_region_size:
@@ -1120,20 +1517,20 @@ class World(Map):
 
 
     def gen_history(self, years):
-        #self.gen_mythological_creatures()
-        self.gen_sentient_races()
-        self.gen_cultures()
-        self.create_civ_cradle()
-        self.settle_cultures()
+        self.setup_civilizations()
         self.run_history(years)
 
-        ## Add a "start playing" button if there isn't already one
-        for button in panel2.wmap_buttons:
-            if button.text == 'Start Playing':
-                break
-        else:
-            panel2.wmap_buttons.append(gui.Button(gui_panel=panel2, func=g.game.new_game, args=[],
-                                    text='Start Playing', topleft=(4, g.PANEL2_HEIGHT-16), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True))
+        g.game.add_play_buttons()
+
+    def setup_civilizations(self):
+        ''' Create the world's races and cultures, and found its first settlements '''
+        #self.gen_mythological_creatures()
+        with profiler.phase('worldgen.cultures'):
+            self.gen_sentient_races()
+            self.gen_cultures()
+            self.create_civ_cradle()
+        with profiler.phase('worldgen.settle_cultures'):
+            self.settle_cultures()
 
 
     def gen_mythological_creatures(self):
@@ -1184,6 +1581,8 @@ class World(Map):
 
     def gen_sentient_races(self):
         ''' Generate some sentient races to populate the world. Very basic for now '''
+        # Culture generation draws from the culture stream (see rng.py)
+        roll = rng.culture.randint
         for i in xrange(5):
             # Throwaway language for now
             race_name_lang = lang.Language()
@@ -1205,29 +1604,31 @@ class World(Map):
     def gen_cultures(self):
         begin = time.time()
 
+        # Culture generation draws from the culture stream (see rng.py)
+        roll, choice = rng.culture.randint, rng.culture.choice
         number_of_cultures = roll(75, 100)
         ## Place some hunter-getherer cultures
         for i in xrange(number_of_cultures):
             # Random playable coords
-            x, y = random.choice(self.play_tiles)
+            x, y = choice(self.play_tiles)
             # Make sure it's a legit tile and that no other culture owns it
             if not self.tiles[x][y].blocks_mov and self.tiles[x][y].culture is None:
                 # spawn a culture
                 language = lang.Language()
                 self.languages.append(language)
                 if roll(1, 10) > 2:
-                    races = [random.choice(self.sentient_races)]
+                    races = [choice(self.sentient_races)]
                 else:
                     # Pick more than one race to be a part of this culture
                     races = []
                     for j in xrange(2):
                         while 1:
-                            race = random.choice(self.sentient_races)
+                            race = choice(self.sentient_races)
                             if race not in races:
                                 races.append(race)
                                 break
 
-                culture = Culture(color=random.choice(g.CIV_COLORS), language=language, world=self, races=races)
+                culture = Culture(color=choice(g.CIV_COLORS), language=language, world=self, races=races)
                 culture.edge = [(x, y)]
                 culture.add_territory(x, y)
                 self.cultures.append(culture)
@@ -1535,7 +1936,7 @@ class World(Map):
                 self.add_ruins(x, y)
 
         target_nodes = [(city.x, city.y) for city in created_cities]
-        self.distance_from_civilization_dmap = Dijmap(sourcemap=self, target_nodes=target_nodes, dmrange=10000)
+        self.distance_from_civilization = self.flood_distances(sources=target_nodes, can_enter=self.is_walkable)
 
         # Each city gets a few bandits near it
         self.add_bandits(city_list=networked_cities, lnum=0, hnum=2, radius=10)
@@ -1579,8 +1980,9 @@ class World(Map):
             #### Book ####
             book = assemble_object(object_blueprint=phys.object_dict['book'], force_material=data.commodity_manager.materials['wood'], wx=city.x, wy=city.y)
 
-            for event in hist.historical_events:
-                book.components[0].add_information_of_event(language=c_language, event_id=event.id_, date_written=date, author=None, location_accuracy=1)
+            # Event ids run from 0 up, so there's no need to rebuild the event objects just to get them
+            for event_id in xrange(len(hist.historical_events)):
+                book.components[0].add_information_of_event(language=c_language, event_id=event_id, date_written=date, author=None, location_accuracy=1)
 
             book.interactable = {'func':book.read_information, 'args':[], 'text':'Read {0}'.format(book.name), 'hover_text':['Cave entrance']}
             self.add_famous_object(obj=book)
@@ -1653,6 +2055,9 @@ class World(Map):
             city.path_to[other_city] = path_to_other_city
             #other_city.path_to[city] = other_city_path_to_us
 
+        # City to city distances will be re-read from the new paths
+        self.invalidate_city_distance_index(cities_changed=0, roads_changed=1)
+
 
     def find_closest_clumped_cities(self, clump1, clump2):
         ''' For 2 lists of cities, find the two closest ones '''
@@ -1661,11 +2066,9 @@ class World(Map):
 
         for city in clump1:
             for ocity in clump2:
-                road_path = libtcod.path_compute(self.path_map, city.x, city.y, ocity.x, ocity.y)
-                ## Why the hell do you have to use the path map variable here?
-                pdist = libtcod.path_size(self.path_map)
+                pdist = self.get_city_distance(city, ocity)
 
-                if pdist < dist:
+                if pdist is not None and pdist < dist:
                     dist = pdist
                     cities = (city, ocity)
 
@@ -1745,25 +2148,54 @@ class World(Map):
                         break
 
 
-    def run_history(self, weeks):
-        ## Some history...
-        #begin = time.time()
-        for i in xrange(weeks * 7):
-            self.time_cycle.day_tick()
-        #g.game.add_message('History run in %.2f seconds' %(time.time() - begin))
+    def run_history(self, weeks, fast_forward=None):
+        ''' Simulate the given number of weeks. In fast-forward mode, messages are muted, random encounters in
+        cities are run in batches (see TimeCycle.day_tick) and figures sleep through days where they'd do nothing
+        (see BasicWorldBrain.get_next_turn_day) '''
+        self.run_days(days=weeks * 7, fast_forward=fast_forward)
+
+    def run_days(self, days, fast_forward=None):
+        ''' Simulate the given number of days - see run_history. Returns the number of seconds it took '''
+        if fast_forward is None:
+            fast_forward = g.FAST_FORWARD_HISTORY
+
+        begin = time.time()
+        was_muted = g.game.messages_muted
+        self.time_cycle.fast_forward = fast_forward
+        g.game.messages_muted = fast_forward or was_muted
+        try:
+            for i in xrange(days):
+                self.time_cycle.day_tick()
+        finally:
+            self.time_cycle.fast_forward = 0
+            g.game.messages_muted = was_muted
+            if fast_forward:
+                self.time_cycle.wake_all_figures()
+
+        elapsed = time.time() - begin
+        years = days / self.time_cycle.days_per_year
+        logging.info('Simulated {0:.2f} years of history in {1:.2f} seconds ({2:.2f} years per second)'.format(years, elapsed, years / max(elapsed, .001)))
+        g.game.add_message('History run in {0:.2f} seconds ({1:.2f} years per second)'.format(elapsed, years / max(elapsed, .001)))
         # List the count of site types
         g.game.add_message(join_list([ ct(type_, len(self.site_index[type_])) for type_ in self.site_index]))
 
+        return elapsed
+
 
     def initialize_fov(self):
         ## Field of view / pathfinding modules
         self.fov_recompute = True
 
+        # Read straight from the grid, so that worlds with on-demand tiles don't have to create every Region
+        grid = self.tile_grid
         self.fov_map = libtcod.map_new(self.width, self.height)
         for y in range(self.height):
             for x in range(self.width):
-                libtcod.map_set_properties(self.fov_map, x, y, not self.tiles[x][y].blocks_vis, not self.tiles[x][y].blocks_mov)
+                i = grid.index(x, y)
+                libtcod.map_set_properties(self.fov_map, x, y, not grid.blocks_vis[i], not grid.blocks_mov[i])
         self.path_map = libtcod.path_new_using_map(self.fov_map)
+        # Any cached paths were found on the old map
+        self.clear_travel_path_cache()
 
         # New map that disallows diagonals - used for roads
         self.rook_path_map = libtcod.path_new_using_map(self.fov_map, 0.0)
@@ -1776,6 +2208,36 @@ class World(Map):
                 libtcod.map_set_properties(self.road_fov_map, x, y, 1, 0)
         self.road_path_map = libtcod.path_new_using_map(self.road_fov_map)
 
+    def __getstate__(self):
+        ''' libtcod's fov and path maps can't be saved - restore_after_load() rebuilds them '''
+        state = self.__dict__.copy()
+        for name in ('fov_map', 'path_map', 'rook_path_map', 'road_fov_map', 'road_path_map'):
+            state[name] = None
+        # Cheap to rebuild, and can be very large
+        state['distance_field_cache'] = OrderedDict()
+        state['travel_path_cache'] = OrderedDict()
+        state['city_subset_floods'] = OrderedDict()
+
+        # Only Regions with something on them besides grid info are saved - the rest are recreated from the grid on demand
+        if isinstance(self.tiles, RegionTiles):
+            regions = self.tiles.loaded_regions()
+        else:
+            regions = (tile for column in self.tiles for tile in column)
+        state['tiles'] = RegionTiles(grid=self.tile_grid, chunk_tiles=self.chunk_tiles, chunk_size=self.chunk_size,
+                                     saved_regions=[region for region in regions if not region.has_only_grid_info()])
+        return state
+
+    def restore_after_load(self):
+        ''' Rebuild the parts of the world which World.__getstate__ leaves out of a snapshot '''
+        self.initialize_fov()
+        # Roads are walkable on the road map, as are the cities they were built from (see City.build_road_to).
+        # Tiles with roads are never left out of a snapshot, so they've all been loaded already
+        for tile in self.tiles.loaded_regions():
+            if tile.has_feature('road'):
+                libtcod.map_set_properties(self.road_fov_map, tile.x, tile.y, 1, 1)
+        for city in self.cities:
+            libtcod.map_set_properties(self.road_fov_map, city.x, city.y, 1, 1)
+
     def display(self):
         ''' Display the world '''
         if g.game.world_map_display_type == 'normal':
@@ -1845,17 +2307,15 @@ class World(Map):
 
 
     def closest_city(self, user, max_range, target_faction=None):
-        closest_city = None
-        closest_dist = max_range + 1  #start with (slightly more than) maximum range
-
-        for city in self.cities:
-            if target_faction is None or city.owner == target_faction:
-                dist = self.get_astar_distance_to(user.x, user.y, city.x, city.y)
-                if dist < closest_dist:  #it's closer, so remember it
-                    closest_city = city
-                    closest_dist = dist
+        cities = [city for city in self.cities if target_faction is None or city.owner == target_faction]
+        closest_city, closest_dist = self.get_closest_city(x=user.x, y=user.y, max_range=max_range, valid_cities=cities)
         return closest_city
 
+    def flag_potential_encounter(self, wx, wy):
+        ''' Mark a tile to be checked for encounters, unless it's a site or there aren't enough figures there '''
+        if (not self.tiles[wx][wy].site) and self.figure_index.count_at(wx, wy) > 1:
+            self.tiles_with_potential_encounters.add(self.tiles[wx][wy])
+
 
     def check_for_encounters(self):
         ''' Loops through all tiles in the world which have been marked as potential encounter zones and checks to see if
@@ -1865,9 +2325,11 @@ class World(Map):
         # Loop through all tiles that have been flagged
         for tile in self.tiles_with_potential_encounters:
             wx, wy = tile.x, tile.y
+            entities = self.figure_index.at(wx, wy)
+            populations = self.population_index.at(wx, wy)
 
             factions_and_entities = defaultdict(list)
-            for entity in tile.entities:
+            for entity in entities:
                 factions_and_entities[entity.creature.faction].append(entity)
 
             for faction, other_faction in itertools.combinations(factions_and_entities.keys(), 2):
@@ -1875,10 +2337,10 @@ class World(Map):
                 if faction.is_hostile_to(other_faction):
                     ## TODO - clean up ugly list comprehensions and whatnot
                     faction_named = [e for e in factions_and_entities[faction] if e.creature.is_available_to_act()]
-                    faction_populations = [p for p in tile.populations if p.faction == faction]
+                    faction_populations = [p for p in populations if p.faction == faction]
 
                     other_faction_named = [e for e in factions_and_entities[other_faction] if e.creature.is_available_to_act()]
-                    other_faction_populations = [p for p in tile.populations if p.faction == other_faction]
+                    other_faction_populations = [p for p in populations if p.faction == other_faction]
 
                     if faction_named and other_faction_named and not g.player in faction_named + other_faction_named:
                         # This will resolve the battle
@@ -1886,10 +2348,11 @@ class World(Map):
                                                     faction1_named=faction_named, faction1_populations=faction_populations,
                                                     faction2_named=other_faction_named, faction2_populations=other_faction_populations)
 
-                        g.game.add_message(battle.describe(), libtcod.color_lerp(g.PANEL_FRONT, faction_named[0].color, .3))
+                        if not g.game.messages_muted:
+                            g.game.add_message(battle.describe(), libtcod.color_lerp(g.PANEL_FRONT, faction_named[0].color, .3))
 
             # Each entity also has a chance of talking to other ones
-            for entity1, entity2 in itertools.combinations(tile.entities, 2):
+            for entity1, entity2 in itertools.combinations(entities, 2):
                 # TODO - should have a chance of spreading rumors too
                 if (entity1.creature.important or entity2.creature.important) and not entity1.creature.faction.is_hostile_to(entity2.creature.faction):
                     entity1.creature.encounter(other=entity2)
@@ -2076,6 +2539,8 @@ class World(Map):
         self.cities.append(city)
         self.all_sites.append(city)
 
+        self.invalidate_city_distance_index(cities_changed=1, roads_changed=0)
+
         return city
 
     def add_mine(self, x, y, city):
@@ -2193,8 +2658,7 @@ class World(Map):
 
     def create_population(self, char, name, faction, creatures, sentients, econ_inventory, wx, wy, site=None, commander=None):
         population = Population(char, name, faction, creatures, sentients, econ_inventory, wx, wy, site, commander)
-        self.tiles[wx][wy].populations.append(population)
-        self.tiles[wx][wy].chunk.add_population(population)
+        self.population_index.insert(population, wx, wy)
 
         return population
 
@@ -2431,14 +2895,16 @@ class Site:
 
         return human
 
-    def run_random_encounter(self):
+    def run_random_encounter(self, encounters=1):
         # Random chance of 2 people encountering each other in a city.
-        if len(g.WORLD.tiles[self.x][self.y].entities) > 2:
-            entity1 = random.choice(g.WORLD.tiles[self.x][self.y].entities)
-            entity2 = random.choice(g.WORLD.tiles[self.x][self.y].entities)
-            if entity1 != entity2:
-                entity1.creature.encounter(other=entity2)
-                entity2.creature.encounter(other=entity1)
+        entities = g.WORLD.figure_index.at(self.x, self.y)
+        if len(entities) > 2:
+            for i in xrange(encounters):
+                entity1 = random.choice(entities)
+                entity2 = random.choice(entities)
+                if entity1 != entity2:
+                    entity1.creature.encounter(other=entity2)
+                    entity2.creature.encounter(other=entity1)
                 # g.game.add_message(' -*- {0} encounters {1} in {2} -*-'.format(entity1.fulltitle(), entity2.fulltitle(), self.get_name()), libtcod.color_lerp(g.PANEL_FRONT, self.color, .3))
 
     def distance_to(self, other):
@@ -2647,6 +3113,8 @@ class City(Site):
             old_x, old_y = x, y
             x, y = libtcod.path_walk(g.WORLD.rook_path_map, True)
 
+        g.WORLD.invalidate_city_distance_index(cities_changed=0, roads_changed=1)
+
     def create_merchant(self, sell_economy, sold_commodity_name):
         ## Create a human to attach an economic agent to
         born = g.WORLD.time_cycle.years_ago(roll(20, 60))
@@ -3127,6 +3595,7 @@ class Object:
         # For the local map
         self.set_local_brain(local_brain)
         # For the world map
+        self.world_brain = None
         self.set_world_brain(world_brain)
 
         # If this thing was designed as a weapon, this flag keeps track of it
@@ -3189,9 +3658,13 @@ class Object:
             self.local_brain.owner = self
 
     def set_world_brain(self, brain):
+        old_brain = self.world_brain
         self.world_brain = brain
         if self.world_brain:  #let the AI component know who owns it
             self.world_brain.owner = self
+            # Take over the old brain's place in the TimeCycle's schedule
+            if old_brain and old_brain.next_tick is not None:
+                g.WORLD.time_cycle.schedule_figure(figure=self, day=old_brain.next_tick)
 
 
     def set_color(self, color):
@@ -3214,6 +3687,7 @@ class Object:
 
     def add_infamy(self, amount):
         self.infamy += amount
+        hist.entity_infamy_changed(self, amount)
 
     def read_information(self, entity=None):
 
@@ -3411,6 +3885,7 @@ class Object:
 
         if self in g.M.creatures:
             g.M.creatures.remove(self)
+            g.M.flag_dmap_dirty(self)
 
     def put_on_clothing(self, clothing):
         ''' Add this clothing to a parent object '''
@@ -3812,6 +4287,7 @@ class Object:
             self.x = x
             self.y = y
             libtcod.map_set_properties(g.M.fov_map, self.x, self.y, True, False)
+            g.M.flag_dmap_dirty(self)
             #libtcod.map_set_properties(M.fov_map, next_step[0], next_step[1], True, False)
             g.M.tiles[self.x][self.y].objects.append(self)
 
@@ -3902,20 +4378,11 @@ class Object:
         #return the distance to some coordinates
         return math.sqrt((x - self.wx) ** 2 + (y - self.wy) ** 2)
 
-    def w_handle_chunk_move(self, x1, y1, x2, y2):
-        ''' Handle this object moving between chunks of the world '''
-        if g.WORLD.tiles[x1][y1].chunk != g.WORLD.tiles[x2][y2].chunk:
-            g.WORLD.tiles[x1][y1].chunk.entities.remove(self)
-            g.WORLD.tiles[x2][y2].chunk.entities.append(self)
-
     def w_teleport(self, x, y):
-        g.WORLD.tiles[self.wx][self.wy].entities.remove(self)
-
-        self.w_handle_chunk_move(self.wx, self.wy, x, y)
-
         self.wx = x
         self.wy = y
-        g.WORLD.tiles[self.wx][self.wy].entities.append(self)
+        g.WORLD.figure_index.move(self, x, y)
+        g.WORLD.time_cycle.move_sleeping_figure(self)
 
         # Army status stuff
         self.world_last_dir = (0, 0)
@@ -3932,13 +4399,10 @@ class Object:
 
         #move by the given amount, if the destination is not blocked
         if not g.WORLD.tile_blocks_mov(self.wx + dx, self.wy + dy):
-            g.WORLD.tiles[self.wx][self.wy].entities.remove(self)
-
-            self.w_handle_chunk_move(self.wx, self.wy, self.wx + dx, self.wy + dy)
-
             self.wx += dx
             self.wy += dy
-            g.WORLD.tiles[self.wx][self.wy].entities.append(self)
+            g.WORLD.figure_index.move(self, self.wx, self.wy)
+            g.WORLD.time_cycle.move_sleeping_figure(self)
 
             # Army status stuff
             self.world_last_dir = (-dx, -dy)
@@ -4591,6 +5055,48 @@ def debug_menu():
                  text='People', topleft=(3, 5), width=width-4, height=3, color=g.PANEL_FRONT, do_draw_box=True, closes_menu=1)
                    ]
 
+    ## Profiling the simulation loop - the phase to cProfile is the most expensive one at this scale
+    profiled_phase = 'week.economy' if g.game.map_scale == 'world' else 'tick.creature_turns'
+    y = height - 12
+    buttons.extend([gui.Button(gui_panel=wpanel, func=profiler.toggle, args=[],
+                 text='Profiler: {0}'.format('on' if profiler.is_enabled() else 'off'), topleft=(3, y), width=width-4, height=3, color=g.PANEL_FRONT, do_draw_box=True, closes_menu=1),
+
+                    gui.Button(gui_panel=wpanel, func=show_phase_stats, args=[],
+                 text='Phase stats', topleft=(3, y+3), width=width-4, height=3, color=g.PANEL_FRONT, do_draw_box=True, closes_menu=1),
+
+                    gui.Button(gui_panel=wpanel, func=profiler.profile_next, args=[profiled_phase],
+                 text='cProfile next {0}'.format(profiled_phase.split('.')[0]), topleft=(3, y+6), width=width-4, height=3, color=g.PANEL_FRONT, do_draw_box=True, closes_menu=1)
+                    ])
+
+    wpanel.gen_buttons = buttons
+
+
+def show_phase_stats():
+    ''' Total time / calls (mean, rolling mean) of each profiled phase of the simulation loop '''
+    height = 50
+    width = 60
+
+    wpanel = gui.GuiPanel(width=width, height=height, xoff=0, yoff=0, interface=g.game.interface)
+
+    buttons = [gui.Button(gui_panel=wpanel, func=g.game.interface.prepare_to_delete_panel, args=[wpanel],
+             text='X', topleft=(width-4, 1), width=3, height=3, color=g.PANEL_FRONT, do_draw_box=True),
+
+               gui.Button(gui_panel=wpanel, func=profiler.dump_stats, args=[],
+             text='Dump to file', topleft=(2, height-4), width=16, height=3, color=g.PANEL_FRONT, do_draw_box=True),
+
+               gui.Button(gui_panel=wpanel, func=profiler.reset, args=[],
+             text='Reset', topleft=(19, height-4), width=9, height=3, color=g.PANEL_FRONT, do_draw_box=True)]
+
+    def render_text_func():
+        y = 2
+        libtcod.console_print(con=wpanel.con, x=2, y=y, fmt='Profiler is {0}'.format('on' if profiler.is_enabled() else 'off'))
+
+        y += 2
+        for line in profiler.format_report(limit=height - 10):
+            y += 1
+            libtcod.console_print(con=wpanel.con, x=2, y=y, fmt=line)
+
+    wpanel.update_render_text_func(func=render_text_func, args=())
     wpanel.gen_buttons = buttons
 
 
@@ -4703,18 +5209,10 @@ class Population:
         return total_number
 
 
-    def w_handle_chunk_move(self, x1, y1, x2, y2):
-        ''' Handle this object moving between chunks of the world '''
-        if g.WORLD.tiles[x1][y1].chunk != g.WORLD.tiles[x2][y2].chunk:
-            g.WORLD.tiles[x1][y1].chunk.populations.remove(self)
-            g.WORLD.tiles[x2][y2].chunk.populations.append(self)
-
     def w_teleport(self, x, y):
-        g.WORLD.tiles[self.wx][self.wy].populations.remove(self)
-        self.w_handle_chunk_move(self.wx, self.wy, x, y)
         self.wx = x
         self.wy = y
-        g.WORLD.tiles[self.wx][self.wy].populations.append(self)
+        g.WORLD.population_index.move(self, x, y)
         # Army status stuff
         self.world_last_dir = (0, 0)
         self.turns_since_move = 0
@@ -4724,11 +5222,9 @@ class Population:
         ''' Moves the population by the given xy coords, and handles updating the map info '''
         #move by the given amount, if the destination is not blocked
         if not g.WORLD.tile_blocks_mov(self.wx + dx, self.wy + dy):
-            g.WORLD.tiles[self.wx][self.wy].populations.remove(self)
-            self.w_handle_chunk_move(self.wx, self.wy, self.wx + dx, self.wy + dy)
             self.wx += dx
             self.wy += dy
-            g.WORLD.tiles[self.wx][self.wy].populations.append(self)
+            g.WORLD.population_index.move(self, self.wx, self.wy)
 
             # Army status stuff
             self.world_last_dir = (-dx, -dy)
@@ -5055,6 +5551,8 @@ class Creature:
 
     def set_status(self, status):
         self.status = status
+        if g.game.map_scale == 'human':
+            g.M.flag_dmap_dirty(self.owner)
 
     def set_stance(self, stance):
         self.stance = stance
@@ -5113,8 +5611,9 @@ class Creature:
 
         current_tile_cost = 0
         for desire, amount in self.dijmap_desires.iteritems():
-            if g.M.dijmaps[desire].dmap[i][j] is not None:
-                current_tile_cost += (g.M.dijmaps[desire].dmap[i][j] * amount)
+            value = g.M.dijmaps[desire].get_value(i, j)
+            if value is not None:
+                current_tile_cost += (value * amount)
 
         # Find any neighbors with a cost less than current
         for (x, y) in ( (i - 1, j - 1), (i, j - 1), (i + 1, j - 1),
@@ -5125,8 +5624,9 @@ class Creature:
                 ## Check each desire, multiply by amount, and save if necessary
                 weighted_desire = 0
                 for desire, amount in self.dijmap_desires.iteritems():
-                    if g.M.dijmaps[desire].dmap[x][y] is not None:
-                        weighted_desire += (g.M.dijmaps[desire].dmap[x][y] * amount)
+                    value = g.M.dijmaps[desire].get_value(x, y)
+                    if value is not None:
+                        weighted_desire += (value * amount)
                     ## Only move if we have a reason to
                 if weighted_desire < current_tile_cost and not g.M.tile_blocks_mov(x, y):
                     current_tile_cost = weighted_desire
@@ -5201,12 +5701,12 @@ class Creature:
         # Hacking in some defaults for now
         attacking_weapon = self.get_current_weapon()
         attacking_object_component = attacking_weapon.components[0]
-        force = attacking_weapon.get_mass() * (roll(100, 160)/10)
+        force = attacking_weapon.get_mass() * (rng.combat.randint(100, 160)/10)
 
         # Calculate the body parts that can be hit from this attack
         # TODO - needs to handle targets which don't have any valid componenets
         possible_target_components = target.get_possible_target_components_from_attack_position(position=combat_move.position)
-        target_component = random.choice(possible_target_components)
+        target_component = rng.combat.choice(possible_target_components)
 
 
         # Find chances of attack hitting
@@ -5215,7 +5715,7 @@ class Creature:
         attack_chance = sum(attack_modifiers.values())
         defend_chance = int(sum(defend_modifiers.values())/2)
 
-        if roll(1, attack_chance + defend_chance) < attack_chance:
+        if rng.combat.randint(1, attack_chance + defend_chance) < attack_chance:
             chances_to_hit = target_component.get_chances_to_hit_exposed_layers()
             # Weighted choice, from stackoverflow
             targeted_layer = weighted_choice(chances_to_hit)
@@ -5437,7 +5937,7 @@ class Creature:
             elif question_type == 'battles':
                 found_event = 0
                 for event_id in self.get_knowledge_of_events(days_ago=360):
-                    if hist.historical_events[event_id].type_ == 'battle':
+                    if hist.historical_events.get_type(event_id) == 'battle':
                         found_event = 1
                         self.say(hist.historical_events[event_id].describe())
                         self.say('I heard this from {0} on {1}'.format(self.knowledge['events'][event_id]['description']['source'].fulltitle(),
@@ -5449,7 +5949,7 @@ class Creature:
                 found_event = 0
                 other_event_types = ('marriage', 'birth', 'death', 'travel_start', 'travel_end')
                 for event_id in self.get_knowledge_of_events(days_ago=360):
-                    if hist.historical_events[event_id].type_ in other_event_types:
+                    if hist.historical_events.get_type(event_id) in other_event_types:
                         found_event = 1
                         self.say(hist.historical_events[event_id].describe())
                         self.say('I heard this from {0} on {1}'.format(self.knowledge['events'][event_id]['description']['source'].fulltitle(),
@@ -5762,7 +6262,8 @@ class Creature:
         # Remove from the list of all figures, and the important ones if we're important
         if figure in g.WORLD.all_figures:
             g.WORLD.all_figures.remove(figure)
-            g.WORLD.tiles[figure.wx][figure.wy].entities.remove(figure)
+            g.WORLD.figure_index.remove(figure)
+            g.WORLD.time_cycle.wake_figure(figure)
 
 
             # The faction lead passes on, if we lead a faction
@@ -5834,7 +6335,7 @@ class Creature:
 
 
     def get_age(self):
-        return g.WORLD.time_cycle.date_dif(earlier_date=self.born, later_date=g.WORLD.time_cycle.get_current_date())
+        return (g.WORLD.time_cycle.day_number - self.born) // g.WORLD.time_cycle.days_per_year
 
     def get_profession(self):
         if self.profession:
@@ -5852,8 +6353,8 @@ class Creature:
         spouse.creature.spouse = self.owner
 
         # Update infamy
-        self.owner.infamy += int(spouse.infamy/2)
-        spouse.infamy += int(self.owner.infamy/2)
+        self.owner.add_infamy(amount=int(spouse.infamy/2))
+        spouse.add_infamy(amount=int(self.owner.infamy/2))
 
         if date == 'today':
             date = g.WORLD.time_cycle.get_current_date()
@@ -5975,10 +6476,9 @@ class Creature:
         self.add_person_location_knowledge(other_person=other, date_learned=date, date_at_loc=date, location=(self.owner.wx, self.owner.wy), heading=other.world_last_dir, source=self.owner)
         self.update_meeting_info(other, date)
 
-        for event_id in self.knowledge['events']:
-            # Only share events that are important. TODO - also share events pertaining to loved ones, even if they're not important
-            if hist.historical_events[event_id].get_importance() >= 50:
-                other.creature.add_knowledge_of_event(event_id=event_id, date_learned=date, source=self.owner)
+        # Only share events that are important. TODO - also share events pertaining to loved ones, even if they're not important
+        for event_id in hist.get_important_events(self.knowledge['events']):
+            other.creature.add_knowledge_of_event(event_id=event_id, date_learned=date, source=self.owner)
 
 
     def add_knowledge_of_event(self, event_id, date_learned, source, location_accuracy=1):
@@ -6006,23 +6506,24 @@ class Creature:
         # 5 means we know exact location
         if location_accuracy == 5:
             # With the knowledge of the event location comes the knowledge that those who participated in the event must have been there at that time
-            for entity in hist.historical_events[event_id].get_entities():
+            event = hist.historical_events[event_id]
+            for entity in event.get_entities():
                 # If we know about the person, and the date of the event is
-                if entity in self.knowledge['entities'] and self.knowledge['entities'][entity]['location']['date_at_loc'] < hist.historical_events[event_id].date:
-                    self.add_person_location_knowledge(other_person=entity, date_learned=date_learned, date_at_loc=hist.historical_events[event_id].date,
-                                                       location=hist.historical_events[event_id].location, heading=-1, source=source)
+                if entity in self.knowledge['entities'] and self.knowledge['entities'][entity]['location']['date_at_loc'] < event.date:
+                    self.add_person_location_knowledge(other_person=entity, date_learned=date_learned, date_at_loc=event.date,
+                                                       location=event.location, heading=-1, source=source)
 
                 ## If we haven't heard of the other person yet, we won't know much other than that they were there
                 elif entity not in self.knowledge['entities']:
                     self.add_awareness_of_person(other_person=entity)
-                    self.add_person_location_knowledge(other_person=entity, date_learned=date_learned, date_at_loc=hist.historical_events[event_id].date,
-                                                       location=hist.historical_events[event_id].location, heading=-1, source=source)
+                    self.add_person_location_knowledge(other_person=entity, date_learned=date_learned, date_at_loc=event.date,
+                                                       location=event.location, heading=-1, source=source)
 
             #g.game.add_message(' ~   ~~ {0} has learned that {1}    '.format(self.owner.fullname(), hist.historical_events[event_id].describe()))
 
     def get_knowledge_of_events(self, days_ago):
-        today = g.WORLD.time_cycle.get_current_date()
-        return [e_id for e_id in self.knowledge['events'] if g.WORLD.time_cycle.date_dif(earlier_date=hist.historical_events[e_id].date, later_date=today, mode='days') <= days_ago]
+        today = g.WORLD.time_cycle.day_number
+        return hist.historical_events.get_events_since(first_day=today - days_ago, event_ids=self.knowledge['events'])
 
     def add_knowledge_of_site(self, site, date_learned, source, location_accuracy=1):
         if site not in self.knowledge['sites']:
@@ -6334,6 +6835,7 @@ class DijmapSapient:
         actor = self.owner
         actor.creature.nonverbal_behavior(' is now %s'%ai_state )
         self.ai_state  = ai_state
+        g.M.flag_dmap_dirty(actor)
 
         if self.ai_state  == 'attacking':
             # This will clear the target, in case they happen to be following someone or whatever
@@ -6403,57 +6905,51 @@ class DijmapSapient:
         # TODO - make sure this makeshift code is turned into something much more intelligent
         weapon = self.owner.creature.get_current_weapon()
         if weapon:
-            opening_move = random.choice([m for m in combat.melee_armed_moves if m not in self.owner.creature.last_turn_moves])
-            move2 = random.choice([m for m in combat.melee_armed_moves if m != opening_move and m not in self.owner.creature.last_turn_moves])
+            opening_move = rng.combat.choice([m for m in combat.melee_armed_moves if m not in self.owner.creature.last_turn_moves])
+            move2 = rng.combat.choice([m for m in combat.melee_armed_moves if m != opening_move and m not in self.owner.creature.last_turn_moves])
             self.owner.creature.set_combat_attack(target=enemy, opening_move=opening_move, move2=move2)
 
 
+# For figures without goals - the 1 in X chance per day, by intelligence level, of picking up a new one
+IDLE_GOAL_CHANCES = {3: 10, 2: 100}
+
 class BasicWorldBrain:
     def __init__(self):
         self.path = None
-        self.next_tick = 0
+        # Day number of our next turn in the TimeCycle's schedule, or None if we're not scheduled
+        self.next_tick = None
+        # Set by the TimeCycle when first scheduled - used to order turns taken on the same day
+        self.schedule_order = None
+        self.last_turn_day = None
+        # Days slept through between our last turn and this one (see take_goal_behavior)
+        self.days_asleep = 0
+        # Day on which the daily roll for picking up a new goal will succeed (see roll_for_idle_goal)
+        self.idle_goal_day = None
 
         self.current_goal_path = []
 
-    def find_cheapest_behavior_path(self, behavior_paths_costed):
-
-        figure = self.owner
-        current_lowest_cost, current_lowest_behavior_path = 100000, None
-        all_costs = []
-        for behavior_path, behavior_base_costs in behavior_paths_costed:
-            # Each behavior path gets a running cost total
-            total_cost = 0
-            for cost_aspect, base_cost in behavior_base_costs.iteritems():
-                # Go through each trait and see what that trait adds to the total cost
-                cost_multiplier = 1
-                for trait, trait_intensity in figure.creature.traits.iteritems():
-                    cost_multiplier *= TRAIT_INFO[trait]['behavior_modifiers'][cost_aspect]
-                    #trait_cost_multiplier = TRAIT_INFO[trait]['behavior_modifiers'][cost_aspect]
-                    #total_cost += (base_cost * trait_cost_multiplier)
-                total_cost += (base_cost * cost_multiplier)
-
-            if total_cost < current_lowest_cost:
-                current_lowest_cost = total_cost
-                current_lowest_behavior_path = behavior_path
-
-            all_costs.append((behavior_path, total_cost))
-
-        return current_lowest_behavior_path, current_lowest_cost, all_costs
+    def get_cost_multipliers(self):
+        ''' How much each aspect of a behavior's cost (time, money, morality...) weighs on us, given our traits '''
+        cost_multipliers = {}
+        for cost_aspect in goap.COST_ASPECTS:
+            # Go through each trait and see what that trait multiplies the cost by
+            cost_multiplier = 1
+            for trait, trait_intensity in self.owner.creature.traits.iteritems():
+                cost_multiplier *= TRAIT_INFO[trait]['behavior_modifiers'][cost_aspect]
+            cost_multipliers[cost_aspect] = cost_multiplier
 
+        return cost_multipliers
 
     def set_goal(self, goal_state, reason, priority=1):
 
-        behavior_paths_costed = goap.get_costed_behavior_paths(goal_state=goal_state, entity=self.owner)
-
-        best_path, best_cost, all_costs = self.find_cheapest_behavior_path(behavior_paths_costed=behavior_paths_costed)
-
-        #for path, cost in all_costs:
-        #    print [b.behavior for b in path], cost
+        best_path, best_cost = goap.find_best_behavior_path(goal_state=goal_state, entity=self.owner, cost_multipliers=self.get_cost_multipliers())
 
         if best_path:
             # Add to current goal list
             goap.set_behavior_parents(behavior_path=best_path)
             self.current_goal_path = best_path
+            # Wake up, if we were sleeping
+            g.WORLD.time_cycle.schedule_figure(figure=self.owner, day=g.WORLD.time_cycle.day_number)
             # print self.owner.fulltitle(), 'desiring to', goal_state.get_name(), ' -- behaviors:', join_list([b.get_name() for b in best_path])
         else:
             logging.warning("Goal paths: {0} had no best path to {1}".format(self.owner.fulltitle(), goal_state.get_name()) )
@@ -6478,6 +6974,11 @@ class BasicWorldBrain:
 
         if not current_goal.activated:
             current_goal.activate()
+        # Catch up on the days we slept through, which would only have added to its progress
+        elif self.days_asleep:
+            waiting_days = min(self.days_asleep, current_goal.get_waiting_days())
+            if waiting_days:
+                current_goal.add_waiting_days(waiting_days)
 
         current_goal.take_behavior_action()
 
@@ -6492,18 +6993,18 @@ class BasicWorldBrain:
         if self.owner.creature.intelligence_level == 3:
             # Pick a spouse and get married immediately
             if creature.spouse is None and self.owner.creature.sex == 1 and g.MIN_MARRIAGE_AGE <= age <= g.MAX_MARRIAGE_AGE:
-                if roll(1, 48) >= 48:
+                if rng.world_ai.randint(1, 48) >= 48:
                     self.pick_spouse()
 
             # Have kids! Currenly limiting to 2 for non-important, 5 for important (will need to be fixed/more clear later)
             # Check female characters, and for now, a random chance they can have kids
             if creature.spouse and self.owner.creature.sex == 0 and g.MIN_CHILDBEARING_AGE <= age <= g.MAX_CHILDBEARING_AGE and len(creature.children) <= (creature.important * 3) + 2:
-                if roll(1, 20) == 20:
+                if rng.world_ai.randint(1, 20) == 20:
                     creature.have_child()
 
             ####### Specal case - bards #######
             if self.owner.creature.profession and self.owner.creature.profession.name == 'Bard':
-                target_city = random.choice([city for city in g.WORLD.cities if (city.x, city.y) != (self.owner.wx, self.owner.wy)])
+                target_city = rng.world_ai.choice([city for city in g.WORLD.cities if (city.x, city.y) != (self.owner.wx, self.owner.wy)])
                 reason = 'travel from city to city to make my living!'
                 goal_state = goap.IsHangingOut(target_location=(target_city.x, target_city.y), entity=self.owner, action='perform music')
                 self.set_goal(goal_state=goal_state, reason=reason)
@@ -6521,7 +7022,7 @@ class BasicWorldBrain:
             if len(potential_spouses) == 0 and self.owner.creature.current_citizenship:
                 # Make a person out of thin air to marry
                 sex = abs(self.owner.creature.sex-1)
-                born = g.WORLD.time_cycle.years_ago(roll(18, 30))
+                born = g.WORLD.time_cycle.years_ago(rng.world_ai.randint(18, 30))
                 potential_spouses = [self.owner.creature.current_citizenship.create_inhabitant(sex=sex, born=born,
                                                                                 dynasty=None, race=self.owner.creature.type_,
                                                                                 important=self.owner.creature.important,
@@ -6530,7 +7031,7 @@ class BasicWorldBrain:
                 g.game.add_message('{0} wanted to pick a spouse, but was not a citizen of any city'.format(self.owner.fulltitle()), libtcod.dark_red)
                 return
 
-            spouse = random.choice(potential_spouses)
+            spouse = rng.world_ai.choice(potential_spouses)
 
             self.owner.creature.meet(spouse)
 
@@ -6548,6 +7049,51 @@ class BasicWorldBrain:
 
             return spouse
 
+    def roll_for_idle_goal(self, chance):
+        ''' The 1 in chance roll figures without goals make each day to pick up a new one. While fast-forwarding history,
+        we roll for how many days it will take to succeed instead, and sleep until then '''
+        time_cycle = g.WORLD.time_cycle
+        if not time_cycle.fast_forward:
+            self.idle_goal_day = None
+            return rng.world_ai.randint(1, chance) == 1
+
+        today = time_cycle.day_number
+
+        # We've been woken up on the day the roll succeeds
+        if self.idle_goal_day == today:
+            self.idle_goal_day = None
+            return 1
+
+        # Number of failed daily rolls before the first success (geometric distribution)
+        days_until_success = int(math.log(1 - rng.world_ai.random()) / math.log(1 - (1 / chance)))
+        if days_until_success == 0:
+            self.idle_goal_day = None
+            return 1
+
+        self.idle_goal_day = today + days_until_success
+        return 0
+
+    def get_next_turn_day(self, today):
+        ''' After taking a turn, the day on which we next need to take one. Figures sleep through days where they'd do
+        nothing but count up a behavior's progress, and while history is being fast-forwarded, days where they'd fail
+        their idle goal roll. None means not until we're given a goal '''
+        if not self.owner.creature.is_available_to_act():
+            return today + 1
+
+        elif self.current_goal_path:
+            # Skip over days where the current behavior would only be counting up its progress - those days are
+            # added on once we wake up (see take_goal_behavior)
+            behavior = self.current_goal_path[0]
+            return today + 1 + (behavior.get_waiting_days() if behavior.activated else 0)
+
+        elif self.owner.creature.intelligence_level in IDLE_GOAL_CHANCES:
+            if not g.WORLD.time_cycle.fast_forward:
+                return today + 1
+            # Roll again tomorrow if the last roll succeeded, but no goal came of it
+            return self.idle_goal_day if self.idle_goal_day is not None and self.idle_goal_day > today else today + 1
+
+        return None
+
     def take_turn(self):
         ''' Covers taking a "turn" on the world map. This is run daily to resolve issues of pursuing goals. Larger decisions
             about what goals to pursue will likely be made elsewhere, run less frequently '''
@@ -6558,26 +7104,34 @@ class BasicWorldBrain:
                 self.take_goal_behavior()
             ## Otherwise, for now, some debug behaviors chosen at random.
             else:
-                if self.owner.creature.intelligence_level == 3 and roll(1, 10) == 1:
+                if self.owner.creature.intelligence_level == 3 and self.roll_for_idle_goal(chance=IDLE_GOAL_CHANCES[3]):
                     unique_objs = [o for o in self.owner.creature.faction.unique_object_dict if 'weapon' in self.owner.creature.faction.unique_object_dict[o]['tags']]
-                    item_name = random.choice(unique_objs) if unique_objs else 'shirt'
+                    item_name = rng.world_ai.choice(unique_objs) if unique_objs else 'shirt'
 
                     self.set_goal(goal_state=goap.HaveItem(item_name=item_name, entity=self.owner), reason='hehehehehe', priority=1)
 
-                elif self.owner.creature.intelligence_level == 2 and roll(1, 100) == 1:
+                elif self.owner.creature.intelligence_level == 2 and self.roll_for_idle_goal(chance=IDLE_GOAL_CHANCES[2]):
                     self.set_goal(goal_state=goap.HaveShelter(entity=self.owner), reason='hehehehe', priority=1)
 
-            # If we can threaten the economic output of a tile, flag any economic agents working that tile as unable to work
-            if self.owner.creature.threatens_economic_output() and g.WORLD.tiles[wx][wy].territory and self.owner.creature.faction.is_hostile_to(g.WORLD.tiles[wx][wy].territory.faction):
-                for resource, info in g.WORLD.tiles[wx][wy].region.agent_slots.iteritems():
-                    for agent in info['agents']:
-                        agent.activity_is_blocked = 1
+            self.flag_world_tile()
+
+    def flag_world_tile(self):
+        ''' The daily effects of being on our world tile. For figures sleeping through the day, TimeCycle.run_figure_turns
+        takes care of these '''
+        self.block_economic_output()
 
-            # Add to world's set of tiles which can potentially have encounters - later in the turn sequence, the game
-            # will check these tiles and run the encounters as necessary. Only add tiles which aren't sites, and tiles
-            # with more than 1 entity in it
-            if (not g.WORLD.tiles[self.owner.wx][self.owner.wy].site) and len(g.WORLD.tiles[self.owner.wx][self.owner.wy].entities) > 1:
-                g.WORLD.tiles_with_potential_encounters.add(g.WORLD.tiles[self.owner.wx][self.owner.wy])
+        # Add to world's set of tiles which can potentially have encounters - later in the turn sequence, the game
+        # will check these tiles and run the encounters as necessary. Only add tiles which aren't sites, and tiles
+        # with more than 1 entity in it
+        g.WORLD.flag_potential_encounter(self.owner.wx, self.owner.wy)
+
+    def block_economic_output(self):
+        ''' If we can threaten the economic output of our tile, flag any economic agents working it as unable to work '''
+        wx, wy = self.owner.wx, self.owner.wy
+        if self.owner.creature.threatens_economic_output() and g.WORLD.tiles[wx][wy].territory and self.owner.creature.faction.is_hostile_to(g.WORLD.tiles[wx][wy].territory.faction):
+            for resource, info in g.WORLD.tiles[wx][wy].region.agent_slots.iteritems():
+                for agent in info['agents']:
+                    agent.activity_is_blocked = 1
 
 
     '''
@@ -6614,50 +7168,129 @@ class TimeCycle(object):
         self.current_weekday = 0
         self.current_month = 0
         self.current_year = 1
+        self.days_per_year = self.days_per_month * self.months_per_year
+        # Today's date. Dates are kept as day numbers - the number of days since the start of year 0 - so that date math
+        # is plain integer arithmetic. They're only split into (year, month, day) for display (see date_to_text)
+        self.day_number = self.ymd_to_date(self.current_year, self.current_month, self.current_day)
+
+        # Set while history is being fast-forwarded - see World.run_history
+        self.fast_forward = 0
+
+        # Heap of (day number, -schedule order, figure) for figures' world brain turns. Figures whose brain has a
+        # different next_tick than their entry are stale entries, and are skipped
+        self.figure_schedule = []
+        self.figures_scheduled = 0
+        # Figures who aren't taking a turn tomorrow, by position - the days they sleep through still flag their tile (see
+        # run_figure_turns). Of those, the ones who threaten the economic output of their tile
+        self.sleeping_figures = SpatialHash(cell_size=g.SPATIAL_HASH_CELL_SIZE)
+        self.sleeping_threats = set()
 
         self.weekdays = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
         self.months = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December')
 
-        ## Dict of events, with keys being the future Y, M, and D, and values being a list of events
-        self.events = defaultdict(list)
+        ## Heap of (date, order added, event) for events scheduled on future days
+        self.events = []
+        self.events_added = 0
 
     def get_future_date(self, days_in_advance):
-        (years, months, days_left) = self.days_to_date(days_in_advance)
+        return self.day_number + days_in_advance
 
-        total_days = self.current_day + days_left
-        if total_days <= self.days_per_month:
-            future_day = total_days
-        else:
-            future_day = total_days - self.days_per_month
-            months += 1 #should never be more than 1 month
+    def days_to_date(self, number_of_days):
+        ''' Convert # of days to a (years, months, days) tuple - for a date, this is its (year, month, day) '''
+        (years, remainder) = divmod(number_of_days, self.days_per_year)
+        (months, days_left) = divmod(remainder, self.days_per_month)
 
-        total_months = self.current_month + months
-        if total_months <= self.months_per_year:
-            future_month = total_months
-        else:
-            future_month = total_months - self.months_per_year
-            years += 1 #should never be more than 1 year
+        return (years, months, days_left)
 
-        future_year = self.current_year + years
+    def ymd_to_date(self, year, month, day):
+        ''' Convert a year, month and day to a date (day number) '''
+        return year * self.days_per_year + month * self.days_per_month + day
 
-        return (future_year, future_month, future_day)
+    def schedule_figure(self, figure, day):
+        ''' Make sure the figure takes a world brain turn on the given day number (or earlier, if it's already scheduled
+        for that). On any given day, the most recently scheduled figures go first '''
+        brain = figure.world_brain
+        if brain.next_tick is not None and brain.next_tick <= day:
+            return
 
-    def days_to_date(self, number_of_days):
-        ''' Convert # of days to a (years, months, days) tuple '''
-        (years, remainder) = divmod(number_of_days, (self.months_per_year * self.days_per_month))
-        (months, days_left) = divmod(remainder, self.days_per_month)
+        if brain.schedule_order is None:
+            self.figures_scheduled += 1
+            brain.schedule_order = self.figures_scheduled
 
-        return (years, months, days_left)
+        brain.next_tick = day
+        heappush(self.figure_schedule, (day, -brain.schedule_order, figure))
+
+    def run_figure_turns(self):
+        ''' Have every figure who is due take their world brain turn, then schedule their next one '''
+        today = self.day_number
+        schedule = self.figure_schedule
+
+        while schedule and schedule[0][0] <= today:
+            day, order, figure = heappop(schedule)
+            brain = figure.world_brain
+            # Stale entry, or a figure who has stopped taking turns
+            if brain is None or brain.next_tick != day:
+                continue
+            brain.next_tick = None
+            self.wake_figure(figure)
+            if figure.creature.status == 'dead':
+                continue
+
+            # Woken up again after we already had our turn today
+            if brain.last_turn_day == today:
+                self.schedule_figure(figure=figure, day=today + 1)
+                continue
+
+            brain.days_asleep = today - brain.last_turn_day - 1 if brain.last_turn_day is not None else 0
+            brain.last_turn_day = today
+            brain.take_turn()
+
+            if brain.next_tick is None:
+                next_turn_day = brain.get_next_turn_day(today)
+                if next_turn_day is not None:
+                    self.schedule_figure(figure=figure, day=next_turn_day)
+
+            if brain.next_tick is None or brain.next_tick > today + 1:
+                self.put_figure_to_sleep(figure)
+
+        # Figures sleeping through today still threaten the tile they're on, and can run into others there
+        for x, y, figures in self.sleeping_figures.occupied_positions():
+            g.WORLD.flag_potential_encounter(x, y)
+        for figure in self.sleeping_threats:
+            if figure.creature.is_available_to_act():
+                figure.world_brain.block_economic_output()
+
+    def put_figure_to_sleep(self, figure):
+        self.sleeping_figures.insert(figure, figure.wx, figure.wy)
+        # Kept to the ones who threatened it when they fell asleep, so the daily check doesn't go through every sleeper
+        if figure.creature.threatens_economic_output():
+            self.sleeping_threats.add(figure)
+
+    def wake_figure(self, figure):
+        if figure in self.sleeping_figures:
+            self.sleeping_figures.remove(figure)
+            self.sleeping_threats.discard(figure)
+
+    def move_sleeping_figure(self, figure):
+        ''' Sleeping figures can still be moved along by their commander '''
+        if figure in self.sleeping_figures:
+            self.sleeping_figures.move(figure, figure.wx, figure.wy)
+
+    def wake_all_figures(self):
+        ''' Once history stops being fast-forwarded, every figure goes back to taking a turn each day '''
+        for figure in g.WORLD.all_figures:
+            if figure.world_brain and figure.creature.status != 'dead':
+                self.schedule_figure(figure=figure, day=self.day_number)
 
     def add_event(self, date, event):
-        ''' Should add an event to the scheduler'''
-        (year, month, day) = date
-        self.events[(year, month, day)].append(event)
+        ''' Schedule a function to be called on the given date. Events on the same day are called in the order they were added '''
+        self.events_added += 1
+        heappush(self.events, (date, self.events_added, event))
 
     def handle_events(self):
-        if (self.current_year, self.current_month, self.current_day) in self.events:
-            for event in self.events[(self.current_year, self.current_month, self.current_day)]:
-                event()
+        while self.events and self.events[0][0] <= self.day_number:
+            date, order, event = heappop(self.events)
+            event()
 
     def check_tick(self):
         if self.current_tick == self.ticks_per_hour:
@@ -6675,10 +7308,7 @@ class TimeCycle(object):
 
         if self.current_hour == self.hours_per_day + 1:
             self.current_hour = 0
-            self.current_day += 1
-            self.current_weekday += 1
-            self.check_day()
-
+            # day_tick moves the calendar on by a day
             self.day_tick()
 
     def next_day(self):
@@ -6692,6 +7322,7 @@ class TimeCycle(object):
         # Day to day stuff
         self.current_day += 1
         self.current_weekday += 1
+        self.day_number += 1
 
         # Change week (civs take turn)
         if self.current_weekday == self.days_per_week:
@@ -6719,17 +7350,13 @@ class TimeCycle(object):
         pass
 
     def get_current_date(self):
-        return (self.current_year, self.current_month, self.current_day)
+        return self.day_number
 
     def date_dif(self, earlier_date, later_date, mode='years'):
-        years1, months1, days1 = earlier_date
-        years2, months2, days2 = later_date
-
-        days_dif = ((years2 * self.days_per_month * self.months_per_year) + (months2 * self.days_per_month) + days2 ) - \
-                   ((years1 * self.days_per_month * self.months_per_year) + (months1 * self.days_per_month) + days1 )
+        days_dif = later_date - earlier_date
 
         if mode == 'years':
-            return int(days_dif / (self.days_per_month * self.months_per_year) )
+            return int(days_dif / self.days_per_year)
         elif mode == 'months':
             return int(days_dif / self.days_per_month)
         elif mode == 'days':
@@ -6741,7 +7368,7 @@ class TimeCycle(object):
     #    return '{0}, {1} {2}'.format(self.weekdays[self.current_weekday], self.months[self.current_month], self.current_day + 1)
 
     def date_to_text(self, date):
-        year, month, day = date
+        year, month, day = self.days_to_date(date)
         return '{0} {1}, {2}'.format(self.months[month], day + 1, year)
 
     def get_current_time(self):
@@ -6754,12 +7381,10 @@ class TimeCycle(object):
         return '{0}:{1}'.format(self.current_hour, minutes)
 
     def years_ago(self, years, randomize=1):
-        year = self.current_year - years
-
         if randomize:
-            return (year, roll(0, self.months_per_year - 1), roll(0, self.days_per_month - 1))
+            return self.ymd_to_date(self.current_year - years, roll(0, self.months_per_year - 1), roll(0, self.days_per_month - 1))
         else:
-            return (year, self.current_month, self.current_day)
+            return self.day_number - years * self.days_per_year
 
     #a tick method, which was implemented before libtcod. it now keeps track of how many turns have passed.
     def tick(self):
@@ -6767,6 +7392,18 @@ class TimeCycle(object):
         self.check_tick()
 
         ### Creatures
+        with profiler.phase('tick.creature_turns'):
+            self.run_creature_turns()
+
+        # Now that entities have made their moves, calculate the outcome of any combats
+        with profiler.phase('tick.combat'):
+            combat.handle_combat_round(actors=g.M.creatures)
+
+        with profiler.phase('tick.update_dmaps'):
+            g.M.update_dmaps()
+
+    def run_creature_turns(self):
+        ''' Handle the tick for everything on the current map, and let anyone who's due take their turn '''
         for creature in g.M.creatures:
             creature.creature.handle_tick()
 
@@ -6792,40 +7429,47 @@ class TimeCycle(object):
                 actor.creature.next_tick = next_tick
                 actor.local_brain.take_turn()
 
-        # Now that entities have made their moves, calculate the outcome of any combats
-        combat.handle_combat_round(actors=g.M.creatures)
-
-        g.M.update_dmaps()
-
 
     def day_tick(self):
         ''' All the events that happen each day in the world '''
         self.check_day()
-        self.handle_events()
+        with profiler.phase('day.events'):
+            self.handle_events()
+
+        # Each day, random people in cities can encounter one another to spread knowledge. When fast-forwarding,
+        # a batch of encounters covering several days is run at once
+        with profiler.phase('day.city_encounters'):
+            if not self.fast_forward:
+                for city in g.WORLD.cities:
+                    city.run_random_encounter()
+            elif self.day_number % g.HISTORY_ENCOUNTER_BATCH_DAYS == 0:
+                for city in g.WORLD.cities:
+                    city.run_random_encounter(encounters=g.HISTORY_ENCOUNTER_BATCH_DAYS)
 
-        # Each day, random people in cities can encounter one another to spread knowledge
-        for city in g.WORLD.cities:
-            city.run_random_encounter()
+        # Then, all entities in the world who need to can take their turn
+        with profiler.phase('day.world_brains'):
+            self.run_figure_turns()
 
-        # Then, all entities in the world can take their daily turn
-        for figure in reversed(g.WORLD.all_figures):
-            if figure.world_brain: #and figure .world_brain.next_tick == self.current_day:
-                #figure.world_brain.next_tick = self.next_day()
-                figure.world_brain.take_turn()
+        with profiler.phase('day.world_encounters'):
+            g.WORLD.check_for_encounters()
 
-        g.WORLD.check_for_encounters()
+        if profiler.is_enabled() and self.day_number % g.PROFILE_DUMP_DAYS == 0:
+            profiler.dump_stats(day_number=self.day_number, date=self.date_to_text(self.get_current_date()),
+                                figures=len(g.WORLD.all_figures), cities=len(g.WORLD.cities))
 
 
 
     def week_tick(self):
         begin = time.time()
         # Cheaply defined to get civs working per-day
-        for city in self.world.cities:
-            city.econ.run_simulation()
-        g.game.add_message('econ run in {0:.2f} seconds'.format(time.time() - begin))
+        with profiler.phase('week.economy'):
+            economy.run_economies([city.econ for city in self.world.cities], processes=g.ECONOMY_PROCESSES)
+        if not g.game.messages_muted:
+            g.game.add_message('econ run in {0:.2f} seconds'.format(time.time() - begin))
 
-        for city in self.world.cities:
-            city.dispatch_caravans()
+        with profiler.phase('week.caravans'):
+            for city in self.world.cities:
+                city.dispatch_caravans()
 
 
         # Player econ preview - to show items we're gonna bid on
@@ -6843,10 +7487,11 @@ class TimeCycle(object):
         self.check_month()
 
         ## Have figures do some stuff monthly
-        for figure in g.WORLD.all_figures[:]:
-            ## TODO - make sure this check works out all the time
-            if figure.creature.is_available_to_act():
-                figure.world_brain.monthly_life_check()
+        with profiler.phase('month.life_checks'):
+            for figure in g.WORLD.all_figures[:]:
+                ## TODO - make sure this check works out all the time
+                if figure.creature.is_available_to_act():
+                    figure.world_brain.monthly_life_check()
 
 
     def year_tick(self):
@@ -7012,6 +7657,8 @@ class Camera:
 
 class Culture:
     def __init__(self, color, language, world, races):
+        # Culture generation draws from the culture stream (see rng.py)
+        roll = rng.culture.randint
         self.color = color
         self.language = language
         self.name = self.gen_word(syllables=roll(1, 3), num_phonemes=(3, 20), cap=1)
@@ -7049,6 +7696,8 @@ class Culture:
 
     def expand_culture_territory(self):
         ''' Once all cultures are created, they expand one turn at a time. This is the method called to expand '''
+        # Culture generation draws from the culture stream (see rng.py)
+        roll = rng.culture.randint
         newedge = []
         expanded = 0
         for (x, y) in self.edge:
@@ -7075,16 +7724,18 @@ class Culture:
 
 
     def set_culture_traits(self):
+        # Culture generation draws from the culture stream (see rng.py)
+        roll, choice = rng.culture.randint, rng.culture.choice
         trait_num = roll(3, 4)
         while trait_num > 0:
-            trait = random.choice(CULTURE_TRAIT_INFO.keys())
+            trait = choice(CULTURE_TRAIT_INFO.keys())
 
             for otrait in self.culture_traits:
                 if trait in CULTURE_TRAIT_INFO[otrait]['opposed_traits'] or trait == otrait:
                     break
             else:
                 # "Somewhat = .5, regular = 1, "very" = 2
-                multiplier = random.choice([.5, .5, 1, 1, 1, 1, 2])
+                multiplier = choice([.5, .5, 1, 1, 1, 1, 2])
                 self.culture_traits[trait] = multiplier
                 trait_num -= 1
 
@@ -7119,6 +7770,8 @@ class Culture:
 
     def create_culture_weapons(self):
         ''' Culturally specific weapons '''
+        # Culture generation draws from the culture stream (see rng.py)
+        roll, choice = rng.culture.randint, rng.culture.choice
         # If we can't access resources, for now we can still make weapons out of wood
         if not ('iron' in self.access_res or 'bronze' in self.access_res or 'copper' in self.access_res):
             weapon_types = phys.basic_weapon_types
@@ -7129,10 +7782,10 @@ class Culture:
 
         ''' Create a few types of unique weapons for this culture '''
         for wtype in weapon_types:
-            material_name = random.choice(materials)
+            material_name = choice(materials)
             material = data.commodity_manager.materials[material_name]
 
-            special_properties = {random.choice(phys.PROPERTIES): random.choice( (5, 10) ) }
+            special_properties = {choice(phys.PROPERTIES): choice( (5, 10) ) }
 
             # Send it over to the item generator to generate the weapon
             weapon_info_dict = phys.wgenerator.generate_weapon(wtype=wtype, material=material, special_properties=special_properties)
@@ -7237,10 +7890,10 @@ class Culture:
         # This function will get anytime there needs to be people generated. They don't always need
         # to be saved in the world - thus, we won't worry too much about them if we don't need to
         if save_being:
-            g.WORLD.tiles[wx][wy].entities.append(human)
-            g.WORLD.tiles[wx][wy].chunk.entities.append(human)
+            g.WORLD.figure_index.insert(human, wx, wy)
 
             g.WORLD.all_figures.append(human)
+            g.WORLD.time_cycle.schedule_figure(figure=human, day=g.WORLD.time_cycle.day_number)
             if important:
                 g.WORLD.important_figures.append(human)
 
@@ -7407,7 +8060,7 @@ def get_info_under_mouse():
         xc, yc = g.game.camera.map2cam(x, y)
         if 0 <= xc <= g.CAMERA_WIDTH and 0 <= yc <= g.CAMERA_HEIGHT:
             if g.game.state == 'playing':
-                info.append(('DBG: Reg{0}, {1}ht, {2}dist'.format(g.WORLD.tiles[x][y].region_number, g.WORLD.tiles[x][y].height, g.WORLD.distance_from_civilization_dmap.dmap[x][y]), libtcod.color_lerp(color, g.WORLD.tiles[x][y].color, .5)))
+                info.append(('DBG: Reg{0}, {1}ht, {2}dist'.format(g.WORLD.tiles[x][y].region_number, g.WORLD.tiles[x][y].height, g.WORLD.distance_from_civilization.get((x, y))), libtcod.color_lerp(color, g.WORLD.tiles[x][y].color, .5)))
 
             info.append((g.WORLD.tiles[x][y].region.capitalize(), libtcod.color_lerp(color, g.WORLD.tiles[x][y].color, .5)))
             ###### Cultures ########
@@ -7920,6 +8573,8 @@ class Game:
         self.camera = Camera(width_in_characters=g.CAMERA_WIDTH, height=g.CAMERA_HEIGHT)
 
         self.msgs = []
+        # Set while history is being fast-forwarded, so nothing is spent formatting messages nobody will see
+        self.messages_muted = 0
 
         self.quit_game = 0
 
@@ -7950,6 +8605,9 @@ class Game:
             self.msg_index = self.msg_index + amount
 
     def add_message(self, new_msg, color=libtcod.white):
+        if self.messages_muted:
+            return
+
         #split the message if necessary, among multiple lines
         new_msg_lines = textwrap.wrap(new_msg, g.MSG_WIDTH)
 
@@ -8000,24 +8658,54 @@ class Game:
             g.M.fov_recompute = 1
 
 
-    def save_game(self):
-        #open a new empty shelve (possibly overwriting an old one) to write the game data
-        #save_file = shelve.open('savegame', 'n')
-        save_file['g.WORLD'] = g.WORLD
-        #save_file['time_cyle'] = g.time_cycle
-        save_file.close()
+    def add_worldgen_buttons(self, world):
+        panel2.wmap_buttons = [
+                          gui.Button(gui_panel=panel2, func=world.gen_history, args=[1],
+                                     text='Generate History', topleft=(4, g.PANEL2_HEIGHT-11), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True),
+                          gui.Button(gui_panel=panel2, func=world.generate, args=[],
+                                     text='Regenerate Map', topleft=(4, g.PANEL2_HEIGHT-6), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True)
+                          ]
 
-    def load_game(self):
-        #open the previously saved shelve and load the game data
-        #global M, g.WORLD, g.player, g.time_cycle
-        #file = shelve.open('savegame', 'r')
-        g.WORLD = file['g.WORLD']
-        #g.time_cycle = file['time_cyle']
-        file.close()
+    def add_play_buttons(self):
+        ''' Add "start playing" and "save world" buttons if there aren't already ones '''
+        for button in panel2.wmap_buttons:
+            if button.text == 'Start Playing':
+                break
+        else:
+            panel2.wmap_buttons.append(gui.Button(gui_panel=panel2, func=self.new_game, args=[],
+                                    text='Start Playing', topleft=(4, g.PANEL2_HEIGHT-16), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True))
+            panel2.wmap_buttons.append(gui.Button(gui_panel=panel2, func=self.save_game, args=[],
+                                    text='Save World', topleft=(4, g.PANEL2_HEIGHT-22), width=20, height=5, color=g.PANEL_FRONT, do_draw_box=True))
+
+    def save_game(self, path=None):
+        ''' Save the world to a snapshot file (see snapshot.py) '''
+        path = path or g.WORLD_SAVE_FILE
+        begin = time.time()
+        snapshot.save_world(world=g.WORLD, path=path)
+        self.add_message('World saved to {0} in {1:.2f} seconds'.format(path, time.time() - begin))
+
+    def load_game(self, path=None):
+        ''' Load a world saved with save_game(), and go to the world map '''
+        path = path or g.WORLD_SAVE_FILE
+        begin = time.time()
+        g.WORLD = None # Clear in case a world was already generated
+        g.WORLD = snapshot.load_world(path=path)
+        logging.info('Loaded world from {0} in {1:.2f} seconds'.format(path, time.time() - begin))
+
+        panel2.wmap_buttons = []
+        self.add_play_buttons()
+
+        self.camera.center(int(round(g.WORLD.width / 2)), int(round(g.WORLD.height / 2)))
+
+        self.game_main_loop()
 
 
     def create_new_world_and_begin_game(self):
         # Gen world
+        seed = g.WORLD_SEED if g.WORLD_SEED is not None else random.randrange(2**31)
+        logging.info('Generating world from seed {0}'.format(seed))
+        rng.seed_all(seed)
+
         g.WORLD = None # Clear in case previous world was generated
         g.WORLD = World(g.WORLD_WIDTH, g.WORLD_HEIGHT)
         g.WORLD.generate()
@@ -8037,8 +8725,7 @@ class Game:
         for language in g.player.creature.languages:
             g.player.creature.update_language_knowledge(language=language, verbal=0, written=g.player.creature.languages[language]['verbal'])
 
-        g.WORLD.tiles[g.player.wx][g.player.wy].entities.append(g.player)
-        g.WORLD.tiles[g.player.wx][g.player.wy].chunk.entities.append(g.player)
+        g.WORLD.figure_index.insert(g.player, g.player.wx, g.player.wy)
 
         g.player.color = libtcod.cyan
         g.player.local_brain = None
@@ -8068,6 +8755,17 @@ class Game:
             at some point, if it even stays in '''
 
         t1 = time.time()
+        self.create_quick_battle()
+
+        self.camera.center(g.player.x, g.player.y)
+
+        self.add_message('loaded in %.2f seconds' %(time.time() - t1))
+
+        # Finally, start the main game loop
+        self.game_main_loop()
+
+    def create_quick_battle(self):
+        ''' Set up the world, battle map and armies for setup_quick_battle '''
         ##################### Create a dummy world just for the quick battle
         g.WORLD = World(width=3, height=3)
         g.WORLD.setup_world()
@@ -8143,13 +8841,6 @@ class Game:
         pack = assemble_object(object_blueprint=phys.object_dict['pack'], force_material=None, wx=None, wy=None)
         g.player.put_on_clothing(clothing=pack)
 
-        self.camera.center(g.player.x, g.player.y)
-
-        self.add_message('loaded in %.2f seconds' %(time.time() - t1))
-
-        # Finally, start the main game loop
-        self.game_main_loop()
-
 
     def return_to_worldmap(self):
         '''
@@ -8324,10 +9015,12 @@ def main_menu():
                           text='Generate World', topleft=(bx, bys[0]), width=b_width, height=6, color=g.PANEL_FRONT, do_draw_box=True),
                gui.Button(gui_panel=root_con, func=g.game.setup_quick_battle, args=[],
                           text='Quick Battle', topleft=(bx, bys[1]), width=b_width, height=6, color=g.PANEL_FRONT, do_draw_box=True),
-               #gui.Button(gui_panel=root_con, func=lambda:2, args=[],
-               #           text='Continue Game', topleft=(bx, bys[2]), width=b_width, height=6, color=libtcod.light_grey, hcolor=libtcod.white, do_draw_box=True),
                gui.Button(gui_panel=root_con, func=g.game.switch_to_quit_game, args=[],
                           text='Quit', topleft=(bx, bys[3]), width=b_width, height=6, color=g.PANEL_FRONT, do_draw_box=True)]
+    # Only offer to load a world if one has been saved
+    if os.path.exists(g.WORLD_SAVE_FILE):
+        buttons.insert(2, gui.Button(gui_panel=root_con, func=g.game.load_game, args=[],
+                          text='Load World', topleft=(bx, bys[2]), width=b_width, height=6, color=g.PANEL_FRONT, do_draw_box=True))
 
     ## Start looping
     while not libtcod.console_is_window_closed():
@@ -5,16 +5,123 @@ from collections import defaultdict
 
 import libtcodpy as libtcod
 
+# Neighbor offsets for floods - cardinal directions only, or including diagonals
+NEIGHBORS_4 = ((0, -1), (1, 0), (0, 1), (-1, 0))
+NEIGHBORS_8 = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+
+
+# Properties for tiles whose data lives in their map's tile_grid - a struct of flat arrays indexed by x * height + y
+def grid_field(field, none_value=None):
+    ''' Property for a tile scalar which lives in one of its grid's typed arrays '''
+    def set_value(self, value):
+        getattr(self.grid, field)[self.index] = none_value if value is None else value
+
+    if none_value is None:
+        def get_value(self):
+            return getattr(self.grid, field)[self.index]
+    # NaN is the only value which isn't equal to itself
+    elif none_value != none_value:
+        def get_value(self):
+            value = getattr(self.grid, field)[self.index]
+            return None if value != value else value
+    else:
+        def get_value(self):
+            value = getattr(self.grid, field)[self.index]
+            return None if value == none_value else value
+
+    return property(get_value, set_value)
+
+
+def grid_flag(field, version=None):
+    ''' Property for a tile flag which lives in one of its grid's bytearrays. If a version attribute is given,
+    the grid's counter of that name is bumped whenever the flag actually changes '''
+    def get_value(self):
+        return getattr(self.grid, field)[self.index] == 1
+
+    if version is None:
+        def set_value(self, value):
+            getattr(self.grid, field)[self.index] = 1 if value else 0
+    else:
+        def set_value(self, value):
+            flags = getattr(self.grid, field)
+            value = 1 if value else 0
+            if flags[self.index] != value:
+                flags[self.index] = value
+                setattr(self.grid, version, getattr(self.grid, version) + 1)
+
+    return property(get_value, set_value)
+
+
+def lazy_container(slot, factory):
+    ''' Property for a per-tile container which is only created the first time it's accessed '''
+    def get_container(self):
+        container = getattr(self, slot)
+        if container is None:
+            container = factory()
+            setattr(self, slot, container)
+        return container
+
+    def set_container(self, container):
+        setattr(self, slot, container)
+
+    return property(get_container, set_container)
+
+
+def sparse_field(field, default=None):
+    ''' Property for a tile value which few tiles ever set, stored in a dict keyed by the tile's index in its grid '''
+    def get_value(self):
+        return getattr(self.grid, field).get(self.index, default)
+
+    def set_value(self, value):
+        values = getattr(self.grid, field)
+        if value == default:
+            values.pop(self.index, None)
+        else:
+            values[self.index] = value
+
+    return property(get_value, set_value)
+
+
+def pack_color(color):
+    return -1 if color is None else (color.r << 16) | (color.g << 8) | color.b
+
+
+def unpack_color(value):
+    return None if value < 0 else libtcod.Color(value >> 16, (value >> 8) & 255, value & 255)
+
+
+def grid_color(field):
+    ''' Property for a tile color which is packed into an int in one of its grid's arrays (-1 for None) '''
+    def get_value(self):
+        return unpack_color(getattr(self.grid, field)[self.index])
+
+    def set_value(self, color):
+        getattr(self.grid, field)[self.index] = pack_color(color)
+
+    return property(get_value, set_value)
+
+
+def grid_lookup(field):
+    ''' Property for a value shared by many tiles (a name, an owner...), stored as an index into one of its grid's
+    lookup tables (-1 for None). See RegionGrid.lookup_index '''
+    def get_value(self):
+        i = getattr(self.grid, field)[self.index]
+        return None if i < 0 else self.grid.lookup_tables[field][i]
+
+    def set_value(self, value):
+        getattr(self.grid, field)[self.index] = self.grid.lookup_index(field, value)
+
+    return property(get_value, set_value)
+
+
 class Chunk:
     def __init__(self, x, y):
         self.x = x
         self.y = y
 
-        self.tiles = []
-
     def add_tile(self, tile):
-        self.tiles.append(tile)
-        # Make sure the tile knows its chunk
+        # Make sure the tile knows its chunk. Chunks don't keep a list of their tiles, so that a world's
+        # tiles don't all have to exist (see RegionTiles)
         tile.chunk = self
 
 
@@ -22,9 +129,6 @@ class RegionChunk(Chunk):
     def __init__(self, x, y):
         Chunk.__init__(self, x, y)
 
-        self.entities = []
-        self.populations = []
-
         self.sites = []
         self.minor_sites = []
         self.caves = []
@@ -44,17 +148,6 @@ class RegionChunk(Chunk):
     def add_cave(self, cave):
         self.caves.append(cave)
 
-    def add_entity(self, entity):
-        self.entities.append(entity)
-
-    def remove_entity(self, entity):
-        self.entities.remove(entity)
-
-    def add_population(self, population):
-        self.populations.append(population)
-
-    def remove_population(self, population):
-        self.populations.remove(population)
 
 class TileChunk(Chunk):
     def __init__(self, x, y):
@@ -63,6 +156,103 @@ class TileChunk(Chunk):
         self.objects = []
 
 
+class SpatialHash:
+    ''' Index of things by their position, bucketed into square cells. Each cell keeps a list of things per position it
+    has anything at, so inserting, removing and moving a thing, and finding what's at a position, are constant time, and
+    rectangle / radius queries only look at the cells they overlap. A thing is removed by moving the last one at its
+    position into its place - so queries give the same order from run to run '''
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        # (cell x, cell y): {(x, y): [thing, ...]}
+        self.cells = {}
+        # thing: [x, y, index in its position's list]
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, thing):
+        return thing in self.entries
+
+    def get_cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def get_position(self, thing):
+        entry = self.entries[thing]
+        return entry[0], entry[1]
+
+    def insert(self, thing, x, y):
+        if thing in self.entries:
+            self.remove(thing)
+
+        things = self.cells.setdefault(self.get_cell(x, y), {}).setdefault((x, y), [])
+        self.entries[thing] = [x, y, len(things)]
+        things.append(thing)
+
+    def remove(self, thing):
+        x, y, index = self.entries.pop(thing)
+        cell = self.get_cell(x, y)
+        positions = self.cells[cell]
+        things = positions[(x, y)]
+        last = things.pop()
+        if last is not thing:
+            things[index] = last
+            self.entries[last][2] = index
+        elif not things:
+            del positions[(x, y)]
+            if not positions:
+                del self.cells[cell]
+
+    def move(self, thing, x, y):
+        entry = self.entries[thing]
+        if (entry[0], entry[1]) != (x, y):
+            self.remove(thing)
+            self.insert(thing, x, y)
+
+    def at(self, x, y):
+        ''' Things at exactly this position (a new list, so it's safe to move them while going through it) '''
+        positions = self.cells.get(self.get_cell(x, y))
+        if positions is None:
+            return []
+        return list(positions.get((x, y), ()))
+
+    def count_at(self, x, y):
+        positions = self.cells.get(self.get_cell(x, y))
+        if positions is None:
+            return 0
+        return len(positions.get((x, y), ()))
+
+    def occupied_positions(self):
+        ''' (x, y, things there) for every position that has anything at it '''
+        for positions in self.cells.itervalues():
+            for (x, y), things in positions.iteritems():
+                yield x, y, things
+
+    def in_rect(self, x1, y1, x2, y2):
+        ''' Things within the rectangle (corners included) '''
+        cx1, cy1 = self.get_cell(x1, y1)
+        cx2, cy2 = self.get_cell(x2, y2)
+        cells = self.cells
+
+        found = []
+        for cx in xrange(cx1, cx2 + 1):
+            for cy in xrange(cy1, cy2 + 1):
+                positions = cells.get((cx, cy))
+                if positions is None:
+                    continue
+                for (x, y), things in positions.iteritems():
+                    if x1 <= x <= x2 and y1 <= y <= y2:
+                        found.extend(things)
+        return found
+
+    def in_radius(self, x, y, radius):
+        ''' Things within radius (straight-line distance) of the position '''
+        entries = self.entries
+        radius_squared = radius ** 2
+        return [thing for thing in self.in_rect(x - radius, y - radius, x + radius, y + radius)
+                if (entries[thing][0] - x) ** 2 + (entries[thing][1] - y) ** 2 <= radius_squared]
+
+
 
 class Map:
     def __init__(self, width, height):
@@ -70,6 +260,8 @@ class Map:
         self.height = height
 
         self.tiles = []
+        # Flat array storage for the tiles' fields, if this type of map has one
+        self.tile_grid = None
         # Tiles to be chunked
         self.chunk_tiles = []
         self.chunk_width = None
@@ -95,6 +287,44 @@ class Map:
         # Therefore, a len of 0 here should mean unreachable - so return None
         return new_path_len if new_path_len else None
 
+    def flood_distances(self, sources, can_enter, diagonals=1, max_distance=None, nearest_sources=None):
+        ''' Breadth-first flood outwards from every (x, y) in sources at once. can_enter(x, y) decides whether
+        the flood may step onto a tile. Returns a dict of (x, y): number of steps to the closest source, for
+        every tile reached (sources are 0). If a nearest_sources dict is passed in, it is filled with
+        (x, y): the source location which that tile was reached from '''
+        offsets = NEIGHBORS_8 if diagonals else NEIGHBORS_4
+
+        distances = {}
+        frontier = []
+        for location in sources:
+            if location not in distances:
+                distances[location] = 0
+                frontier.append(location)
+                if nearest_sources is not None:
+                    nearest_sources[location] = location
+
+        # Every tile which has been tested with can_enter(), so nothing gets tested twice
+        checked = set(distances)
+
+        distance = 0
+        while frontier and (max_distance is None or distance < max_distance):
+            distance += 1
+            next_frontier = []
+            for fx, fy in frontier:
+                for dx, dy in offsets:
+                    location = (fx + dx, fy + dy)
+                    if location not in checked:
+                        checked.add(location)
+                        if can_enter(location[0], location[1]):
+                            distances[location] = distance
+                            next_frontier.append(location)
+                            if nearest_sources is not None:
+                                nearest_sources[location] = nearest_sources[(fx, fy)]
+
+            frontier = next_frontier
+
+        return distances
+
     def get_closest_location(self, x, y, locations):
         ''' Rake a series of (x, y) locations, and find which is closest to the input x and y vals '''
         closest_distance = 100000
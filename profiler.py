@@ -0,0 +1,162 @@
+''' Per-phase timing counters for the simulation loop.
+
+Wrap a phase of the simulation in a timer, and its wall time and number of calls are added to that phase's totals:
+
+    with profiler.phase('week.economy'):
+        economy.run_economies(...)
+
+Phases are named '<section>.<step>' - e.g. 'tick.creature_turns', 'day.world_brains', 'worldgen.heightmap'.
+Along with the running totals, each phase keeps its most recent timings, so the rolling averages show how a phase's
+cost changes over a long history run (e.g. as the population grows). dump_stats() appends a snapshot of every phase
+to a file, one JSON object per line.
+
+While profiling is off (the default - see config.PROFILE_PHASES), phase() hands back a shared do-nothing timer, so
+the instrumentation costs about one function call per phase. It can be switched on at runtime from the debug menu.
+
+For a closer look at a single phase, profile_next() wraps the next run of that phase in cProfile and writes its
+stats out to a file, which can be read with pstats '''
+from __future__ import division
+from collections import deque, OrderedDict
+import cProfile
+import json
+import logging
+import time
+
+import config as g
+
+
+class PhaseStats:
+    ''' Running totals for one phase, plus its most recent timings '''
+    def __init__(self, name, window):
+        self.name = name
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def mean(self):
+        return self.total / self.calls if self.calls else 0
+
+    def recent_mean(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0
+
+    def to_dict(self):
+        return OrderedDict([('calls', self.calls),
+                            ('total_seconds', self.total),
+                            ('mean_ms', self.mean() * 1000),
+                            ('recent_mean_ms', self.recent_mean() * 1000),
+                            ('max_ms', self.max * 1000)])
+
+
+class PhaseTimer:
+    ''' Times one run of a phase - returned by phase() while profiling is on '''
+    __slots__ = ('name', 'begin', 'cprofile')
+
+    def __init__(self, name):
+        self.name = name
+        self.begin = None
+        self.cprofile = None
+
+    def __enter__(self):
+        if self.name in profile_requests:
+            profile_requests.remove(self.name)
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.begin = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.time() - self.begin
+        if self.cprofile:
+            self.cprofile.disable()
+            path = g.PROFILE_CPROFILE_FILE.format(phase=self.name)
+            self.cprofile.dump_stats(path)
+            logging.info('Wrote cProfile stats for {0} to {1}'.format(self.name, path))
+
+        stats = phase_stats.get(self.name)
+        if stats is None:
+            stats = phase_stats[self.name] = PhaseStats(name=self.name, window=g.PROFILE_ROLLING_WINDOW)
+        stats.add(elapsed)
+        # Let exceptions through
+        return False
+
+
+class NullTimer:
+    ''' Returned by phase() while profiling is off '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+enabled = g.PROFILE_PHASES
+# Phase name : PhaseStats, in the order the phases first ran
+phase_stats = OrderedDict()
+# Names of phases to wrap in cProfile the next time they run
+profile_requests = set()
+
+
+def phase(name):
+    ''' Context manager timing a phase of the simulation, if profiling is on '''
+    if not enabled:
+        return NULL_TIMER
+    return PhaseTimer(name)
+
+
+def is_enabled():
+    return enabled
+
+
+def set_enabled(on):
+    global enabled
+    enabled = on
+
+
+def toggle():
+    set_enabled(not enabled)
+    return enabled
+
+
+def reset():
+    phase_stats.clear()
+    profile_requests.clear()
+
+
+def profile_next(name):
+    ''' Wrap the next run of the named phase in cProfile (this switches profiling on, if it was off) '''
+    set_enabled(1)
+    profile_requests.add(name)
+
+
+def get_report(**info):
+    ''' Stats for every phase so far, along with any extra info (the date, the size of the population...) '''
+    report = OrderedDict(sorted(info.iteritems()))
+    report['phases'] = OrderedDict((name, stats.to_dict()) for name, stats in phase_stats.iteritems())
+    return report
+
+
+def dump_stats(path=None, **info):
+    ''' Append the current stats to a file as a line of JSON, so successive dumps show how the costs shift over time '''
+    path = path or g.PROFILE_STATS_FILE
+    with open(path, 'a') as f:
+        f.write(json.dumps(get_report(**info)) + '\n')
+
+
+def format_report(limit=None):
+    ''' Lines of text summarizing the phases, most expensive first '''
+    ordered = sorted(phase_stats.itervalues(), key=lambda stats: stats.total, reverse=True)[:limit]
+    return ['{0}: {1:.2f}s / {2} ({3:.2f}ms, recent {4:.2f}ms)'.format(stats.name, stats.total, stats.calls,
+                                                                      stats.mean() * 1000, stats.recent_mean() * 1000)
+            for stats in ordered]
@@ -0,0 +1,63 @@
+''' Seeded random number streams for the game's subsystems.
+
+Each subsystem draws from its own random.Random, so that the rolls made by one don't shift the rolls seen by another -
+adding a roll to the economy doesn't reshuffle the terrain, and a faster engine can be checked against the reference
+one by comparing the worlds they produce from the same seed.
+
+    terrain  - world map generation (heightmap, rivers, biomes), including libtcod's noise and erosion
+    culture  - languages and cultures
+    economy  - economy agents and markets
+    world_ai - world-scale figure decisions (goap and BasicWorldBrain)
+    combat   - combat moves and their outcomes
+
+Modules keep a reference to their stream's methods (e.g. roll = rng.culture.randint), and seed_all() re-seeds the
+streams in place, so those references stay valid. Everything else still uses the random module, which seed_all()
+seeds as well. Each stream's seed is derived from the master seed and the stream's name, not drawn in sequence,
+so adding a new stream doesn't change the existing ones '''
+from collections import OrderedDict
+import hashlib
+import random
+
+import libtcodpy as libtcod
+
+
+STREAM_NAMES = ('terrain', 'culture', 'economy', 'world_ai', 'combat')
+
+streams = OrderedDict((name, random.Random()) for name in STREAM_NAMES)
+
+terrain = streams['terrain']
+culture = streams['culture']
+economy = streams['economy']
+world_ai = streams['world_ai']
+combat = streams['combat']
+
+
+def derive_seed(seed, name):
+    ''' A 32 bit seed for the named stream, which depends only on the master seed and the name '''
+    return int(hashlib.md5('{0}:{1}'.format(seed, name)).hexdigest()[:8], 16)
+
+
+def seed_all(seed):
+    ''' Seed every stream, Python's random module, and libtcod's default generator from one master seed '''
+    random.seed(seed)
+    for name, stream in streams.iteritems():
+        stream.seed(derive_seed(seed, name))
+    libtcod.random_restore(libtcod.random_get_instance(), libtcod.random_new_from_seed(derive_seed(seed, 'libtcod')))
+
+
+def new_libtcod_random(stream):
+    ''' A libtcod generator seeded from a stream - for the libtcod functions (noise, erosion) which take one '''
+    return libtcod.random_new_from_seed(stream.getrandbits(32))
+
+
+def get_state():
+    ''' The state of Python's random module and every stream, for saving along with the world '''
+    return {'random': random.getstate(),
+            'streams': {name: stream.getstate() for name, stream in streams.iteritems()}}
+
+
+def set_state(state):
+    random.setstate(state['random'])
+    for name, stream_state in state['streams'].iteritems():
+        if name in streams:
+            streams[name].setstate(stream_state)
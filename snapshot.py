@@ -0,0 +1,307 @@
+''' Saving and loading the world as a compact, versioned binary snapshot.
+
+A snapshot is a small header (a magic string, the format version and the payload's length), followed by a zlib-compressed
+pickle of the world along with the module-level history state it depends on, followed by the world's tile data.
+
+The tile data is the raw contents of the RegionGrid's typed arrays, uncompressed and page-aligned, so that it can be
+memory-mapped on load (see config.MAP_WORLD_SNAPSHOTS) - a tile's height, biome, territory etc are then only read from
+disk when something looks at that tile. Only Regions with more than grid info on them are pickled (see RegionTiles), so
+the rest of the world's tiles aren't created until they're used either. Objects, sites and everything else are loaded up front.
+
+Other bulk data is also written as packed bytes rather than as individual pickled objects: other typed arrays and bytearrays
+are saved as their raw little-endian bytes, libtcod Colors as a single int, and long numeric histories are packed into
+arrays by their owners' __getstate__ methods (see economy.AuctionHouse). Commodities, reactions and materials are loaded
+from data_importer's yaml files at startup, so they're saved by name and looked up again on load.
+
+libtcod's fov and path maps live in C memory and can't be saved - World.__getstate__ leaves them out and
+World.restore_after_load() rebuilds them '''
+from __future__ import division
+import copy_reg
+import cPickle as pickle
+from cStringIO import StringIO
+import mmap
+import os
+import struct
+import sys
+import types
+import zlib
+from array import array
+from collections import defaultdict
+
+import libtcodpy as libtcod
+import config as g
+import data_importer as data
+import history as hist
+import physics as phys
+import rng
+from helpers import infinite_defaultdict
+from map_base import pack_color, unpack_color
+
+
+MAGIC = 'ITWORLD\x00'
+# Bump this whenever a change to the saved classes means older snapshots can no longer be loaded
+VERSION = 7
+# Magic, version, length of the compressed payload
+HEADER = struct.Struct('<8sHQ')
+# The tile data starts on a page boundary, so it can be mapped straight into memory
+TILE_DATA_ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+
+# zlib level - most of the size win comes from the packed arrays, so favor speed
+COMPRESSION_LEVEL = 1
+# Pickling recurses once per level of nesting in the object graph, and the world's graph is deep
+RECURSION_LIMIT = 10000
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class MappedArray(object):
+    ''' Typed array over part of a memory-mapped snapshot - items are only read from disk when they're looked up.
+    The map is copy-on-write, so writes change the loaded world but never the snapshot file '''
+    __slots__ = ('buf', 'offset', 'typecode', 'count', 'item')
+
+    def __init__(self, buf, offset, typecode, count):
+        self.buf = buf
+        self.offset = offset
+        self.typecode = typecode
+        self.count = count
+        # Snapshots are always little-endian
+        self.item = struct.Struct('<' + typecode)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return array(self.typecode, [self[j] for j in xrange(*i.indices(self.count))])
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('array index out of range')
+        return self.item.unpack_from(self.buf, self.offset + i * self.item.size)[0]
+
+    def __setitem__(self, i, value):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('array assignment index out of range')
+        self.item.pack_into(self.buf, self.offset + i * self.item.size, value)
+
+    def tostring(self):
+        ''' The raw (little-endian) bytes, as with array.tostring '''
+        return self.buf[self.offset:self.offset + self.count * self.item.size]
+
+    def to_array(self):
+        return unpack_array(self.typecode, self.tostring())
+
+
+##### Reducers - how pickle should save types it can't (or shouldn't) save as plain objects #####
+
+def unpack_array(typecode, data_string):
+    values = array(typecode)
+    values.fromstring(data_string)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def reduce_array(values):
+    ''' Arrays are saved as raw little-endian bytes instead of a list of Python numbers '''
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return unpack_array, (values.typecode, values.tostring())
+
+
+def reduce_mapped_array(values):
+    return unpack_array, (values.typecode, values.tostring())
+
+
+def little_endian_bytes(values):
+    if isinstance(values, MappedArray):
+        return values.tostring()
+    return reduce_array(values)[1][1]
+
+
+def reduce_bytearray(values):
+    return bytearray, (str(values),)
+
+
+def reduce_color(color):
+    return unpack_color, (pack_color(color),)
+
+
+def reduce_method(method):
+    ''' Bound methods are saved as their object and the method's name '''
+    owner = method.im_class if method.im_self is None else method.im_self
+    return getattr, (owner, method.im_func.__name__)
+
+
+def new_infinite_defaultdict():
+    return infinite_defaultdict()
+
+
+def reduce_defaultdict(values):
+    ''' Pickle can only save a defaultdict whose factory is importable by name, and helpers.infinite_defaultdict is a lambda '''
+    if values.default_factory is infinite_defaultdict:
+        return new_infinite_defaultdict, (), None, None, values.iteritems()
+    return defaultdict, (values.default_factory,), None, None, values.iteritems()
+
+
+def get_commodity(name):
+    return data.commodity_manager.get_actual_commodity_from_name(name)
+
+
+def get_reaction(name):
+    return data.commodity_manager.reactions[name]
+
+
+def get_material(name):
+    return data.commodity_manager.materials[name]
+
+
+def registry_reducer(lookup, get_name):
+    ''' Objects loaded from the data files are saved by name, as long as they're the registered object with that name '''
+    def reduce_entry(entry):
+        name = get_name(entry)
+        try:
+            if lookup(name) is entry:
+                return lookup, (name,)
+        except KeyError:
+            pass
+        return entry.__reduce_ex__(2)
+    return reduce_entry
+
+
+def register_reducers():
+    copy_reg.pickle(array, reduce_array)
+    copy_reg.pickle(MappedArray, reduce_mapped_array)
+    copy_reg.pickle(bytearray, reduce_bytearray)
+    copy_reg.pickle(libtcod.Color, reduce_color)
+    copy_reg.pickle(types.MethodType, reduce_method)
+    copy_reg.pickle(defaultdict, reduce_defaultdict)
+
+    reduce_commodity = registry_reducer(get_commodity, lambda commodity: commodity.name)
+    copy_reg.pickle(data.Resource, reduce_commodity)
+    copy_reg.pickle(data.FinishedGood, reduce_commodity)
+    copy_reg.pickle(data.Reaction, registry_reducer(get_reaction, lambda reaction: reaction.output_commodity_name))
+    copy_reg.pickle(data.Material, registry_reducer(get_material, lambda material: material.name))
+
+
+register_reducers()
+
+
+##### Saving and loading #####
+
+def tile_data_offset(payload_length):
+    return -(-(HEADER.size + payload_length) // TILE_DATA_ALIGNMENT) * TILE_DATA_ALIGNMENT
+
+
+def save_world(world, path):
+    ''' Write the world to a snapshot file. It's written to a temporary file first, so a failed save never clobbers an older snapshot '''
+    grid = world.tile_grid
+    state = {'world': world,
+             'historical_events': hist.historical_events,
+             'rng_state': rng.get_state()}
+
+    ## The grid's arrays go in the tile data section - the pickle only refers to them by field name
+    fields = sorted(grid.FIELDS)
+    field_arrays = {field: getattr(grid, field) for field in fields}
+    ids_to_fields = {id(values): field for field, values in field_arrays.iteritems()}
+    # field, typecode, count, offset in the tile data
+    layout = []
+    offset = 0
+    for field in fields:
+        values = field_arrays[field]
+        layout.append((field, values.typecode, len(values), offset))
+        offset += len(values) * struct.calcsize('<' + values.typecode)
+
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, RECURSION_LIMIT))
+    try:
+        stream = StringIO()
+        pickler = pickle.Pickler(stream, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: ids_to_fields.get(id(obj))
+        pickler.dump(layout)
+        pickler.dump(state)
+        payload = zlib.compress(stream.getvalue(), COMPRESSION_LEVEL)
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(payload)))
+        f.write(payload)
+        f.write('\x00' * (tile_data_offset(len(payload)) - HEADER.size - len(payload)))
+        for field in fields:
+            f.write(little_endian_bytes(field_arrays[field]))
+
+    # os.rename won't replace an existing file on Windows
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def read_header(f, path):
+    ''' Check the snapshot's header and return the length of its payload '''
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise SnapshotError('{0} is not a world snapshot'.format(path))
+
+    magic, version, payload_length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise SnapshotError('{0} is not a world snapshot'.format(path))
+    if version != VERSION:
+        raise SnapshotError('{0} is snapshot version {1}, but this version of the game reads version {2}'.format(path, version, VERSION))
+
+    return payload_length
+
+
+def load_world(path, mapped=None):
+    ''' Load a world saved with save_world(), restoring the history state saved along with it. If mapped (the default
+    comes from config.MAP_WORLD_SNAPSHOTS), the tile data is memory-mapped rather than read into memory '''
+    if mapped is None:
+        mapped = g.MAP_WORLD_SNAPSHOTS
+
+    with open(path, 'rb') as f:
+        payload_length = read_header(f, path)
+        payload = f.read(payload_length)
+        tile_data_start = tile_data_offset(payload_length)
+        if mapped:
+            # Stays valid after the file is closed
+            tile_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        else:
+            f.seek(tile_data_start)
+            tile_data = f.read()
+            tile_data_start = 0
+
+    try:
+        payload = zlib.decompress(payload)
+    except zlib.error as e:
+        raise SnapshotError('{0} is corrupt ({1})'.format(path, e))
+
+    # World.__init__ normally loads the physics blueprints which objects in the world are built from
+    phys.main()
+
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, RECURSION_LIMIT))
+    try:
+        unpickler = pickle.Unpickler(StringIO(payload))
+        layout = unpickler.load()
+        if mapped:
+            field_arrays = {field: MappedArray(tile_data, tile_data_start + offset, typecode, count) for field, typecode, count, offset in layout}
+        else:
+            field_arrays = {field: unpack_array(typecode, tile_data[offset:offset + count * struct.calcsize('<' + typecode)])
+                            for field, typecode, count, offset in layout}
+        unpickler.persistent_load = field_arrays.__getitem__
+        state = unpickler.load()
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+    hist.set_event_store(state['historical_events'])
+    rng.set_state(state['rng_state'])
+
+    world = state['world']
+    world.restore_after_load()
+    return world
@@ -5,13 +5,15 @@ from random import randint as roll
 import time
 from collections import defaultdict
 import logging
+from array import array
 
 import libtcodpy as libtcod
-from dijkstra import Dijmap
+from dijkstra import create_dijmap
+import cellular_automata
 from helpers import *
 import config as g
 import physics as phys
-from map_base import Map
+from map_base import Map, grid_field, grid_flag, grid_color, sparse_field, pack_color, unpack_color
 import it
 
 import data_importer as data
@@ -23,42 +25,87 @@ INTIAL_BLDG_SIZE = 5
 DEVELOPED_SURFACES = {'road', 'wall', 'floor', 'water'}
 
 
-class Tile:
-    #a tile of the map and its properties
-    def __init__(self, blocks_mov, blocks_vis=None):
+class TileGrid(object):
+    ''' Struct-of-arrays storage for every Tile on a Wmap. Values most tiles have are kept in flat typed arrays
+    indexed by x * height + y, while values few tiles ever set (objects, buildings, zones...) are kept in dicts keyed
+    by that same index. Hot loops over the whole map should read these directly instead of going through the Tiles '''
+    # Colors are packed into ints as 0xRRGGBB, with -1 for None. Noise is NaN until it's been set
+    FIELDS = {'heights': ('i', 0), 'chars': ('i', g.EMPTY_TILE), 'noises': ('d', float('nan')),
+              'colors': ('i', -1), 'shadow_colors': ('i', -1), 'char_colors': ('i', -1), 'shadow_char_colors': ('i', -1)}
 
-        # To be set at a later time
-        self.color = None
-        self.shadow_color = None
-
-        self.char = 255
-        self.char_color = None
-        self.shadow_char_color = None
-        ## Noise for shading/texturing the map...
-        self.noise = None
-
-        self.blocks_mov = blocks_mov
-        #by default, if a tile is blocked, it also blocks sight
-        if blocks_vis is None:  self.blocks_vis = blocks_mov
-        else:                   self.blocks_vis = blocks_vis
-
-        #all tiles start unexplored
-        self.explored = True
-        #All tiles start as earth
-        self.zone = None
-        self.surface = 'ground'
-        self.building = None
-        self.height = 0
-
-        self.shaded = 0 # Tracks whether a tree or other pbject has cast a shadow here
-        #Objects on the current map tile
-        self.objects = []
-
-        # Info regarding interaction
-        self.interactable = 0
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
 
+        size = width * height
+        for field, (typecode, initial_value) in self.FIELDS.iteritems():
+            setattr(self, field, array(typecode, [initial_value]) * size)
+
+        self.blocks_mov = bytearray(size)
+        # Bumped whenever a tile's blocks_mov changes, so dmaps know their passability is stale
+        self.passability_version = 0
+        self.blocks_vis = bytearray(size)
+        #all tiles start explored
+        self.explored = bytearray('\x01') * size
+        # Tracks whether a tree or other pbject has cast a shadow on the tile
+        self.shaded = bytearray(size)
         # For flood filling, if you want to mark that a tile is passed but not do anything
-        self.tmp_flag = 0
+        self.tmp_flag = bytearray(size)
+
+        # Sparse index of the objects on each tile
+        self.objects = {}
+        self.zones = {}
+        self.surfaces = {}
+        self.buildings = {}
+        self.interactables = {}
+
+    def index(self, x, y):
+        return x * self.height + y
+
+    def objects_at(self, index):
+        ''' Objects on the tile at this index, without creating an empty list for it '''
+        return self.objects.get(index, ())
+
+
+class Tile(object):
+    #a tile of the map and its properties. Everything is stored in the map's TileGrid - see above
+    __slots__ = ('grid', 'index', 'chunk')
+
+    height = grid_field('heights')
+    char = grid_field('chars')
+    ## Noise for shading/texturing the map...
+    noise = grid_field('noises', none_value=float('nan'))
+
+    color = grid_color('colors')
+    shadow_color = grid_color('shadow_colors')
+    char_color = grid_color('char_colors')
+    shadow_char_color = grid_color('shadow_char_colors')
+
+    blocks_mov = grid_flag('blocks_mov', version='passability_version')
+    blocks_vis = grid_flag('blocks_vis')
+    explored = grid_flag('explored')
+    shaded = grid_flag('shaded')
+    tmp_flag = grid_flag('tmp_flag')
+
+    #All tiles start as earth
+    zone = sparse_field('zones')
+    surface = sparse_field('surfaces', default='ground')
+    building = sparse_field('buildings')
+    # Info regarding interaction
+    interactable = sparse_field('interactables', default=0)
+
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.index = index
+        self.chunk = None
+
+    @property
+    def objects(self):
+        ''' Objects on the current map tile - the list is only created the first time it's needed '''
+        objects = self.grid.objects.get(self.index)
+        if objects is None:
+            objects = self.grid.objects[self.index] = []
+        return objects
 
     def set_height(self, height):
         self.height = height
@@ -162,8 +209,12 @@ class Wmap(Map):
 
         # Key:Value pair, where keys = faction and value = set of all members of that faction on the map
         self.factions_on_map = {}
+        # Factions whose members moved or changed state since their dmap was last updated
+        self.dirty_dmap_factions = set()
 
         self.dijmaps = {}
+        # The tile_grid passability_version the dmaps were last brought up to date with
+        self.dmap_passability_version = 0
 
         ## Pathfinding map and binary fov recompute toggle
         self.fov_map = libtcod.map_new(self.width, self.height)
@@ -211,15 +262,28 @@ class Wmap(Map):
             if figure.local_brain:
                 figure.local_brain.set_enemy_perceptions_from_cached_factions()
 
+        # The initial dmaps include idle members, so make sure the first update filters them out
+        self.dirty_dmap_factions = set(self.factions_on_map.keys())
+
         return self.factions_on_map
 
+    def flag_dmap_dirty(self, obj):
+        ''' Called when a creature moves or changes state, so its faction's dmap gets updated next tick '''
+        if obj.creature and obj.creature.faction in self.factions_on_map:
+            self.dirty_dmap_factions.add(obj.creature.faction)
 
     def update_dmaps(self):
         #jobs = []
         #def stupid_function(target_nodes):
         #    self.dijmaps[faction.faction_name].update_map(target_nodes)
 
-        for faction, member_set in self.factions_on_map.iteritems():
+        # Tiles which changed blocks_mov since the last update leave every dmap's passability out of date
+        if self.tile_grid.passability_version != self.dmap_passability_version:
+            self.refresh_dmap_passability()
+
+        # Only factions which have changed need updating - the dmap itself will only repair what changed
+        for faction in self.dirty_dmap_factions:
+            member_set = self.factions_on_map[faction]
             target_nodes = [(obj.x, obj.y) for obj in member_set if obj.creature.status == 'alive' and (obj == g.player or (obj != g.player and obj.local_brain.ai_state != 'idle'))]
             self.dijmaps[faction.name].update_map(target_nodes=target_nodes)
             #update_map_test(self.dijmaps[faction.faction_name], target_nodes)
@@ -233,7 +297,16 @@ class Wmap(Map):
             #j.start()
             #j.join()
 
+        self.dirty_dmap_factions = set()
+
+
+
+    def refresh_dmap_passability(self):
+        ''' Re-read which tiles block movement into every dmap, and refill them from their current targets '''
+        for dijmap in self.dijmaps.itervalues():
+            dijmap.refresh_passability()
 
+        self.dmap_passability_version = self.tile_grid.passability_version
 
     def set_initial_dmaps(self):
         ''' A few dijmaps will be universal to all maps '''
@@ -242,7 +315,7 @@ class Wmap(Map):
     def add_dmap(self, key, target_nodes, dmrange):
         ''' Add additional dmaps as needed '''
         begin = time.time()
-        self.dijmaps[key] = Dijmap(sourcemap=self, target_nodes=target_nodes, dmrange=dmrange)
+        self.dijmaps[key] = create_dijmap(sourcemap=self, target_nodes=target_nodes, dmrange=dmrange)
         end = time.time() - begin
 
         #g.game.add_message('Dmap for %s created in %.2f seconds' %(key, end), libtcod.cyan)
@@ -250,20 +323,22 @@ class Wmap(Map):
 
     def tile_blocks_mov(self, x, y):
         ''' Check whether a map tile is impassable '''
-        if self.tiles[x][y].blocks_mov:
+        index = x * self.height + y
+        if self.tile_grid.blocks_mov[index]:
             return 1
         else:
-            for obj in self.tiles[x][y].objects:
+            for obj in self.tile_grid.objects_at(index):
                 if obj.blocks_mov:
                     return 1
             return 0
 
     def tile_blocks_sight(self, x, y):
         ''' Check whether a map tile is impassable '''
-        if self.tiles[x][y].blocks_vis:
+        index = x * self.height + y
+        if self.tile_grid.blocks_vis[index]:
             return 1
         else:
-            for obj in self.tiles[x][y].objects:
+            for obj in self.tile_grid.objects_at(index):
                 if obj.blocks_vis:
                     return 1
             return 0
@@ -331,8 +406,7 @@ class Wmap(Map):
             r1oy = roll(30, self.height-31)
             r2oy = roll(30, self.height-31)
 
-            ### TODO -- X AND Y ARE FLIPPED AND I HAVE NO IDEA WHY
-            libtcod.heightmap_dig_bezier(hm=hm, px=(r1y, r1oy, r2oy, r2y), py=(r1x, r1ox, r2ox, r2x), startRadius=5, startDepth=0, endRadius=5, endDepth=0)
+            libtcod.heightmap_dig_bezier(hm=hm, px=(r1x, r1ox, r2ox, r2x), py=(r1y, r1oy, r2oy, r2y), startRadius=5, startDepth=0, endRadius=5, endDepth=0)
             #g.game.add_message('height is %i'%libtcod.heightmap_get_value(hm, r1x, r1y), libtcod.red)
         ######################################################################
 
@@ -362,44 +436,50 @@ class Wmap(Map):
 
 
     def create_map_tiles(self, hm, base_color, explored):
-        self.tiles = []
+        self.tile_grid = grid = TileGrid(width=self.width, height=self.height)
+        self.tiles = [[Tile(grid=grid, index=grid.index(x, y)) for y in xrange(self.height)] for x in xrange(self.width)]
+
+        if not explored:
+            grid.explored = bytearray(self.width * self.height)
 
         noisemap = libtcod.noise_new(2, libtcod.NOISE_DEFAULT_HURST, libtcod.NOISE_DEFAULT_LACUNARITY)
         octaves = 10
         div_amt = 50
+        scale = 8
 
-        # Loop through everything and create tiles
+        # Interp colors for smoother colorizing
+        shore_color = libtcod.color_lerp(libtcod.dark_sepia, base_color, .25)
+
+        ## Fill the grid's arrays directly - this is the same as calling set_height(), set_noise(), colorize() and make_water() on each tile
         for y in xrange(self.height):
-            # Make an empty list of tile rows
-            row = []
             for x in xrange(self.width):
+                index = x * self.height + y
                 # Anything outside this range will be unwalkable
-                if (0 < x < self.width - 1) and (0 < y < self.height - 1):      tile = Tile(blocks_mov=False)
-                else:                                                           tile = Tile(blocks_mov=True, blocks_vis=True)
-
-                tile.explored = explored
+                if not ((0 < x < self.width - 1) and (0 < y < self.height - 1)):
+                    grid.blocks_mov[index] = 1
+                    grid.blocks_vis[index] = 1
 
-                tile.set_height(int(libtcod.heightmap_get_value(hm=hm, x=x, y=y)))
+                height = int(libtcod.heightmap_get_value(hm=hm, x=x, y=y))
+                grid.heights[index] = height
                 # Noise to map color
                 noise_mod = libtcod.noise_get_fbm(noisemap, (x / div_amt, y / div_amt), octaves, libtcod.NOISE_SIMPLEX)
-                tile.set_noise(noise_mod)
-                tile.colorize(color=base_color)
+                grid.noises[index] = noise_mod
+                ncolor = int((noise_mod + 1) * scale)
 
                 # Sand/silt/dirt around water
-                if tile.height < 101:
-                    tile.colorize(color=libtcod.dark_sepia)
-                # Interp colors for smoother colorizing
-                elif tile.height < 102:
-                    tile.colorize(color=libtcod.color_lerp(libtcod.dark_sepia, base_color, .25))
-                # Water
-                if tile.height < g.WATER_HEIGHT:
-                    tile.make_water()
+                if height < 101:        color = libtcod.dark_sepia + libtcod.Color(ncolor, ncolor, ncolor)
+                elif height < 102:      color = shore_color + libtcod.Color(ncolor, ncolor, ncolor)
+                else:                   color = base_color + libtcod.Color(ncolor, ncolor, ncolor)
 
-                # Add the tile to the row
-                row.append(tile)
+                # Water
+                if height < g.WATER_HEIGHT:
+                    grid.blocks_mov[index] = 1
+                    grid.blocks_vis[index] = 0
+                    grid.surfaces[index] = 'water'
+                    color = libtcod.color_lerp(color, libtcod.dark_blue, .5)
 
-            # Finally, add the row to the map
-            self.tiles.append(row)
+                grid.colors[index] = pack_color(color)
+                grid.shadow_colors[index] = pack_color(color * .85)
 
         self.setup_chunks(chunk_size=10, map_type='human')
 
@@ -459,6 +539,7 @@ class Wmap(Map):
         if obj.creature and not obj in self.creatures:
             self.creatures.append(obj)
             obj.creature.next_tick = self.world.time_cycle.current_tick + 1
+            self.flag_dmap_dirty(obj)
         ## DEBUG - If not, log it
         elif obj in self.creatures:
             logging.warning('Creature duplication -- {0} was already in map.creatures'.format(obj.fulltitle()) )
@@ -644,9 +725,11 @@ class Wmap(Map):
 
     def initialize_fov(self):
         #create the FOV map, according to the generated map
-        for y in xrange(self.width):
-            for x in xrange(self.height):
-                libtcod.map_set_properties(self.fov_map, x, y, not self.tiles[x][y].blocks_vis, not self.tiles[x][y].blocks_mov)
+        blocks_mov, blocks_vis = self.tile_grid.blocks_mov, self.tile_grid.blocks_vis
+        for x in xrange(self.width):
+            for y in xrange(self.height):
+                index = x * self.height + y
+                libtcod.map_set_properties(self.fov_map, x, y, not blocks_vis[index], not blocks_mov[index])
 
         for obj in self.objects + self.creatures:
             libtcod.map_set_properties(self.fov_map, obj.x, obj.y, not obj.blocks_vis, not obj.blocks_mov)
@@ -661,24 +744,28 @@ class Wmap(Map):
         libtcod.map_compute_fov(self.fov_map, g.player.x, g.player.y, g.player.creature.alert_sight_radius, g.FOV_LIGHT_WALLS, g.FOV_ALGO)
         g.game.interface.map_console.clear()
 
+        grid = self.tile_grid
+        explored = grid.explored
+
         # NORMAL RENDERING
         if not debug_active_unit_dijmap:
             # Go through all tiles, and set their background color according to the FOV
             for x, y, mx, my in g.game.camera.get_xy_for_rendering():
+                index = mx * self.height + my
                 if libtcod.map_is_in_fov(self.fov_map, mx, my): # If the tile is visible
-                    g.game.render_handler.render_tile(g.game.interface.map_console.con, x, y, self.tiles[mx][my].char, self.tiles[mx][my].char_color, self.tiles[mx][my].color)
+                    g.game.render_handler.render_tile(g.game.interface.map_console.con, x, y, grid.chars[index], unpack_color(grid.char_colors[index]), unpack_color(grid.colors[index]))
                     #since it's visible, explore it
-                    self.tiles[mx][my].explored = True
+                    explored[index] = 1
 
                 # If not visible, but explored
-                elif self.tiles[mx][my].explored:
-                    g.game.render_handler.render_tile(g.game.interface.map_console.con, x, y, self.tiles[mx][my].char, self.tiles[mx][my].shadow_char_color, self.tiles[mx][my].shadow_color)
+                elif explored[index]:
+                    g.game.render_handler.render_tile(g.game.interface.map_console.con, x, y, grid.chars[index], unpack_color(grid.shadow_char_colors[index]), unpack_color(grid.shadow_colors[index]))
 
 
         ## UNOPTIMIZED DIJMAP RENDERING
         elif debug_active_unit_dijmap:
             for x, y, mx, my in g.game.camera.get_xy_for_rendering():
-                if not self.tiles[mx][my].blocks_mov:
+                if not grid.blocks_mov[mx * self.height + my]:
                     intensity = 0
                     # Sum all desires for this square, weighted by intensity
                     for desire, value in g.game.render_handler.debug_active_unit_dijmap.creature.dijmap_desires.iteritems():
@@ -696,15 +783,15 @@ class Wmap(Map):
 
         #draw all objects in the list, except the g.player.
         for obj in self.objects:
-            if self.tiles[obj.x][obj.y].explored:
+            if explored[obj.x * self.height + obj.y]:
                 obj.draw()
 
         for creature in self.creatures:
-            if self.tiles[creature.x][creature.y].explored:
+            if explored[creature.x * self.height + creature.y]:
                 creature.draw()
 
         for sapient in self.creatures:
-            if self.tiles[sapient.x][sapient.y].explored and sapient != g.player:
+            if explored[sapient.x * self.height + sapient.y] and sapient != g.player:
                 sapient.draw()
         g.player.draw()
 
@@ -905,56 +992,74 @@ class Wmap(Map):
         ''' General method for running cellular automata. Takes a configuration dict which contains info
         about intitial seed chances, iterations, criteria for converting floor to wall, etc '''
 
+        # Same walls from the same rolls, just computed on whole rows at a time
+        if cellular_automata.is_enabled():
+            seed_time, smooth_time = cellular_automata.run_cellular_automata(wmap=self, cfg=cfg)
+            g.game.add_message('Seed cell automata: %.2f' %seed_time)
+            g.game.add_message('Iterate cell automata: %.2f' %smooth_time)
+            return
+
         begin = time.time()
+        grid = self.tile_grid
+        height = self.height
+        blocks_mov, blocks_vis, heights = grid.blocks_mov, grid.blocks_vis, grid.heights
+
+        ## Only untouched ground is changed by the automata
+        can_change = bytearray('\x01') * (self.width * height)
+        for index, zone in grid.zones.iteritems():
+            if zone not in (None, 'wilderness'):
+                can_change[index] = 0
+        # Surfaces are only stored for tiles which aren't 'ground'
+        for index in grid.surfaces:
+            can_change[index] = 0
+
         ## Map borders
         wborder = self.width - 1 - cfg['map_pad']
         hborder = self.height - 1 - cfg['map_pad']
+        map_pad_type = 1 if cfg['map_pad_type'] else 0
 
         for x in xrange(self.width):
             for y in xrange(self.height):
+                index = x * height + y
                 # Configuration can choose a certain "padding" of a certain cell type for the map edge
                 if (cfg['map_pad'] < x < wborder) and (cfg['map_pad'] < y < hborder):
                     # If it meets the padding criteria, seed the cells
-                    if self.tiles[x][y].height > g.WATER_HEIGHT and (roll(1, 1000) <= cfg['initial_blocks_mov_chance'] or self.tiles[x][y].height > cfg['blocks_mov_height']) \
-                        and self.tiles[x][y].zone in (None, 'wilderness') and self.tiles[x][y].surface == 'ground':
-
-                        self.tiles[x][y].blocks_vis = 1
-                        self.tiles[x][y].blocks_mov = 1
-                    elif self.tiles[x][y].zone in (None, 'wilderness') and self.tiles[x][y].surface == 'ground':
-                        self.tiles[x][y].blocks_vis = 0
-                        self.tiles[x][y].blocks_mov = 0
+                    if heights[index] > g.WATER_HEIGHT and (roll(1, 1000) <= cfg['initial_blocks_mov_chance'] or heights[index] > cfg['blocks_mov_height']) \
+                        and can_change[index]:
+
+                        blocks_vis[index] = blocks_mov[index] = 1
+                    elif can_change[index]:
+                        blocks_vis[index] = blocks_mov[index] = 0
                 # If it doesn't meet the padding criteria, fill the cell with the padded cell type
                 else:
-                    self.tiles[x][y].blocks_vis = cfg['map_pad_type']
-                    self.tiles[x][y].blocks_mov = cfg['map_pad_type']
+                    blocks_vis[index] = blocks_mov[index] = map_pad_type
 
         g.game.add_message('Seed cell automata: %.2f' %(time.time() - begin))
         begin = time.time()
+        # Flat index offsets of the moore neighborhood
+        n1, n2, n3 = -height - 1, -height, -height + 1
+        n4, n5 = -1, 1
+        n6, n7, n8 = height - 1, height, height + 1
         # Smoothing happens here
         for r in xrange(cfg['repetitions']):
             # Run throught entire map
             for y in xrange(self.height):
                 for x in xrange(self.width):
-                    if self.tiles[x][y].zone in (None, 'wilderness') and self.tiles[x][y].surface == 'ground':
-                        walls = 0
-                        floors = 0
-
-                        # Tally number of walls and floors in moore neighborhood
-                        for (xx, yy) in get_border_tiles_8(x, y):
-                            if self.is_val_xy((xx, yy)):
-                                if self.tiles[xx][yy].blocks_vis:
-                                    walls += 1
-                                else:
-                                    floors += 1
+                    index = x * height + y
+                    if can_change[index]:
+                        # Tally number of walls in moore neighborhood. Tiles away from the map edge don't need their neighbors' bounds checked
+                        if 1 < x < self.width - 1 and 1 < y < height - 1:
+                            walls = blocks_vis[index + n1] + blocks_vis[index + n2] + blocks_vis[index + n3] + blocks_vis[index + n4] + \
+                                    blocks_vis[index + n5] + blocks_vis[index + n6] + blocks_vis[index + n7] + blocks_vis[index + n8]
+                        else:
+                            walls = sum(blocks_vis[xx * height + yy] for (xx, yy) in get_border_tiles_8(x, y) if self.is_val_xy((xx, yy)))
 
                         # Based off of the tallies above, create walls/floors
                         if walls <= cfg['walls_to_floor']:
-                            self.tiles[x][y].blocks_mov = False
-                            self.tiles[x][y].blocks_vis = False
+                            blocks_vis[index] = blocks_mov[index] = 0
 
                         elif walls >= cfg['walls_to_wall']:
-                            self.tiles[x][y].blocks_mov = True
-                            self.tiles[x][y].blocks_vis = True
+                            blocks_vis[index] = blocks_mov[index] = 1
 
         g.game.add_message('Iterate cell automata: %.2f' %(time.time() - begin))
 